@@ -1,33 +1,117 @@
-from fastapi import APIRouter, Depends, Query, HTTPException
+from fastapi import APIRouter, Depends, Query, HTTPException, Request
 from sqlalchemy.orm import Session
-from datetime import datetime
+from datetime import date, datetime
+from typing import Optional
+from pydantic import TypeAdapter
 from app.database import get_db
+from app.schemas import CabIdleTime, CityDemand, DemandHeatmap, TripDurationQuantiles, UtilizationSeries
 from app.services.analytics_service import AnalyticsService
+from app.utils.http_cache import cached_json_response
+from app.utils.ttl_cache import analytics_cache
 
 
 router = APIRouter(prefix="/analytics", tags=["Analytics"])
 
+# Serializes like `response_model=dict` did before responses were cached: a timedelta is an
+# ISO 8601 duration (e.g. "PT2H0.5S"), not the float seconds of `jsonable_encoder`
+_dict_adapter = TypeAdapter(dict)
+
 
 @router.get("/cab_idle_time/{cab_id}", response_model=dict)
 def get_cab_idle_time(
         cab_id: int,
+        request: Request,
         start_time: datetime = Query(..., description="Start time in ISO format (YYYY-MM-DDTHH:MM:SS)"),
         end_time: datetime = Query(..., description="End time in ISO format (YYYY-MM-DDTHH:MM:SS)"),
         db: Session = Depends(get_db)
 ):
-    """Gets total idle time of a cab within a given duration."""
+    """Gets total idle time of a cab within a given duration (cached, with ETag/Cache-Control)."""
     if start_time >= end_time:
         raise HTTPException(status_code=400, detail="Start time must be before end time")
 
     idle_time = AnalyticsService.get_cab_idle_time(db, cab_id, start_time, end_time)
-    return {"idle_time": idle_time}
+    content = _dict_adapter.dump_python({"idle_time": idle_time}, mode="json")
+    return cached_json_response(request, content, analytics_cache.ttl_seconds)
+
+
+@router.get("/idle_time", response_model=list[CabIdleTime])
+def get_fleet_idle_time(
+        request: Request,
+        city_id: int = Query(..., description="Cabs currently in this city"),
+        start: datetime = Query(..., description="Start time in ISO format (YYYY-MM-DDTHH:MM:SS)"),
+        end: datetime = Query(..., description="End time in ISO format (YYYY-MM-DDTHH:MM:SS)"),
+        order: str = Query("most", pattern="^(most|least)$", description="Most or least idle first"),
+        limit: Optional[int] = Query(None, ge=1, description="Only the top N cabs"),
+        db: Session = Depends(get_db)
+):
+    """Gets the idle time of every cab in a city within a given duration, computed in one query (cached)."""
+    if start >= end:
+        raise HTTPException(status_code=400, detail="Start time must be before end time")
+
+    idle_times = AnalyticsService.get_fleet_idle_times(db, city_id, start, end, order, limit)
+    return cached_json_response(request, idle_times, analytics_cache.ttl_seconds)
+
+
+@router.get("/utilization", response_model=UtilizationSeries)
+def get_utilization(
+        city_id: int = Query(..., description="Cabs currently in this city"),
+        start: datetime = Query(..., description="Start time in ISO format (YYYY-MM-DDTHH:MM:SS)"),
+        end: datetime = Query(..., description="End time in ISO format (YYYY-MM-DDTHH:MM:SS)"),
+        bucket: int = Query(60, ge=1, description="Bucket length in seconds"),
+        db: Session = Depends(get_db)
+):
+    """Gets how many cabs of a city were in each state, per time bucket, from one sweep over their state changes."""
+    if start >= end:
+        raise HTTPException(status_code=400, detail="Start time must be before end time")
+
+    return AnalyticsService.get_utilization(db, city_id, start, end, bucket)
+
+
+@router.get("/top_cities", response_model=list[CityDemand])
+def get_top_cities(
+        window: str = Query("1h", pattern="^(15m|1h|24h)$", description="Sliding window: 15m, 1h or 24h"),
+        k: int = Query(10, ge=1, le=1000, description="Number of cities"),
+):
+    """Finds the cities with the most bookings in a recent window, served from in-memory counters."""
+    return AnalyticsService.get_top_cities(window, k)
+
+
+@router.get("/demand_heatmap", response_model=DemandHeatmap)
+def get_demand_heatmap(
+        request: Request,
+        start_date: Optional[date] = Query(None, description="First day (YYYY-MM-DD, UTC) of the range"),
+        end_date: Optional[date] = Query(None, description="Last day (YYYY-MM-DD, UTC) of the range"),
+        db: Session = Depends(get_db)
+):
+    """Gets bookings per city and UTC hour of the week as a dense matrix (cached, with ETag/Cache-Control)."""
+    if start_date and end_date and start_date > end_date:
+        raise HTTPException(status_code=400, detail="Start date must not be after end date")
+
+    heatmap = AnalyticsService.get_demand_heatmap(db, start_date, end_date)
+    return cached_json_response(request, heatmap, analytics_cache.ttl_seconds)
+
+
+@router.get("/trip_duration/{city_id}", response_model=TripDurationQuantiles)
+def get_trip_duration(city_id: int, db: Session = Depends(get_db)):
+    """Gets trip duration percentiles of a city (exact for small cities, otherwise from a quantile sketch)."""
+    return AnalyticsService.get_trip_duration_quantiles(db, city_id)
 
 
 @router.get("/peak_demand/{city_id}", response_model=dict)
-def get_peak_demand_hours(city_id: int, db: Session = Depends(get_db)):
-    """Finds peak demand hours in a city."""
-    peak_hours = AnalyticsService.get_peak_demand_hours(db, city_id)
+def get_peak_demand_hours(
+        city_id: int,
+        request: Request,
+        start_date: Optional[date] = Query(None, description="First day (YYYY-MM-DD) of the range, in `timezone`"),
+        end_date: Optional[date] = Query(None, description="Last day (YYYY-MM-DD) of the range, in `timezone`"),
+        timezone: str = Query("UTC", description="IANA time zone for days and hours, e.g. Asia/Kolkata"),
+        db: Session = Depends(get_db)
+):
+    """Finds peak demand hours in a city (cached, with ETag/Cache-Control)."""
+    if start_date and end_date and start_date > end_date:
+        raise HTTPException(status_code=400, detail="Start date must not be after end date")
+
+    peak_hours = AnalyticsService.get_peak_demand_hours(db, city_id, start_date, end_date, timezone)
     if peak_hours is None:
         raise HTTPException(status_code=404, detail="No booking data available for this city")
 
-    return {"peak_hours": peak_hours}
+    return cached_json_response(request, {"peak_hours": peak_hours}, analytics_cache.ttl_seconds)
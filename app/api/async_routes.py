@@ -0,0 +1,193 @@
+"""
+AsyncSession variants of the city, cab and booking hot-path endpoints.
+
+They are served instead of their sync counterparts when ``DB_MODE=async``; endpoints
+without an async variant keep running on the sync routers.
+"""
+import asyncio
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import IntegrityError
+from app.config import config
+from app.database import get_async_db
+from app.schemas import CityCreate, CityResponse, CabCreate, CabResponse, CabHistoryResponse, BookingResponse
+from app.services.async_city_service import AsyncCityService
+from app.services.async_cab_service import AsyncCabService
+from app.services.async_booking_service import AsyncBookingService
+from app.services.booking_dispatcher import booking_dispatcher
+from app.services.cab_service import CabService
+from app.services.city_service import CityService
+from app.state_machine import CabState
+from app.utils.cursor import NEXT_CURSOR_HEADER
+from app.utils.streaming import NDJSON_MEDIA_TYPE
+
+
+city_router = APIRouter(prefix="/cities", tags=["Cities"])
+cab_router = APIRouter(prefix="/cabs", tags=["Cabs"])
+booking_router = APIRouter(prefix="/bookings", tags=["Bookings"])
+
+
+@city_router.post("/", response_model=CityResponse, status_code=status.HTTP_201_CREATED)
+async def register_city(city_data: CityCreate, db: AsyncSession = Depends(get_async_db)):
+    """Registers a new city, handling duplicate city errors."""
+    try:
+        city = await AsyncCityService.register_city(db, city_data)
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="City with this name already exists."
+        )
+    if not city:
+        raise HTTPException(status_code=500, detail="Failed to register city.")
+    return city
+
+
+@city_router.get("/", response_model=list[CityResponse])
+async def get_all_cities(
+        response: Response,
+        cursor: Optional[str] = Query(None, description="`X-Next-Cursor` header of the previous page"),
+        limit: Optional[int] = Query(None, ge=1, le=1000, description="Page size; omit to list every city"),
+        stream: bool = Query(False, description="Stream every city as NDJSON"),
+        db: AsyncSession = Depends(get_async_db)
+):
+    """Retrieves all registered cities; pages and streams are served by the sync listing code."""
+    if stream:
+        return StreamingResponse(CityService.stream_cities(), media_type=NDJSON_MEDIA_TYPE)
+    if cursor is None and limit is None:
+        return await AsyncCityService.get_all_cities(db)
+
+    cities, next_cursor = await db.run_sync(lambda session: CityService.get_cities_page(session, cursor, limit))
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return cities
+
+
+@city_router.get("/{city_id}", response_model=CityResponse)
+async def get_city_by_id(city_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Fetches a city by its ID."""
+    city = await AsyncCityService.get_city_by_id(db, city_id)
+    if not city:
+        raise HTTPException(status_code=404, detail="City not found")
+    return city
+
+
+@city_router.put("/{city_id}", response_model=CityResponse)
+async def update_city(city_id: int, updated_data: CityCreate, db: AsyncSession = Depends(get_async_db)):
+    """Updates city details."""
+    updated_city = await AsyncCityService.update_city(db, city_id, updated_data.model_dump())
+    if not updated_city:
+        raise HTTPException(status_code=404, detail="City not found")
+    return updated_city
+
+
+@city_router.delete("/{city_id}", response_model=dict)
+async def delete_city(city_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Deletes a city by ID."""
+    deleted = await AsyncCityService.delete_city(db, city_id)
+    if not deleted:
+        raise HTTPException(status_code=404, detail="City not found")
+    return {"message": "City deleted successfully"}
+
+
+@cab_router.post("/", response_model=CabResponse, status_code=status.HTTP_201_CREATED)
+async def register_cab(cab_data: CabCreate, db: AsyncSession = Depends(get_async_db)):
+    """Registers a new cab."""
+    return await AsyncCabService.register_cab(db, cab_data)
+
+
+@cab_router.put("/{cab_id}/location/{city_id}", response_model=CabResponse)
+async def update_cab_location(cab_id: int, city_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Updates a cab's city location."""
+    return await AsyncCabService.change_cab_location(db, cab_id, city_id)
+
+
+@cab_router.put("/{cab_id}/state/{new_state}", response_model=CabResponse)
+async def update_cab_state(
+        cab_id: int,
+        new_state: CabState,
+        expected_version: Optional[int] = Query(None, description="Fail with 409 unless the cab is at this version"),
+        db: AsyncSession = Depends(get_async_db)
+):
+    """Updates a cab's state (Idle, On Trip, etc.); disallowed transitions return 409."""
+    return await AsyncCabService.update_cab_state(db, cab_id, new_state.value, expected_version)
+
+
+@cab_router.get("/available/{city_id}", response_model=list[CabResponse])
+async def get_available_cabs(
+        city_id: int,
+        response: Response,
+        cursor: Optional[str] = Query(None, description="`X-Next-Cursor` header of the previous page"),
+        limit: Optional[int] = Query(None, ge=1, le=1000, description="Page size; omit to list every cab"),
+        stream: bool = Query(False, description="Stream every available cab as NDJSON"),
+        db: AsyncSession = Depends(get_async_db)
+):
+    """Fetches available cabs in a city; pages and streams are served by the sync listing code."""
+    if stream:
+        return StreamingResponse(CabService.stream_available_cabs(city_id), media_type=NDJSON_MEDIA_TYPE)
+    if cursor is None and limit is None:
+        return await AsyncCabService.get_available_cabs(db, city_id)
+
+    cabs, next_cursor = await db.run_sync(
+        lambda session: CabService.get_available_cabs_page(session, city_id, cursor, limit)
+    )
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return cabs
+
+
+@cab_router.get("/{cab_id}/history", response_model=list[CabHistoryResponse])
+async def get_cab_history(
+        cab_id: int,
+        response: Response,
+        since: Optional[datetime] = Query(None, description="Only changes at or after this time"),
+        until: Optional[datetime] = Query(None, description="Only changes at or before this time"),
+        cursor: Optional[str] = Query(None, description="`X-Next-Cursor` header of the previous page"),
+        limit: Optional[int] = Query(None, ge=1, le=1000, description="Page size; omit to list every change"),
+        stream: bool = Query(False, description="Stream every matching change as NDJSON"),
+        db: AsyncSession = Depends(get_async_db)
+):
+    """Fetches the history of state changes for a cab; pages and streams are served by the sync listing code."""
+    if stream:
+        return StreamingResponse(CabService.stream_cab_history(cab_id, since, until), media_type=NDJSON_MEDIA_TYPE)
+    if since is None and until is None and cursor is None and limit is None:
+        return await AsyncCabService.get_cab_history(db, cab_id)
+
+    history, next_cursor = await db.run_sync(
+        lambda session: CabService.get_cab_history_page(session, cab_id, since, until, cursor, limit)
+    )
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return history
+
+
+@booking_router.post("/{city_id}")
+async def book_cab(city_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Books an available cab in the given city."""
+    if config.BOOKING_DISPATCHER_ENABLED:
+        # The dispatcher's workers use sync sessions; the event loop only awaits the result
+        booking = await asyncio.wrap_future(booking_dispatcher.submit(city_id))
+        if not booking:
+            raise HTTPException(status_code=404, detail="No available cabs in this city")
+    else:
+        booking = await AsyncBookingService.book_cab(db, city_id)
+    return {"message": "Cab booked successfully", "booking_id": booking.id, "cab_id": booking.cab_id}
+
+
+@booking_router.get("/{booking_id}", response_model=BookingResponse)
+async def get_booking_by_id(booking_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Fetches a booking by its ID."""
+    booking = await AsyncBookingService.get_booking_by_id(db, booking_id)
+    if not booking:
+        raise HTTPException(status_code=404, detail="Booking not found")
+    return booking
+
+
+@booking_router.post("/{booking_id}/complete", response_model=dict)
+async def complete_booking(booking_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Marks a booking as completed by updating the drop time and setting the cab as IDLE."""
+    booking = await AsyncBookingService.complete_booking(db, booking_id)
+    return {"message": "Booking completed successfully", "booking_id": booking.id}
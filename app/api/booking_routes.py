@@ -1,25 +1,68 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
+from typing import Optional
+from app.config import config
 from app.database import get_db
 from app.services.booking_service import BookingService
-from app.schemas import BookingResponse
+from app.services.booking_dispatcher import booking_dispatcher
+from app.utils.cursor import NEXT_CURSOR_HEADER
+from app.schemas import BookingResponse, BatchBookingItem, BatchBookingResult, BulkCompleteRequest, BulkCompleteResult
 
 
 router = APIRouter(prefix="/bookings", tags=["Bookings"])
 
 
+@router.post("/batch", response_model=list[BatchBookingResult])
+def book_cabs_batch(items: list[BatchBookingItem], db: Session = Depends(get_db)):
+    """
+    Books cabs for a batch of `{city_id, count}` requests.
+    Each item reports its own bookings; cities without enough cabs fail individually.
+    """
+    return BookingService.book_batch(db, items)
+
+
+@router.post("/complete", response_model=list[BulkCompleteResult])
+def complete_bookings(request: BulkCompleteRequest, db: Session = Depends(get_db)):
+    """
+    Completes many bookings at once.
+    Each id reports `completed`, `not_found` or `already_completed`.
+    """
+    return BookingService.complete_bookings(db, request.booking_ids)
+
+
 @router.post("/{city_id}")
 def book_cab(city_id: int, db: Session = Depends(get_db)):
     """
     Books an available cab in the given city.
     If no cabs are available, returns an error message.
     """
-    booking = BookingService.book_cab(db, city_id)
+    if config.BOOKING_DISPATCHER_ENABLED:
+        booking = booking_dispatcher.book(city_id)
+    else:
+        booking = BookingService.book_cab(db, city_id)
     if not booking:
         raise HTTPException(status_code=404, detail="No available cabs in this city")
     return {"message": "Cab booked successfully", "booking_id": booking.id, "cab_id": booking.cab_id}
 
 
+@router.get("/active", response_model=list[BookingResponse])
+def get_active_bookings(
+        response: Response,
+        city_id: Optional[int] = Query(None, description="Only bookings in this city"),
+        cursor: Optional[str] = Query(None, description="`X-Next-Cursor` header of the previous page"),
+        limit: int = Query(100, ge=1, le=1000),
+        db: Session = Depends(get_db)
+):
+    """
+    Lists in-flight bookings (not yet completed) with keyset pagination, ordered by id.
+    The next page's cursor is sent in the `X-Next-Cursor` header.
+    """
+    bookings, next_cursor = BookingService.get_active_bookings(db, city_id, cursor, limit)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return bookings
+
+
 @router.get("/{booking_id}", response_model=BookingResponse)
 def get_booking_by_id(booking_id: int, db: Session = Depends(get_db)):
     """Fetches a city by its ID."""
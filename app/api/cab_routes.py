@@ -1,9 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import io
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, Response, UploadFile, WebSocket, WebSocketDisconnect, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from app.database import get_db
-from app.schemas import CabCreate, CabResponse, CabHistoryResponse
+from app.schemas import CabCreate, CabResponse, CabHistoryResponse, CabImportReport, TelemetryReport
 from app.services.cab_service import CabService
+from app.services.cab_import_service import CabImportService
+from app.services.telemetry_service import TelemetryService
 from app.state_machine import CabState
+from app.utils.cursor import NEXT_CURSOR_HEADER
+from app.utils.streaming import NDJSON_MEDIA_TYPE
 
 router = APIRouter(prefix="/cabs", tags=["Cabs"])
 
@@ -14,6 +23,48 @@ def register_cab(cab_data: CabCreate, db: Session = Depends(get_db)):
     return CabService.register_cab(db, cab_data)
 
 
+@router.post("/import", response_model=CabImportReport)
+def import_cabs(
+        file: UploadFile = File(..., description="CSV (plate_number,current_city_id) or NDJSON file"),
+        format: Optional[str] = Query(None, pattern="^(csv|ndjson)$", description="Defaults to the file extension"),
+        db: Session = Depends(get_db)
+):
+    """
+    Bulk registers cabs from a CSV or NDJSON upload.
+    The file is parsed incrementally and inserted in batches; invalid rows are reported, not fatal.
+    """
+    file_format = format or CabImportService.detect_format(file.filename)
+    # Undecodable bytes raise, so they are reported as a row error (see `CabImportService.parse_rows`)
+    stream = io.TextIOWrapper(file.file, encoding="utf-8", errors="strict", newline="")
+    return CabImportService.import_cabs(db, stream, file_format)
+
+
+@router.post("/telemetry", response_model=TelemetryReport)
+async def ingest_telemetry(request: Request, db: Session = Depends(get_db)):
+    """
+    Applies a batch of NDJSON location/state events (`{"cab_id", "city_id", "state", "timestamp"}`).
+    Only the latest event per cab is applied.
+    """
+    events, invalid = TelemetryService.parse_ndjson(await request.body())
+    return await run_in_threadpool(TelemetryService.ingest, db, events, invalid)
+
+
+@router.websocket("/telemetry/ws")
+async def ingest_telemetry_stream(websocket: WebSocket, db: Session = Depends(get_db)):
+    """
+    Streams telemetry over a WebSocket: every text frame is an NDJSON batch and is
+    acknowledged with its `TelemetryReport`.
+    """
+    await websocket.accept()
+    try:
+        while True:
+            events, invalid = TelemetryService.parse_ndjson((await websocket.receive_text()).encode())
+            report = await run_in_threadpool(TelemetryService.ingest, db, events, invalid)
+            await websocket.send_json(report.model_dump())
+    except WebSocketDisconnect:
+        pass
+
+
 @router.put("/{cab_id}/location/{city_id}", response_model=CabResponse)
 def update_cab_location(cab_id: int, city_id: int, db: Session = Depends(get_db)):
     """Updates a cab's city location."""
@@ -24,22 +75,70 @@ def update_cab_location(cab_id: int, city_id: int, db: Session = Depends(get_db)
 
 
 @router.put("/{cab_id}/state/{new_state}", response_model=CabResponse)
-def update_cab_state(cab_id: int, new_state: CabState, db: Session = Depends(get_db)):
-    """Updates a cab's state (Idle, On Trip, etc.) using Enum choices."""
+def update_cab_state(
+        cab_id: int,
+        new_state: CabState,
+        expected_version: Optional[int] = Query(None, description="Fail with 409 unless the cab is at this version"),
+        db: Session = Depends(get_db)
+):
+    """
+    Updates a cab's state (Idle, On Trip, etc.) using Enum choices.
+    Transitions not allowed from the cab's current state return 409.
+    """
 
-    cab = CabService.update_cab_state(db, cab_id, new_state.value)
+    cab = CabService.update_cab_state(db, cab_id, new_state.value, expected_version)
     if not cab:
         raise HTTPException(status_code=404, detail="Cab not found")
     return cab
 
 
 @router.get("/available/{city_id}", response_model=list[CabResponse])
-def get_available_cabs(city_id: int, db: Session = Depends(get_db)):
-    """Fetches available cabs in a city."""
-    return CabService.get_available_cabs(db, city_id)
+def get_available_cabs(
+        city_id: int,
+        response: Response,
+        cursor: Optional[str] = Query(None, description="`X-Next-Cursor` header of the previous page"),
+        limit: Optional[int] = Query(None, ge=1, le=1000, description="Page size; omit to list every cab"),
+        stream: bool = Query(False, description="Stream every available cab as NDJSON"),
+        db: Session = Depends(get_db)
+):
+    """
+    Fetches available cabs in a city, longest idle first.
+    With `limit`/`cursor` one page is returned; the next page's cursor is sent in the
+    `X-Next-Cursor` header and an empty page is not an error.
+    """
+    if stream:
+        return StreamingResponse(CabService.stream_available_cabs(city_id), media_type=NDJSON_MEDIA_TYPE)
+    if cursor is None and limit is None:
+        return CabService.get_available_cabs(db, city_id)
+
+    cabs, next_cursor = CabService.get_available_cabs_page(db, city_id, cursor, limit)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return cabs
 
 
 @router.get("/{cab_id}/history", response_model=list[CabHistoryResponse])
-def get_cab_history(cab_id: int, db: Session = Depends(get_db)):
-    """Fetches the history of state changes for a cab."""
-    return CabService.get_cab_history(db, cab_id)
+def get_cab_history(
+        cab_id: int,
+        response: Response,
+        since: Optional[datetime] = Query(None, description="Only changes at or after this time"),
+        until: Optional[datetime] = Query(None, description="Only changes at or before this time"),
+        cursor: Optional[str] = Query(None, description="`X-Next-Cursor` header of the previous page"),
+        limit: Optional[int] = Query(None, ge=1, le=1000, description="Page size; omit to list every change"),
+        stream: bool = Query(False, description="Stream every matching change as NDJSON"),
+        db: Session = Depends(get_db)
+):
+    """
+    Fetches the history of state changes for a cab, latest first.
+    With `since`/`until`/`limit`/`cursor` one page is returned; the next page's cursor is sent
+    in the `X-Next-Cursor` header and an empty page is not an error.
+    """
+    if stream:
+        return StreamingResponse(CabService.stream_cab_history(cab_id, since, until), media_type=NDJSON_MEDIA_TYPE)
+    if since is None and until is None and cursor is None and limit is None:
+        return CabService.get_cab_history(db, cab_id)
+
+    history, next_cursor = CabService.get_cab_history_page(db, cab_id, since, until, cursor, limit)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return history
@@ -1,9 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
 from app.database import get_db
 from app.schemas import CityCreate, CityResponse
 from app.services.city_service import CityService
+from app.utils.cursor import NEXT_CURSOR_HEADER
+from app.utils.streaming import NDJSON_MEDIA_TYPE
 
 
 router = APIRouter(prefix="/cities", tags=["Cities"])
@@ -26,9 +30,27 @@ def register_city(city_data: CityCreate, db: Session = Depends(get_db)):
 
 
 @router.get("/", response_model=list[CityResponse])
-def get_all_cities(db: Session = Depends(get_db)):
-    """Retrieves all registered cities."""
-    return CityService.get_all_cities(db)
+def get_all_cities(
+        response: Response,
+        cursor: Optional[str] = Query(None, description="`X-Next-Cursor` header of the previous page"),
+        limit: Optional[int] = Query(None, ge=1, le=1000, description="Page size; omit to list every city"),
+        stream: bool = Query(False, description="Stream every city as NDJSON"),
+        db: Session = Depends(get_db)
+):
+    """
+    Retrieves all registered cities.
+    With `limit`/`cursor` one page is returned, ordered by id; the next page's cursor is sent
+    in the `X-Next-Cursor` header.
+    """
+    if stream:
+        return StreamingResponse(CityService.stream_cities(), media_type=NDJSON_MEDIA_TYPE)
+    if cursor is None and limit is None:
+        return CityService.get_all_cities(db)
+
+    cities, next_cursor = CityService.get_cities_page(db, cursor, limit)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return cities
 
 
 @router.get("/{city_id}", response_model=CityResponse)
@@ -0,0 +1,30 @@
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Query
+from fastapi.responses import StreamingResponse
+from app.services.export_service import EXPORT_MEDIA_TYPES, ExportService
+
+
+router = APIRouter(prefix="/export", tags=["Export"])
+
+
+@router.get("/{table}")
+def export_table(
+        table: str,
+        format: str = Query("ndjson", pattern="^(csv|ndjson)$", description="csv or ndjson"),
+        since: Optional[datetime] = Query(None, description="Only rows at or after this time (pickup_time / timestamp)"),
+        until: Optional[datetime] = Query(None, description="Only rows at or before this time"),
+        after_id: Optional[int] = Query(None, ge=0, description="Resume after this id (the last id received)"),
+        gzip: bool = Query(False, description="Gzip the file"),
+):
+    """
+    Streams every row of `bookings` or `cab_history` as CSV or NDJSON, in id order.
+    A resumed CSV export (`after_id`) has no header, so it can be appended to the partial file.
+    """
+    ExportService.validate_table(table)
+    filename = ExportService.filename(table, format, gzip)
+    return StreamingResponse(
+        ExportService.export(table, format, since, until, after_id, gzip),
+        media_type="application/gzip" if gzip else EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
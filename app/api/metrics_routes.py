@@ -0,0 +1,17 @@
+from fastapi import APIRouter
+from app.repositories.duration_sketches import duration_sketches
+from app.repositories.history_writer import history_writer
+from app.utils.ttl_cache import analytics_cache
+
+
+router = APIRouter(prefix="/metrics", tags=["Metrics"])
+
+
+@router.get("/", response_model=dict)
+def get_metrics():
+    """Returns in-process runtime metrics (history write-behind buffer, analytics cache, ...)."""
+    return {
+        "history_writer": history_writer.metrics(),
+        "analytics_cache": analytics_cache.metrics(),
+        "trip_duration_sketches": duration_sketches.metrics(),
+    }
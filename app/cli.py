@@ -0,0 +1,148 @@
+"""
+Command line tools for operating the cab management database.
+
+Usage:
+    python -m app.cli upgrade-schema
+    python -m app.cli import-cabs cabs.csv
+    python -m app.cli import-cabs cabs.ndjson --format ndjson
+    python -m app.cli archive-history --hot-months 3
+    python -m app.cli rebuild-hourly-demand
+    python -m app.cli rebuild-state-intervals
+    python -m app.cli rebuild-trip-duration-sketches
+    python -m app.cli export cab_history --format csv --gzip -o cab_history.csv.gz
+"""
+import argparse
+import sys
+from datetime import datetime
+from app.config import config
+from app.database import SessionLocal, engine
+from app.repositories.booking_repository import BookingRepository
+from app.repositories.duration_sketches import DurationSketches
+from app.repositories.history_partitions import HistoryPartitions
+from app.repositories.schema_upgrade import SchemaUpgrade
+from app.repositories.state_intervals import StateIntervals
+from app.repositories.export_repository import EXPORT_TABLES
+from app.services.cab_import_service import CabImportService
+from app.services.export_service import ExportService
+
+
+def upgrade_schema(args):
+    """Adds the columns and indexes introduced since the database was created."""
+    steps = SchemaUpgrade.upgrade(engine)
+    for step in steps:
+        print(f"Added {step}")
+    print(f"Schema up to date ({len(steps)} changes).")
+    return 0
+
+
+def import_cabs(args):
+    """Streams a CSV/NDJSON file of cabs into the database and prints the report."""
+    file_format = args.format or CabImportService.detect_format(args.file)
+    with open(args.file, encoding="utf-8", errors="strict", newline="") as stream, SessionLocal() as db:
+        report = CabImportService.import_cabs(db, stream, file_format)
+
+    for error in report.errors:
+        print(f"row {error.row}: {error.error}", file=sys.stderr)
+    print(f"Imported {report.imported} cabs, {report.failed} rows failed.")
+    return 1 if report.failed else 0
+
+
+def archive_history(args):
+    """Creates upcoming cab_history partitions, compacts closed months and archives cold ones."""
+    if not config.HISTORY_PARTITIONING:
+        print("HISTORY_PARTITIONING is not enabled.", file=sys.stderr)
+        return 1
+
+    with SessionLocal() as db:
+        HistoryPartitions.ensure_partitions(db)
+        compacted = HistoryPartitions.compact(db)
+        archived = HistoryPartitions.archive(db, args.archive_dir, args.hot_months)
+
+    for name, rows in compacted.items():
+        print(f"Compacted {rows} rows into {name}")
+    for name, rows in archived.items():
+        print(f"Archived {rows} rows from {name}")
+    return 0
+
+
+def rebuild_hourly_demand(args):
+    """Recomputes the hourly_demand rollup from all bookings (e.g. after upgrading an existing database)."""
+    with SessionLocal() as db:
+        rows = BookingRepository.rebuild_hourly_demand(db)
+    print(f"Rebuilt hourly_demand with {rows} rows.")
+    return 0
+
+
+def rebuild_state_intervals(args):
+    """Recomputes cab_state_intervals from cab_history (e.g. after upgrading an existing database)."""
+    with SessionLocal() as db:
+        rows = StateIntervals.rebuild(db)
+    print(f"Rebuilt cab_state_intervals with {rows} rows.")
+    return 0
+
+
+def rebuild_trip_duration_sketches(args):
+    """Recomputes every city's trip duration sketch from completed bookings."""
+    with SessionLocal() as db:
+        trips = DurationSketches.rebuild(db, config.TRIP_DURATION_SKETCH_ACCURACY)
+    print(f"Rebuilt trip duration sketches from {trips} trips.")
+    return 0
+
+
+def export(args):
+    """Streams a table as CSV/NDJSON to a file (appending when resuming) or to stdout."""
+    chunks = ExportService.export(args.table, args.format, args.since, args.until, args.after_id, args.gzip)
+    if args.output is None:
+        for chunk in chunks:
+            sys.stdout.buffer.write(chunk)
+        return 0
+
+    # Gzip members concatenate into one valid file, so a resumed export can be appended too
+    with open(args.output, "ab" if args.after_id is not None else "wb") as output_file:
+        for chunk in chunks:
+            output_file.write(chunk)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="Intercity cab management tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    parser_upgrade = commands.add_parser("upgrade-schema", help="Add columns and indexes missing from an older database")
+    parser_upgrade.set_defaults(handler=upgrade_schema)
+
+    parser_import = commands.add_parser("import-cabs", help="Bulk register cabs from a CSV or NDJSON file")
+    parser_import.add_argument("file", help="CSV with a plate_number,current_city_id header, or NDJSON")
+    parser_import.add_argument("--format", choices=["csv", "ndjson"], help="Defaults to the file extension")
+    parser_import.set_defaults(handler=import_cabs)
+
+    parser_archive = commands.add_parser("archive-history", help="Roll cab_history partitions and archive cold months")
+    parser_archive.add_argument("--hot-months", type=int, help="Months kept in the database (default: HISTORY_HOT_MONTHS)")
+    parser_archive.add_argument("--archive-dir", help="Archive directory (default: HISTORY_ARCHIVE_DIR)")
+    parser_archive.set_defaults(handler=archive_history)
+
+    parser_demand = commands.add_parser("rebuild-hourly-demand", help="Recompute the hourly demand rollup from bookings")
+    parser_demand.set_defaults(handler=rebuild_hourly_demand)
+
+    parser_intervals = commands.add_parser("rebuild-state-intervals", help="Recompute cab state intervals from history")
+    parser_intervals.set_defaults(handler=rebuild_state_intervals)
+
+    parser_sketches = commands.add_parser("rebuild-trip-duration-sketches", help="Recompute trip duration sketches from bookings")
+    parser_sketches.set_defaults(handler=rebuild_trip_duration_sketches)
+
+    parser_export = commands.add_parser("export", help="Stream bookings or cab history to CSV or NDJSON")
+    parser_export.add_argument("table", choices=list(EXPORT_TABLES))
+    parser_export.add_argument("--format", choices=["csv", "ndjson"], default="ndjson")
+    parser_export.add_argument("--since", type=datetime.fromisoformat, help="Only rows at or after this time")
+    parser_export.add_argument("--until", type=datetime.fromisoformat, help="Only rows at or before this time")
+    parser_export.add_argument("--after-id", type=int, help="Resume after this id, appending to --output")
+    parser_export.add_argument("--gzip", action="store_true", help="Gzip the output")
+    parser_export.add_argument("-o", "--output", help="Output file (default: stdout)")
+    parser_export.set_defaults(handler=export)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,6 +10,14 @@ class Config:
 
     # Database Configuration
     DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./cab_management.db")
+    # "sync" serves requests with blocking sessions; "async" uses AsyncSession (aiosqlite/asyncpg)
+    DB_MODE = os.getenv("DB_MODE", "sync").lower()
+    # Defaults to DATABASE_URL with the async driver swapped in
+    ASYNC_DATABASE_URL = os.getenv(
+        "ASYNC_DATABASE_URL",
+        DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1)
+        .replace("postgresql://", "postgresql+asyncpg://", 1)
+    )
 
     # App Settings
     APP_NAME = "Intercity Cab Management"
@@ -22,6 +30,77 @@ class Config:
     SECRET_KEY = os.getenv("SECRET_KEY", "your_secret_key")
     ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 60))
 
+    # Dispatch Settings
+    # Seconds after which a city's in-memory idle-cab index is reloaded from the database
+    DISPATCH_INDEX_REFRESH_SECONDS = float(os.getenv("DISPATCH_INDEX_REFRESH_SECONDS", 30))
+    # Seconds after which the in-memory city registry is reloaded (picks up other workers' changes)
+    CITY_REGISTRY_REFRESH_SECONDS = float(os.getenv("CITY_REGISTRY_REFRESH_SECONDS", 300))
+    # Retries when claiming a cab fails on lock contention
+    BOOKING_CLAIM_RETRIES = int(os.getenv("BOOKING_CLAIM_RETRIES", 3))
+    # Candidates a booking tries before giving up when concurrent bookings keep winning them
+    BOOKING_MAX_CLAIM_ATTEMPTS = int(os.getenv("BOOKING_MAX_CLAIM_ATTEMPTS", 20))
+    # Micro-batching of concurrent bookings per city (trades a few ms of latency for throughput)
+    BOOKING_DISPATCHER_ENABLED = os.getenv("BOOKING_DISPATCHER_ENABLED", "False").lower() in ["true", "1"]
+    BOOKING_DISPATCHER_MAX_WAIT_MS = float(os.getenv("BOOKING_DISPATCHER_MAX_WAIT_MS", 5))
+    BOOKING_DISPATCHER_MAX_BATCH = int(os.getenv("BOOKING_DISPATCHER_MAX_BATCH", 50))
+    # Seconds without requests after which a city's dispatcher thread exits
+    BOOKING_DISPATCHER_IDLE_TIMEOUT_SECONDS = float(os.getenv("BOOKING_DISPATCHER_IDLE_TIMEOUT_SECONDS", 60))
+
+    # Cab History Durability
+    # "sync": history rows commit with the state change they record (durable).
+    # "buffered": rows go through a write-behind buffer flushed in bulk; up to one
+    #             buffer's worth of history can be lost if the process crashes.
+    HISTORY_WRITE_MODE = os.getenv("HISTORY_WRITE_MODE", "sync").lower()
+    HISTORY_BUFFER_MAX_SIZE = int(os.getenv("HISTORY_BUFFER_MAX_SIZE", 10000))
+    HISTORY_FLUSH_SIZE = int(os.getenv("HISTORY_FLUSH_SIZE", 500))
+    HISTORY_FLUSH_INTERVAL_MS = float(os.getenv("HISTORY_FLUSH_INTERVAL_MS", 200))
+    # Retries of a flush failing on a transient error; rows that cannot be written go to the dead-letter file
+    HISTORY_FLUSH_MAX_RETRIES = int(os.getenv("HISTORY_FLUSH_MAX_RETRIES", 5))
+    HISTORY_DEAD_LETTER_PATH = os.getenv("HISTORY_DEAD_LETTER_PATH", "./history_dead_letter.ndjson")
+
+    # Cab History Partitioning
+    # Monthly partitions of cab_history (native range partitioning on PostgreSQL, one table per
+    # month on SQLite). Must be enabled before cab_history is created on PostgreSQL.
+    HISTORY_PARTITIONING = os.getenv("HISTORY_PARTITIONING", "False").lower() in ["true", "1"]
+    # Months kept in the database; older partitions are moved to gzip NDJSON files
+    HISTORY_HOT_MONTHS = int(os.getenv("HISTORY_HOT_MONTHS", 3))
+    HISTORY_ARCHIVE_DIR = os.getenv("HISTORY_ARCHIVE_DIR", "./history_archive")
+    # Rows read per batch while a partition is exported to its archive file
+    HISTORY_ARCHIVE_BATCH_SIZE = int(os.getenv("HISTORY_ARCHIVE_BATCH_SIZE", 5000))
+    # Rows per indexed gzip member of an archive file (reading one cab decompresses one member or so)
+    HISTORY_ARCHIVE_INDEX_ROWS = int(os.getenv("HISTORY_ARCHIVE_INDEX_ROWS", 1000))
+
+    # Listing Settings
+    # Rows fetched per round trip when a listing is streamed as NDJSON
+    STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", 1000))
+
+    # Telemetry Settings
+    # Cabs written per set-based UPDATE ... FROM (VALUES ...) statement
+    TELEMETRY_UPDATE_BATCH_SIZE = int(os.getenv("TELEMETRY_UPDATE_BATCH_SIZE", 500))
+
+    # Bulk Import Settings
+    CAB_IMPORT_BATCH_SIZE = int(os.getenv("CAB_IMPORT_BATCH_SIZE", 5000))
+
+    # Bulk Export Settings
+    # Rows read per keyset batch (and short read transaction) by `GET /export/{table}`
+    EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 5000))
+
+    # Analytics Settings
+    # History rows above which bulk analytics switch from row-by-row Python to NumPy arrays
+    ANALYTICS_COLUMNAR_MIN_ROWS = int(os.getenv("ANALYTICS_COLUMNAR_MIN_ROWS", 200000))
+    # Rows fetched per round trip when loading columnar slices
+    ANALYTICS_CHUNK_SIZE = int(os.getenv("ANALYTICS_CHUNK_SIZE", 100000))
+    # In-process cache of analytics results, invalidated per city/cab on writes
+    ANALYTICS_CACHE_TTL_SECONDS = float(os.getenv("ANALYTICS_CACHE_TTL_SECONDS", 30))
+    ANALYTICS_CACHE_MAX_SIZE = int(os.getenv("ANALYTICS_CACHE_MAX_SIZE", 1024))
+    # Resolution of the top cities sliding windows (a multiple of 60)
+    DEMAND_WINDOW_BUCKET_SECONDS = int(os.getenv("DEMAND_WINDOW_BUCKET_SECONDS", 60))
+    # Trip duration quantiles: sketch relative error, how often completed trips are persisted,
+    # and the number of trips up to which a city's quantiles are computed exactly
+    TRIP_DURATION_SKETCH_ACCURACY = float(os.getenv("TRIP_DURATION_SKETCH_ACCURACY", 0.01))
+    TRIP_DURATION_FLUSH_SECONDS = float(os.getenv("TRIP_DURATION_FLUSH_SECONDS", 10))
+    TRIP_DURATION_EXACT_MAX = int(os.getenv("TRIP_DURATION_EXACT_MAX", 2000))
+
     # Additional settings can be added here
 
 
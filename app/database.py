@@ -2,6 +2,7 @@ from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from app.config import config
 
 
@@ -10,6 +11,10 @@ Base = declarative_base()
 engine = create_engine(config.DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# The async engine is only created in async mode, so sync deployments need no async driver
+async_engine = create_async_engine(config.ASYNC_DATABASE_URL) if config.DB_MODE == "async" else None
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 # print("Creating tables...")
 # Base.metadata.create_all(bind=engine, checkfirst=True)
 # print("Tables created.")
@@ -25,3 +30,9 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    """Yields an AsyncSession per request (async mode only)."""
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,19 +1,51 @@
-from fastapi import FastAPI
-from app.api import cab_routes, booking_routes, city_routes, analytics_routes
-from app.database import Base, engine
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, APIRouter
+from app.api import cab_routes, booking_routes, city_routes, analytics_routes, async_routes, export_routes, metrics_routes
+from app.config import config
+from app.database import Base, engine, SessionLocal
+from app.repositories.history_partitions import HistoryPartitions
+from app.repositories.duration_sketches import duration_sketches
+from app.repositories.history_writer import history_writer
+from app.repositories.schema_upgrade import SchemaUpgrade
+from app.services.analytics_service import AnalyticsService
+from app.services.booking_dispatcher import booking_dispatcher
+from app.services.city_service import CityService
 
 print("Creating tables...")
 Base.metadata.create_all(bind=engine, checkfirst=True)
+# Databases created by an earlier release get the columns and indexes added since
+for step in SchemaUpgrade.upgrade(engine):
+    print(f"Upgraded schema: {step}")
 print("Tables created.")
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if config.HISTORY_PARTITIONING:
+        # Make sure this and next month's cab_history partitions exist before writes arrive
+        with SessionLocal() as db:
+            HistoryPartitions.ensure_partitions(db)
+    # Seed the city registry and the top cities counters with the bookings of the last day
+    with SessionLocal() as db:
+        CityService.load_registry(db)
+        AnalyticsService.load_demand_windows(db)
+    yield
+    # Serve queued bookings, then drain buffered cab history and trip durations before the process exits
+    booking_dispatcher.close()
+    history_writer.close()
+    duration_sketches.close()
+
+
 app = FastAPI(
     title="Intercity Cab Management API",
+    lifespan=lifespan,
     openapi_tags=[
         {"name": "Cities", "description": "Manage city-related operations"},
         {"name": "Cabs", "description": "Manage cabs and their states"},
         {"name": "Bookings", "description": "Handle booking requests"},
-        {"name": "Analytics", "description": "View cab demand and history"}
+        {"name": "Analytics", "description": "View cab demand and history"},
+        {"name": "Export", "description": "Bulk export of bookings and cab history"},
+        {"name": "Metrics", "description": "Runtime metrics"}
     ]
 )
 
@@ -28,9 +60,32 @@ def root():
     }
 
 
+def with_async_routes(sync_router: APIRouter, async_router: APIRouter) -> APIRouter:
+    """
+    Returns the sync router with every endpoint that has an async variant swapped in place.
+    Route order is preserved, so static paths keep precedence over path parameters.
+    """
+    def key(route):
+        # WebSocket routes have no HTTP methods
+        return route.path, frozenset(getattr(route, "methods", None) or ())
+
+    async_routes_by_key = {key(route): route for route in async_router.routes}
+    merged = APIRouter()
+    for route in sync_router.routes:
+        merged.routes.append(async_routes_by_key.get(key(route), route))
+    return merged
+
+
 # Register Routers
-app.include_router(city_routes.router)
-app.include_router(cab_routes.router)
-app.include_router(booking_routes.router)
+if config.DB_MODE == "async":
+    app.include_router(with_async_routes(city_routes.router, async_routes.city_router))
+    app.include_router(with_async_routes(cab_routes.router, async_routes.cab_router))
+    app.include_router(with_async_routes(booking_routes.router, async_routes.booking_router))
+else:
+    app.include_router(city_routes.router)
+    app.include_router(cab_routes.router)
+    app.include_router(booking_routes.router)
 app.include_router(analytics_routes.router)
+app.include_router(export_routes.router)
+app.include_router(metrics_routes.router)
 
@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Enum as SQLAlchemyEnum, Float, func
+from sqlalchemy import Column, Integer, String, ForeignKey, Date, DateTime, Enum as SQLAlchemyEnum, Float, Index, JSON, func
 from sqlalchemy.orm import relationship
 from datetime import datetime
+from app.config import config
 from app.database import Base
 from app.state_machine import CabState
 
@@ -13,6 +14,7 @@ class Cab(Base):
     current_city_id = Column(Integer, ForeignKey("cities.id"), nullable=True)
     state = Column(SQLAlchemyEnum(CabState), default=CabState.IDLE)
     last_idle_time = Column(DateTime, default=datetime.utcnow)  # Track last idle time
+    version = Column(Integer, nullable=False, default=0, server_default="0")  # Optimistic concurrency
 
     current_city = relationship("City", back_populates="cabs")
     history = relationship("CabHistory", back_populates="cab", cascade="all, delete-orphan")
@@ -32,7 +34,7 @@ class Booking(Base):
     __tablename__ = "bookings"
 
     id = Column(Integer, primary_key=True, index=True)
-    cab_id = Column(Integer, ForeignKey("cabs.id"), nullable=False)
+    cab_id = Column(Integer, ForeignKey("cabs.id"), nullable=False, index=True)
     city_id = Column(Integer, ForeignKey("cities.id"), nullable=False)
     pickup_time = Column(DateTime, default=datetime.utcnow)
     drop_time = Column(DateTime, nullable=True)
@@ -42,12 +44,101 @@ class Booking(Base):
     city = relationship("City", back_populates="bookings")
 
 
+class TripDurationSketch(Base):
+    """Per-city quantile sketch of trip durations (`app.utils.quantile_sketch`), merged in periodically."""
+    __tablename__ = "trip_duration_sketches"
+
+    city_id = Column(Integer, ForeignKey("cities.id"), primary_key=True)
+    sketch = Column(JSON, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class HourlyDemand(Base):
+    """Bookings per city and UTC hour, incremented in the same transaction as every booking."""
+    __tablename__ = "hourly_demand"
+
+    city_id = Column(Integer, ForeignKey("cities.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    hour = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+
+# Dispatch lookup: idle cabs of a city, oldest idle first (matches get_available_cabs' ORDER BY).
+# PostgreSQL sorts NULLs last by default, so its index spells out NULLS FIRST; SQLite sorts
+# NULLs first already and does not accept NULLS FIRST in index definitions.
+Index(
+    "ix_cabs_dispatch",
+    Cab.current_city_id, Cab.state, Cab.last_idle_time.asc().nulls_first(),
+).ddl_if(dialect="postgresql")
+Index(
+    "ix_cabs_dispatch",
+    Cab.current_city_id, Cab.state, Cab.last_idle_time,
+).ddl_if(callable_=lambda ddl, target, bind, dialect=None, **kw: dialect.name != "postgresql")
+
+# Demand analytics filter bookings by city and pickup time
+Index("ix_bookings_city_id_pickup_time", Booking.city_id, Booking.pickup_time)
+
+# Partial indexes over in-flight trips only, so active-booking scans never touch completed history
+Index(
+    "ix_bookings_active_city_id",
+    Booking.city_id, Booking.id,
+    postgresql_where=Booking.drop_time.is_(None),
+    sqlite_where=Booking.drop_time.is_(None),
+)
+Index(
+    "ix_bookings_active_id",
+    Booking.id,
+    postgresql_where=Booking.drop_time.is_(None),
+    sqlite_where=Booking.drop_time.is_(None),
+)
+
+
+# PostgreSQL range partitions must include the partition key in the primary key
+PARTITIONED_HISTORY = config.HISTORY_PARTITIONING and config.DATABASE_URL.startswith("postgresql")
+
+
 class CabHistory(Base):
     __tablename__ = "cab_history"
+    # SQLite moves closed months to other tables, so ids must never be reused once deleted here
+    __table_args__ = (
+        {"postgresql_partition_by": "RANGE (timestamp)", "sqlite_autoincrement": True}
+        if config.HISTORY_PARTITIONING else {}
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
-    cab_id = Column(Integer, ForeignKey("cabs.id"), nullable=False, index=True)
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    cab_id = Column(Integer, ForeignKey("cabs.id"), nullable=False)
     state = Column(SQLAlchemyEnum(CabState), nullable=False)
-    timestamp = Column(DateTime, nullable=False, server_default=func.now(), index=True)
+    timestamp = Column(
+        DateTime, nullable=False, server_default=func.now(), index=True, primary_key=PARTITIONED_HISTORY
+    )
 
     cab = relationship("Cab", back_populates="history")
+
+
+# Per-cab timeline lookups (history pages, idle time) seek and sort on (cab_id, timestamp);
+# the prefix also serves plain cab_id lookups
+Index("ix_cab_history_cab_id_timestamp", CabHistory.cab_id, CabHistory.timestamp)
+
+
+class CabStateInterval(Base):
+    """
+    One stretch of time a cab spent in a single state, maintained with every cab_history write.
+    ``end`` is NULL for the cab's current (open) interval; ``cumulative_idle_before`` holds the
+    cab's idle seconds before ``start``, so idle time up to any moment needs one interval.
+    """
+    __tablename__ = "cab_state_intervals"
+
+    cab_id = Column(Integer, ForeignKey("cabs.id"), primary_key=True)
+    start = Column(DateTime, primary_key=True)
+    end = Column(DateTime, nullable=True)
+    state = Column(SQLAlchemyEnum(CabState), nullable=False)
+    cumulative_idle_before = Column(Float, nullable=False, default=0.0)
+
+
+# Transitions close the cab's open interval; find it without walking the cab's past intervals
+Index(
+    "ix_cab_state_intervals_open",
+    CabStateInterval.cab_id,
+    postgresql_where=CabStateInterval.end.is_(None),
+    sqlite_where=CabStateInterval.end.is_(None),
+)
@@ -0,0 +1,21 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models import Booking
+from app.repositories.booking_repository import BookingRepository
+
+
+class AsyncBookingRepository:
+    """AsyncSession counterpart of `BookingRepository`."""
+
+    @staticmethod
+    async def create_booking(db: AsyncSession, cab_id: int, city_id: int):
+        """Adds a new booking to the caller's transaction (flushed, not committed)."""
+        booking = Booking(cab_id=cab_id, city_id=city_id)
+        db.add(booking)
+        await db.flush()
+        await db.execute(BookingRepository.hourly_demand_upsert(db.bind.dialect.name, city_id, [booking.pickup_time]))
+        return booking
+
+    @staticmethod
+    async def get_booking_by_id(db: AsyncSession, booking_id: int):
+        """Fetches a booking by its ID."""
+        return await db.get(Booking, booking_id)
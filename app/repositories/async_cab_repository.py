@@ -0,0 +1,100 @@
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+from datetime import datetime
+from fastapi import HTTPException
+from app.state_machine import CabState
+from app.config import config
+from app.models import Cab, CabHistory
+from app.repositories.cab_repository import CabRepository
+from app.repositories.history_partitions import HistoryPartitions
+from app.repositories.history_writer import history_writer
+from app.repositories.state_intervals import StateIntervals
+
+
+class AsyncCabRepository:
+    """AsyncSession counterpart of `CabRepository` for the request hot path."""
+
+    @staticmethod
+    async def create_cab(db: AsyncSession, cab_data: dict) -> Cab:
+        """Adds a new cab to the caller's transaction (flushed, not committed)."""
+        cab = Cab(**cab_data)
+        db.add(cab)
+        await db.flush()
+        await db.refresh(cab)
+        return cab
+
+    @staticmethod
+    async def update_cab_location(db: AsyncSession, cab_id: int, city_id: int) -> Cab:
+        """Updates the cab's location."""
+        cab = await db.get(Cab, cab_id)
+        if not cab:
+            raise HTTPException(status_code=404, detail="Cab not found")
+        cab.current_city_id = city_id
+        cab.version = Cab.version + 1  # Telemetry computed from the old location must not overwrite it
+        await db.commit()
+        await db.refresh(cab)
+        return cab
+
+    @staticmethod
+    async def update_cab_state(db: AsyncSession, cab_id: int, new_state: str,
+                               expected_version: Optional[int] = None) -> Optional[Cab]:
+        """Conditional state transition, see `CabRepository.update_cab_state` (not committed)."""
+        new_state = CabState(new_state)
+        values = {"state": new_state, "version": Cab.version + 1}
+        if new_state == CabState.IDLE:
+            values["last_idle_time"] = datetime.utcnow()
+
+        stmt = CabRepository.state_update(cab_id, new_state, expected_version)
+        return (await db.execute(stmt.values(**values).returning(Cab))).scalar_one_or_none()
+
+    @staticmethod
+    async def get_available_cabs(db: AsyncSession, city_id: int, limit: Optional[int] = None):
+        """Fetches available cabs in a city, longest idle first."""
+        stmt = (
+            select(Cab)
+            .where(Cab.current_city_id == city_id, Cab.state == CabState.IDLE)
+            .order_by(Cab.last_idle_time.asc().nulls_first())
+        )
+        if limit:
+            stmt = stmt.limit(limit)
+        return (await db.scalars(stmt)).all()
+
+    @staticmethod
+    async def get_idle_cab_keys(db: AsyncSession, city_id: int):
+        """Fetches ``(id, last_idle_time)`` of every IDLE cab in a city."""
+        stmt = select(Cab.id, Cab.last_idle_time).where(Cab.current_city_id == city_id, Cab.state == CabState.IDLE)
+        return (await db.execute(stmt)).all()
+
+    @staticmethod
+    async def claim_cab(db: AsyncSession, cab_id: int, city_id: int) -> Optional[int]:
+        """Atomically moves a cab from IDLE to ON_TRIP; returns None if the race was lost."""
+        stmt = (
+            update(Cab)
+            .where(Cab.id == cab_id, Cab.current_city_id == city_id, Cab.state == CabState.IDLE)
+            .values(state=CabState.ON_TRIP, version=Cab.version + 1)
+            .returning(Cab.id)
+            .execution_options(synchronize_session=False)
+        )
+        return (await db.execute(stmt)).scalar_one_or_none()
+
+    @staticmethod
+    async def create_cab_history(db: AsyncSession, cab_id: int, state: str):
+        """Logs a cab's state change and its state intervals in the caller's transaction (flushed, not committed)."""
+        now = datetime.utcnow()
+        if config.HISTORY_WRITE_MODE == "buffered":
+            # The commit runs on the event loop, which must not wait for room in the buffer
+            history_writer.enqueue_on_commit(db.sync_session, [(cab_id, state, now)], block=False)
+            return
+        db.add(CabHistory(cab_id=cab_id, state=state, timestamp=now))
+        await db.run_sync(lambda session: StateIntervals.record(session, [(cab_id, state, now)]))
+        await db.flush()
+
+    @staticmethod
+    async def get_cab_history(db: AsyncSession, cab_id: int):
+        """Fetches cab history sorted by timestamp (latest first)."""
+        if config.HISTORY_PARTITIONING:
+            # Stitching monthly tables and archive files is done by the sync reader
+            return await db.run_sync(lambda session: list(HistoryPartitions.read_latest_first(session, cab_id)))
+        stmt = select(CabHistory).where(CabHistory.cab_id == cab_id).order_by(CabHistory.timestamp.desc())
+        return (await db.scalars(stmt)).all()
@@ -0,0 +1,51 @@
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models import City
+from app.repositories.city_repository import CityRepository
+
+
+class AsyncCityRepository:
+    """AsyncSession counterpart of `CityRepository`."""
+
+    @staticmethod
+    async def create_city(db: AsyncSession, city_data: dict):
+        """Creates a new city in one statement; returns None if the name already exists."""
+        stmt = CityRepository.city_insert(db.bind.dialect.name, city_data)
+        row = (await db.execute(stmt)).first()
+        await db.commit()
+        return City(id=row.id, name=row.name) if row else None
+
+    @staticmethod
+    async def get_all_cities(db: AsyncSession):
+        """Retrieves all registered cities."""
+        return (await db.scalars(select(City))).all()
+
+    @staticmethod
+    async def get_city_names(db: AsyncSession) -> list[tuple[int, str]]:
+        """Retrieves ``(id, name)`` of every city in one query."""
+        return [tuple(row) for row in (await db.execute(select(City.id, City.name))).all()]
+
+    @staticmethod
+    async def get_city_by_id(db: AsyncSession, city_id: int):
+        """Fetches a city by its ID."""
+        return await db.get(City, city_id)
+
+    @staticmethod
+    async def update_city(db: AsyncSession, city_id: int, updated_data: dict):
+        """Updates a city's details (name/state)."""
+        city = await db.get(City, city_id)
+        if city:
+            for key, value in updated_data.items():
+                setattr(city, key, value)
+            await db.commit()
+        return city
+
+    @staticmethod
+    async def delete_city(db: AsyncSession, city_id: int):
+        """Deletes a city by ID."""
+        city = await db.get(City, city_id)
+        if city:
+            await db.delete(city)
+            await db.commit()
+            return True
+        return False
@@ -1,6 +1,11 @@
+from collections import Counter
+from sqlalchemy import Date, case, delete, extract, func, insert, select, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Session
-from app.models import Booking
-from datetime import datetime
+from app.models import Booking, City, HourlyDemand
+from datetime import date, datetime, time
+from typing import Optional
 from app.repositories.cab_repository import CabRepository
 
 
@@ -8,22 +13,52 @@ class BookingRepository:
     @staticmethod
     def create_booking(db: Session, cab_id: int, city_id: int):
         """
-        Creates a new booking and updates the cab status via `CabRepository.update_cab_state()`
-        to maintain separation of concerns.
+        Adds a new booking to the caller's transaction.
+        The row is flushed (so the booking id is available) but not committed, which lets
+        the cab claim, the booking and the history row commit atomically.
         """
-        try:
-            # Create booking record
-            booking = Booking(cab_id=cab_id, city_id=city_id)
-            db.add(booking)
+        booking = Booking(cab_id=cab_id, city_id=city_id)
+        db.add(booking)
+        db.flush()
+        BookingRepository.record_hourly_demand(db, city_id, [booking.pickup_time])
+        return booking
 
-            # Commit transaction
-            db.commit()
-            db.refresh(booking)
-            return booking
+    @staticmethod
+    def create_bookings(db: Session, city_id: int, cab_ids: list[int]):
+        """
+        Bulk inserts one booking per cab in the caller's transaction.
+        Returns ``(id, cab_id)`` rows in the same order as ``cab_ids``.
+        """
+        now = datetime.utcnow()
+        stmt = insert(Booking).returning(Booking.id, Booking.cab_id, sort_by_parameter_order=True)
+        bookings = db.execute(
+            stmt,
+            [{"cab_id": cab_id, "city_id": city_id, "pickup_time": now, "created_at": now} for cab_id in cab_ids],
+        ).all()
+        BookingRepository.record_hourly_demand(db, city_id, [now] * len(bookings))
+        return bookings
 
-        except Exception as e:
-            db.rollback()  # Rollback in case of failure
-            raise e
+    @staticmethod
+    def hourly_demand_upsert(dialect_name: str, city_id: int, pickup_times: list[datetime]):
+        """
+        Builds the INSERT ... ON CONFLICT statement adding bookings to the hourly_demand rollup.
+        Pickup times are pre-aggregated, so a batch touches each (day, hour) row once.
+        """
+        counts = Counter((pickup_time.date(), pickup_time.hour) for pickup_time in pickup_times)
+        dialect_insert = postgresql_insert if dialect_name == "postgresql" else sqlite_insert
+        stmt = dialect_insert(HourlyDemand).values([
+            {"city_id": city_id, "day": day, "hour": hour, "count": count} for (day, hour), count in counts.items()
+        ])
+        return stmt.on_conflict_do_update(
+            index_elements=[HourlyDemand.city_id, HourlyDemand.day, HourlyDemand.hour],
+            set_={"count": HourlyDemand.count + stmt.excluded.count},
+        )
+
+    @staticmethod
+    def record_hourly_demand(db: Session, city_id: int, pickup_times: list[datetime]):
+        """Adds bookings to the hourly_demand rollup within the caller's transaction."""
+        if pickup_times:
+            db.execute(BookingRepository.hourly_demand_upsert(db.get_bind().dialect.name, city_id, pickup_times))
 
     @staticmethod
     def get_booking_by_id(db: Session, booking_id: int):
@@ -37,13 +72,135 @@ class BookingRepository:
         """
         return BookingRepository.complete_booking(db, booking_id)
 
+    @staticmethod
+    def get_active_bookings(db: Session, city_id: Optional[int], cursor: Optional[int], limit: int):
+        """
+        Fetches one page of in-flight bookings (``drop_time IS NULL``) ordered by id.
+        Keyset pagination on ``id > cursor`` keeps every page an index range scan.
+        """
+        query = db.query(Booking).filter(Booking.drop_time.is_(None))
+        if city_id is not None:
+            query = query.filter(Booking.city_id == city_id)
+        if cursor is not None:
+            query = query.filter(Booking.id > cursor)
+        return query.order_by(Booking.id.asc()).limit(limit).all()
+
+    @staticmethod
+    def complete_bookings(db: Session, booking_ids: list[int], drop_time: datetime):
+        """
+        Sets ``drop_time`` on every still-active booking of ``booking_ids`` with one UPDATE.
+        Returns the ``(id, cab_id, city_id, pickup_time)`` rows that were completed; nothing is committed here.
+        """
+        stmt = (
+            update(Booking)
+            .where(Booking.id.in_(booking_ids), Booking.drop_time.is_(None))
+            .values(drop_time=drop_time)
+            .returning(Booking.id, Booking.cab_id, Booking.city_id, Booking.pickup_time)
+            .execution_options(synchronize_session=False)
+        )
+        return db.execute(stmt).all()
+
+    @staticmethod
+    def get_existing_ids(db: Session, booking_ids: list[int]) -> set[int]:
+        """Returns the subset of ``booking_ids`` that exist."""
+        return set(db.execute(select(Booking.id).where(Booking.id.in_(booking_ids))).scalars())
+
     @staticmethod
     def analyze_peak_demand(db: Session, city_id: int):
-        """Finds peak hours for cab demand."""
-        bookings = db.query(Booking).filter(Booking.city_id == city_id).all()
-        hourly_count = {}
-        for booking in bookings:
-            hour = booking.pickup_time.hour
-            hourly_count[hour] = hourly_count.get(hour, 0) + 1
-        return max(hourly_count, key=hourly_count.get) if hourly_count else None
+        """Finds the peak hour for cab demand with a GROUP BY over the city's bookings."""
+        hour = extract("hour", Booking.pickup_time)
+        counts = db.execute(select(hour, func.count()).where(Booking.city_id == city_id).group_by(hour)).all()
+        return int(max(counts, key=lambda row: (row[1], -row[0]))[0]) if counts else None
 
+    @staticmethod
+    def get_hourly_demand(db: Session, city_id: int, start_day: Optional[date] = None,
+                          end_day: Optional[date] = None) -> dict[int, int]:
+        """Sums the hourly_demand rollup per UTC hour over ``[start_day, end_day]`` (at most 24 rows)."""
+        stmt = select(HourlyDemand.hour, func.sum(HourlyDemand.count)).where(HourlyDemand.city_id == city_id)
+        if start_day:
+            stmt = stmt.where(HourlyDemand.day >= start_day)
+        if end_day:
+            stmt = stmt.where(HourlyDemand.day <= end_day)
+        return {hour: int(count) for hour, count in db.execute(stmt.group_by(HourlyDemand.hour))}
+
+    @staticmethod
+    def get_hourly_demand_buckets(db: Session, city_id: int, start_day: Optional[date] = None,
+                                  end_day: Optional[date] = None) -> list[tuple[date, int, int]]:
+        """Returns the raw ``(day, hour, count)`` rollup rows of a city over ``[start_day, end_day]``."""
+        stmt = select(HourlyDemand.day, HourlyDemand.hour, HourlyDemand.count).where(HourlyDemand.city_id == city_id)
+        if start_day:
+            stmt = stmt.where(HourlyDemand.day >= start_day)
+        if end_day:
+            stmt = stmt.where(HourlyDemand.day <= end_day)
+        return db.execute(stmt).all()
+
+    @staticmethod
+    def get_weekly_demand(db: Session, start_day: Optional[date] = None,
+                          end_day: Optional[date] = None) -> list[tuple[int, int, int, int]]:
+        """
+        Sums the hourly_demand rollup of every city per UTC ``(weekday, hour)`` over ``[start_day, end_day]``
+        (weekday 0 = Sunday), with one GROUP BY of at most 168 rows per city. Filtering on the city
+        ids reads one primary key range per city.
+        """
+        weekday = extract("dow", HourlyDemand.day)
+        stmt = (
+            select(HourlyDemand.city_id, weekday, HourlyDemand.hour, func.sum(HourlyDemand.count))
+            .where(HourlyDemand.city_id.in_(select(City.id)))
+        )
+        if start_day:
+            stmt = stmt.where(HourlyDemand.day >= start_day)
+        if end_day:
+            stmt = stmt.where(HourlyDemand.day <= end_day)
+        stmt = stmt.group_by(HourlyDemand.city_id, weekday, HourlyDemand.hour)
+        return [(city_id, int(day), hour, int(count)) for city_id, day, hour, count in db.execute(stmt)]
+
+    @staticmethod
+    def get_demand_slots(db: Session, city_id: int, start: Optional[datetime] = None,
+                         end: Optional[datetime] = None) -> list[tuple[date, int, int, int]]:
+        """
+        Counts a city's bookings per UTC ``(day, hour, minute)`` quarter-hour slot within ``[start, end)``.
+        Used for time zones whose offset is not a whole number of hours.
+        """
+        day = func.date(Booking.pickup_time, type_=Date)
+        hour = extract("hour", Booking.pickup_time)
+        minute = extract("minute", Booking.pickup_time)
+        quarter = case((minute < 15, 0), (minute < 30, 15), (minute < 45, 30), else_=45)
+        stmt = select(day, hour, quarter, func.count()).where(Booking.city_id == city_id)
+        if start:
+            stmt = stmt.where(Booking.pickup_time >= start)
+        if end:
+            stmt = stmt.where(Booking.pickup_time < end)
+        return [(row[0], int(row[1]), int(row[2]), row[3]) for row in db.execute(stmt.group_by(day, hour, quarter))]
+
+    @staticmethod
+    def get_recent_demand(db: Session, since: datetime) -> list[tuple[int, datetime, int]]:
+        """
+        Counts every city's bookings per UTC minute picked up from ``since`` on, with one GROUP BY.
+        Filtering on the city ids turns the query into one ``(city_id, pickup_time)`` index range
+        per city instead of a scan of all bookings.
+        """
+        day = func.date(Booking.pickup_time, type_=Date)
+        hour = extract("hour", Booking.pickup_time)
+        minute = extract("minute", Booking.pickup_time)
+        stmt = (
+            select(Booking.city_id, day, hour, minute, func.count())
+            .where(Booking.city_id.in_(select(City.id)), Booking.pickup_time >= since)
+            .group_by(Booking.city_id, day, hour, minute)
+        )
+        return [(city_id, datetime.combine(day, time(int(hour), int(minute))), count)
+                for city_id, day, hour, minute, count in db.execute(stmt)]
+
+    @staticmethod
+    def rebuild_hourly_demand(db: Session) -> int:
+        """Recomputes the hourly_demand rollup from bookings with one INSERT ... SELECT; returns the row count."""
+        day = func.date(Booking.pickup_time, type_=Date)
+        hour = extract("hour", Booking.pickup_time)
+        db.execute(delete(HourlyDemand))
+        result = db.execute(insert(HourlyDemand).from_select(
+            ["city_id", "day", "hour", "count"],
+            select(Booking.city_id, day, hour, func.count())
+            .where(Booking.pickup_time.is_not(None))
+            .group_by(Booking.city_id, day, hour),
+        ))
+        db.commit()
+        return result.rowcount
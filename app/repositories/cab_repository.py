@@ -1,10 +1,17 @@
+from sqlalchemy import DateTime, Integer, and_, cast, column, func, insert, or_, select, tuple_, type_coerce, update, values
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
-from typing import Optional
-from datetime import datetime, timedelta
+from itertools import islice
+from typing import Iterator, Optional
+from datetime import datetime
 from fastapi import HTTPException
-from app.state_machine import CabState
-from app.models import Cab, CabHistory
+from app.state_machine import ALLOWED_SOURCES, CabState
+from app.config import config
+from app.models import Cab, CabHistory, CabStateInterval
+from app.repositories.columnar_repository import ColumnarRepository
+from app.repositories.history_partitions import HistoryPartitions
+from app.repositories.history_writer import history_writer
+from app.repositories.state_intervals import StateIntervals
 
 
 class CabRepository:
@@ -21,6 +28,116 @@ class CabRepository:
             db.rollback()
             raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
+    @staticmethod
+    def get_existing_plates(db: Session, plate_numbers: list[str]) -> set[str]:
+        """Returns the subset of ``plate_numbers`` that is already registered."""
+        rows = db.query(Cab.plate_number).filter(Cab.plate_number.in_(plate_numbers)).all()
+        return {plate_number for plate_number, in rows}
+
+    @staticmethod
+    def bulk_create_cabs(db: Session, cabs: list[dict], idle_since: datetime) -> list[int]:
+        """
+        Inserts many IDLE cabs plus their initial history rows and open state intervals in the
+        caller's transaction.
+        Uses COPY on PostgreSQL and a multi-row INSERT ... RETURNING elsewhere.
+        Returns the new cab ids in input order.
+        """
+        now = idle_since
+        if db.get_bind().dialect.name == "postgresql":
+            ColumnarRepository.copy_rows(
+                db, "cabs", ["plate_number", "current_city_id", "state", "last_idle_time"],
+                [(cab["plate_number"], cab["current_city_id"], CabState.IDLE.name, now) for cab in cabs],
+            )
+            ids_by_plate = dict(
+                db.query(Cab.plate_number, Cab.id).filter(Cab.plate_number.in_([cab["plate_number"] for cab in cabs]))
+            )
+            cab_ids = [ids_by_plate[cab["plate_number"]] for cab in cabs]
+            ColumnarRepository.copy_rows(
+                db, "cab_history", ["cab_id", "state", "timestamp"],
+                [(cab_id, CabState.IDLE.name, now) for cab_id in cab_ids],
+            )
+            ColumnarRepository.copy_rows(
+                db, "cab_state_intervals", ["cab_id", "start", "state", "cumulative_idle_before"],
+                [(cab_id, now, CabState.IDLE.name, 0.0) for cab_id in cab_ids],
+            )
+            return cab_ids
+
+        stmt = insert(Cab).returning(Cab.id, sort_by_parameter_order=True)
+        cab_ids = db.execute(stmt, [
+            {"plate_number": cab["plate_number"], "current_city_id": cab["current_city_id"],
+             "state": CabState.IDLE, "last_idle_time": now}
+            for cab in cabs
+        ]).scalars().all()
+        db.execute(insert(CabHistory), [
+            {"cab_id": cab_id, "state": CabState.IDLE, "timestamp": now} for cab_id in cab_ids
+        ])
+        db.execute(insert(CabStateInterval), [
+            {"cab_id": cab_id, "start": now, "state": CabState.IDLE, "cumulative_idle_before": 0.0}
+            for cab_id in cab_ids
+        ])
+        return cab_ids
+
+    @staticmethod
+    def get_cab_snapshots(db: Session, cab_ids: list[int]) -> dict:
+        """Fetches ``id -> (id, state, current_city_id, last_idle_time, version)`` rows in one query."""
+        rows = (
+            db.query(Cab.id, Cab.state, Cab.current_city_id, Cab.last_idle_time, Cab.version)
+            .filter(Cab.id.in_(cab_ids))
+            .all()
+        )
+        return {row.id: row for row in rows}
+
+    @staticmethod
+    def update_cabs_at_version(db: Session, rows: list[dict]) -> set[int]:
+        """
+        Applies per-cab ``{id, version, previous_state, state, current_city_id, last_idle_time}``
+        values, computed from a read at ``version`` in ``previous_state``, within the caller's
+        transaction. Returns the ids written.
+
+        Every ``TELEMETRY_UPDATE_BATCH_SIZE`` rows are one ``UPDATE cabs ... FROM (VALUES ...)``
+        (PostgreSQL, SQLite >= 3.33) with the guard of `state_update` per row: a cab only matches
+        while it is still at that version and may move to the new state, so a concurrent claim or
+        state change is never overwritten. Ids missing from ``RETURNING`` are the conflicts.
+        """
+        if not rows:
+            return set()
+        state_type = Cab.__table__.c.state.type
+        # VALUES columns are untyped on PostgreSQL (enum and NULL-only columns arrive as text);
+        # SQLite needs no cast and would turn a DATETIME cast into a number
+        typed = cast if db.get_bind().dialect.name == "postgresql" else type_coerce
+
+        written = set()
+        for start in range(0, len(rows), config.TELEMETRY_UPDATE_BATCH_SIZE):
+            chunk = rows[start:start + config.TELEMETRY_UPDATE_BATCH_SIZE]
+            v = values(
+                column("id", Integer), column("version", Integer),
+                column("previous_state", state_type), column("state", state_type),
+                column("current_city_id", Integer), column("last_idle_time", DateTime),
+                name="v",
+            ).data([
+                (row["id"], row["version"], CabState(row["previous_state"]), CabState(row["state"]),
+                 row["current_city_id"], row["last_idle_time"])
+                for row in chunk
+            ]).cte("v")
+            state, previous_state = typed(v.c.state, state_type), typed(v.c.previous_state, state_type)
+
+            # A kept state (e.g. a location update) must still be current; a new one must be allowed
+            allowed = or_(
+                and_(state == previous_state, Cab.state == state),
+                *(and_(state != previous_state, state == target, Cab.state.in_(sources))
+                  for target, sources in ALLOWED_SOURCES.items()),
+            )
+            stmt = (
+                update(Cab)
+                .where(Cab.id == v.c.id, Cab.version == v.c.version, allowed)
+                .values(state=state, current_city_id=v.c.current_city_id,
+                        last_idle_time=typed(v.c.last_idle_time, DateTime), version=Cab.version + 1)
+                .returning(Cab.id)
+                .execution_options(synchronize_session=False)
+            )
+            written.update(db.execute(stmt).scalars())
+        return written
+
     @staticmethod
     def update_cab_location(db: Session, cab_id: int, city_id: int) -> Cab:
         """Updates the cab's location."""
@@ -28,27 +145,43 @@ class CabRepository:
         if not cab:
             raise HTTPException(status_code=404, detail="Cab not found")
         cab.current_city_id = city_id
+        cab.version = Cab.version + 1  # Telemetry computed from the old location must not overwrite it
         db.commit()
         db.refresh(cab)
         return cab
 
     @staticmethod
-    def update_cab_state(db: Session, cab_id: int, new_state: str) -> Cab:
-        """Updates cab state, tracks history, and updates last_idle_time if needed."""
-        cab = db.query(Cab).filter(Cab.id == cab_id).first()
-        if not cab:
-            raise HTTPException(status_code=404, detail="Cab not found")
-
-        print(new_state)
+    def update_cab_state(db: Session, cab_id: int, new_state: str, expected_version: Optional[int] = None) -> Optional[Cab]:
+        """
+        Moves a cab to ``new_state`` with one conditional UPDATE, within the caller's transaction.
+        The row only matches if its current state may transition to ``new_state`` (and, when
+        given, its version equals ``expected_version``), so no lock or prior read is needed.
+        Returns the updated cab, or None if the cab is missing, the transition is not allowed
+        or a concurrent update won the race.
+        """
+        new_state = CabState(new_state)
+        values = {"state": new_state, "version": Cab.version + 1}
+        if new_state == CabState.IDLE:
+            values["last_idle_time"] = datetime.utcnow()
 
-        if new_state == CabState.IDLE.value:
-            cab.last_idle_time = datetime.utcnow()
+        stmt = CabRepository.state_update(cab_id, new_state, expected_version)
+        return db.execute(stmt.values(**values).returning(Cab)).scalar_one_or_none()
 
-        cab.state = new_state
-        db.commit()
-        db.refresh(cab)
-
-        return cab
+    @staticmethod
+    def state_update(cab_id: int, new_state: CabState, expected_version: Optional[int] = None,
+                     current_state: Optional[CabState] = None):
+        """
+        Builds the UPDATE of one cab that only matches while the transition table allows it to
+        move to ``new_state`` (and, when given, it is at ``expected_version``). A change that keeps
+        ``current_state`` (e.g. a location update) only matches while the cab is still in it.
+        """
+        if current_state is not None and CabState(current_state) == new_state:
+            stmt = update(Cab).where(Cab.id == cab_id, Cab.state == new_state)
+        else:
+            stmt = update(Cab).where(Cab.id == cab_id, Cab.state.in_(ALLOWED_SOURCES[new_state]))
+        if expected_version is not None:
+            stmt = stmt.where(Cab.version == expected_version)
+        return stmt
 
     @staticmethod
     def get_available_cabs(db: Session, city_id: int, limit: Optional[int] = None):
@@ -72,65 +205,220 @@ class CabRepository:
         return query.all()
 
     @staticmethod
-    def create_cab_history(db: Session, cab_id: int, state: str):
-        """Logs a cab's state change in cab_history."""
+    def _available_cabs_query(city_id: int, after: Optional[tuple] = None):
+        stmt = select(Cab).where(Cab.current_city_id == city_id, Cab.state == CabState.IDLE)
+        if after:
+            last_idle_time, cab_id = after
+            if last_idle_time is None:
+                # NULL idle times sort first; continue within them, then with every dated cab
+                stmt = stmt.where((Cab.last_idle_time.is_(None) & (Cab.id > cab_id)) | Cab.last_idle_time.is_not(None))
+            else:
+                stmt = stmt.where(tuple_(Cab.last_idle_time, Cab.id) > (last_idle_time, cab_id))
+        return stmt.order_by(Cab.last_idle_time.asc().nulls_first(), Cab.id.asc())
+
+    @staticmethod
+    def get_available_cabs_page(db: Session, city_id: int, after: Optional[tuple] = None, limit: Optional[int] = None):
+        """
+        Lists IDLE cabs of a city, longest idle first, without locking them.
+        ``after`` is the ``(last_idle_time, id)`` of the previous page's last cab.
+        """
+        stmt = CabRepository._available_cabs_query(city_id, after)
+        if limit:
+            stmt = stmt.limit(limit)
+        return db.scalars(stmt).all()
+
+    @staticmethod
+    def stream_available_cabs(db: Session, city_id: int) -> Iterator[Cab]:
+        """Yields every IDLE cab of a city, fetching ``STREAM_BATCH_SIZE`` rows at a time."""
+        stmt = CabRepository._available_cabs_query(city_id)
+        yield from db.scalars(stmt, execution_options={"yield_per": config.STREAM_BATCH_SIZE})
+
+    @staticmethod
+    def get_idle_cab_keys(db: Session, city_id: int):
+        """
+        Fetches ``(id, last_idle_time)`` of every IDLE cab in a city.
+        Only the two columns are loaded, so no ORM objects are hydrated.
+        """
+        return (
+            db.query(Cab.id, Cab.last_idle_time)
+            .filter(Cab.current_city_id == city_id, Cab.state == CabState.IDLE)
+            .all()
+        )
+
+    @staticmethod
+    def claim_cab(db: Session, cab_id: int, city_id: int) -> Optional[int]:
+        """
+        Atomically moves a cab from IDLE to ON_TRIP with a single conditional UPDATE.
+        Returns the cab id, or None if the cab was taken or moved by a concurrent request.
+        The caller owns the transaction; nothing is committed here.
+        """
+        stmt = (
+            update(Cab)
+            .where(Cab.id == cab_id, Cab.current_city_id == city_id, Cab.state == CabState.IDLE)
+            .values(state=CabState.ON_TRIP, version=Cab.version + 1)
+            .returning(Cab.id)
+            .execution_options(synchronize_session=False)
+        )
+        return db.execute(stmt).scalar_one_or_none()
+
+    @staticmethod
+    def claim_cabs(db: Session, city_id: int, cab_ids: list[int]) -> list[int]:
+        """
+        Set-based variant of `claim_cab`: moves every still-IDLE cab of ``cab_ids`` in the
+        city to ON_TRIP with one UPDATE and returns the ids that were actually claimed.
+        """
+        stmt = (
+            update(Cab)
+            .where(Cab.id.in_(cab_ids), Cab.current_city_id == city_id, Cab.state == CabState.IDLE)
+            .values(state=CabState.ON_TRIP, version=Cab.version + 1)
+            .returning(Cab.id)
+            .execution_options(synchronize_session=False)
+        )
+        return db.execute(stmt).scalars().all()
+
+    @staticmethod
+    def release_cabs(db: Session, cab_ids: list[int], idle_since: datetime):
+        """
+        Marks cabs IDLE with one set-based UPDATE, within the caller's transaction.
+        Cabs that cannot transition to IDLE (e.g. already IDLE) are left untouched.
+        Returns ``(id, current_city_id, last_idle_time)`` rows of the released cabs.
+        """
+        stmt = (
+            update(Cab)
+            .where(Cab.id.in_(cab_ids), Cab.state.in_(ALLOWED_SOURCES[CabState.IDLE]))
+            .values(state=CabState.IDLE, last_idle_time=idle_since, version=Cab.version + 1)
+            .returning(Cab.id, Cab.current_city_id, Cab.last_idle_time)
+            .execution_options(synchronize_session=False)
+        )
+        return db.execute(stmt).all()
+
+    @staticmethod
+    def create_cab_history(db: Session, cab_id: int, state: str, commit: bool = True):
+        """
+        Logs a cab's state change in cab_history and its state intervals.
+        With ``commit=False`` the row is only flushed, so it joins the caller's transaction.
+        In buffered history mode the row is handed to the write-behind buffer instead, once
+        the caller's transaction commits.
+        """
+        now = datetime.utcnow()
+        if config.HISTORY_WRITE_MODE == "buffered":
+            history_writer.enqueue_on_commit(db, [(cab_id, state, now)])
+            if commit:
+                db.commit()
+            return
+
         cab_history = CabHistory(
             cab_id=cab_id,
             state=state,
-            timestamp=datetime.utcnow()
+            timestamp=now
         )
         db.add(cab_history)
-        db.commit()
-
-    @staticmethod
-    def get_cab_history(db: Session, cab_id: int):
-        """Fetches cab history sorted by timestamp (latest first)."""
-        return db.query(CabHistory).filter(CabHistory.cab_id == cab_id).order_by(CabHistory.timestamp.desc()).all()
+        StateIntervals.record(db, [(cab_id, state, now)])
+        if commit:
+            db.commit()
+        else:
+            db.flush()
 
     @staticmethod
-    def get_idle_time(db: Session, cab_id: int, start_time: datetime, end_time: datetime):
+    def create_cab_histories(db: Session, entries: list[tuple]):
         """
-        Calculates total idle time for a cab within a given duration.
+        Bulk logs state changes (and their state intervals) in one INSERT, within the caller's transaction.
+        Entries are ``(cab_id, state)`` or ``(cab_id, state, timestamp)``; the timestamp defaults to now.
+        In buffered history mode the rows are handed to the write-behind buffer instead, once
+        the caller's transaction commits.
         """
-        idle_entries = (
-            db.query(CabHistory)
-            .filter(
-                CabHistory.cab_id == cab_id,
-                CabHistory.timestamp >= start_time,
-                CabHistory.timestamp <= end_time,
-            )
-            .order_by(CabHistory.timestamp.asc())
-            .all()
+        if not entries:
+            return
+        now = datetime.utcnow()
+        transitions = [(entry[0], entry[1], entry[2] if len(entry) > 2 else now) for entry in entries]
+        if config.HISTORY_WRITE_MODE == "buffered":
+            history_writer.enqueue_on_commit(db, transitions)
+            return
+        db.execute(
+            insert(CabHistory),
+            [{"cab_id": cab_id, "state": state, "timestamp": timestamp} for cab_id, state, timestamp in transitions],
         )
+        StateIntervals.record(db, transitions)
 
-        total_idle_time = timedelta()
-        last_idle_start = None
+    @staticmethod
+    def get_cab_history(db: Session, cab_id: int):
+        """
+        Fetches cab history sorted by timestamp (latest first).
+        With history partitioning, monthly tables and archived months are included.
+        """
+        if config.HISTORY_PARTITIONING:
+            return list(HistoryPartitions.read_latest_first(db, cab_id))
+        return db.query(CabHistory).filter(CabHistory.cab_id == cab_id).order_by(CabHistory.timestamp.desc()).all()
 
-        # Check the state before `start_time`
-        first_state = (
-            db.query(CabHistory)
-            .filter(
-                CabHistory.cab_id == cab_id,
-                CabHistory.timestamp < start_time
-            )
-            .order_by(CabHistory.timestamp.desc())
-            .first()
-        )
+    @staticmethod
+    def _cab_history_query(cab_id: int, since: Optional[datetime], until: Optional[datetime],
+                           after: Optional[tuple] = None):
+        stmt = select(CabHistory).where(CabHistory.cab_id == cab_id)
+        if since:
+            stmt = stmt.where(CabHistory.timestamp >= since)
+        if until:
+            stmt = stmt.where(CabHistory.timestamp <= until)
+        if after:
+            stmt = stmt.where(tuple_(CabHistory.timestamp, CabHistory.id) < after)
+        return stmt.order_by(CabHistory.timestamp.desc(), CabHistory.id.desc())
 
-        # If cab was already IDLE at start_time, consider from start_time
-        if first_state and first_state.state == CabState.IDLE:
-            last_idle_start = start_time
+    @staticmethod
+    def get_cab_history_page(db: Session, cab_id: int, since: Optional[datetime] = None,
+                             until: Optional[datetime] = None, after: Optional[tuple] = None,
+                             limit: Optional[int] = None):
+        """
+        Fetches cab history within ``[since, until]``, latest first.
+        ``after`` is the ``(timestamp, id)`` of the previous page's last row; every page is one
+        range scan of the (cab_id, timestamp) index. With history partitioning every monthly
+        table is queried with the same cursor and limit, and the results are merged.
+        """
+        if config.HISTORY_PARTITIONING:
+            history = HistoryPartitions.read_latest_first(db, cab_id, since, until, after, batch_size=limit)
+            return list(islice(history, limit)) if limit else list(history)
 
-        for entry in idle_entries:
-            if entry.state == CabState.IDLE and last_idle_start is None:
-                last_idle_start = max(entry.timestamp, start_time)  # Cab went IDLE
+        stmt = CabRepository._cab_history_query(cab_id, since, until, after)
+        if limit:
+            stmt = stmt.limit(limit)
+        return db.scalars(stmt).all()
 
-            elif entry.state != CabState.IDLE and last_idle_start:
-                total_idle_time += entry.timestamp - last_idle_start
-                last_idle_start = None
+    @staticmethod
+    def stream_cab_history(db: Session, cab_id: int, since: Optional[datetime] = None,
+                           until: Optional[datetime] = None) -> Iterator[CabHistory]:
+        """Yields cab history within ``[since, until]``, latest first, ``STREAM_BATCH_SIZE`` rows at a time."""
+        if config.HISTORY_PARTITIONING:
+            yield from HistoryPartitions.read_latest_first(db, cab_id, since, until)
+            return
+        stmt = CabRepository._cab_history_query(cab_id, since, until)
+        yield from db.scalars(stmt, execution_options={"yield_per": config.STREAM_BATCH_SIZE})
 
-            # If the cab is still IDLE at the end time
-        if last_idle_start:
-            total_idle_time += end_time - last_idle_start
+    @staticmethod
+    def get_idle_time(db: Session, cab_id: int, start_time: datetime, end_time: datetime):
+        """
+        Calculates total idle time for a cab within a given duration.
+        Reads the two state intervals containing ``start_time`` and ``end_time``, so the cost does
+        not depend on how much history the window covers (archived months included).
+        """
+        return StateIntervals.idle_time(db, cab_id, start_time, end_time)
 
-        return total_idle_time
+    @staticmethod
+    def get_fleet_idle_times(db: Session, city_id: int, start_time: datetime, end_time: datetime,
+                             most_idle_first: bool = True, limit: Optional[int] = None):
+        """
+        Computes the idle seconds of every cab currently in a city within ``[start_time, end_time]``
+        in one query, with the same semantics as `get_idle_time`: per cab, two correlated index
+        seeks into cab_state_intervals (idle seconds up to the end minus up to the start).
+        Returns ``(cab_id, idle_seconds)`` rows sorted by idle time, cabs without idle time included.
+        """
+        dialect_name = db.get_bind().dialect.name
+        idle_seconds = (
+            func.coalesce(StateIntervals.idle_seconds_at_sql(dialect_name, Cab.id, end_time), 0)
+            - func.coalesce(StateIntervals.idle_seconds_at_sql(dialect_name, Cab.id, start_time), 0)
+        )
+        stmt = (
+            select(Cab.id, idle_seconds.label("idle_seconds"))
+            .where(Cab.current_city_id == city_id)
+            .order_by(idle_seconds.desc() if most_idle_first else idle_seconds.asc(), Cab.id)
+        )
+        if limit:
+            stmt = stmt.limit(limit)
+        return [(cab_id, round(float(seconds), 3)) for cab_id, seconds in db.execute(stmt)]
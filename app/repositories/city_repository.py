@@ -1,30 +1,59 @@
+from typing import Iterator, Optional
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Session
-from sqlalchemy.exc import IntegrityError
+from app.config import config
 from app.models import City
 
 
 class CityRepository:
+    @staticmethod
+    def city_insert(dialect_name: str, city_data: dict):
+        """
+        Builds the INSERT ... ON CONFLICT (name) DO NOTHING statement creating a city.
+        It returns the new city's id and name, or no row when the name is already taken.
+        """
+        dialect_insert = postgresql_insert if dialect_name == "postgresql" else sqlite_insert
+        return (
+            dialect_insert(City).values(**city_data)
+            .on_conflict_do_nothing(index_elements=[City.name])
+            .returning(City.id, City.name)
+        )
+
     @staticmethod
     def create_city(db: Session, city_data: dict):
-        """Creates a new city if it does not exist."""
-        existing_city = db.query(City).filter(City.name == city_data["name"]).first()
-        if existing_city:
-            return None  # Avoid duplicate city names
-        city = City(**city_data)
-        db.add(city)
-        try:
-            db.commit()
-            db.refresh(city)
-            return city
-        except IntegrityError:
-            db.rollback()
-            return None  # Handle duplicate entry error
+        """Creates a new city in one statement; returns None if the name already exists."""
+        row = db.execute(CityRepository.city_insert(db.get_bind().dialect.name, city_data)).first()
+        db.commit()
+        return City(id=row.id, name=row.name) if row else None
 
     @staticmethod
     def get_all_cities(db: Session):
         """Retrieves all registered cities."""
         return db.query(City).all()
 
+    @staticmethod
+    def get_cities_page(db: Session, cursor: Optional[int] = None, limit: Optional[int] = None):
+        """Fetches cities ordered by id, starting after ``cursor`` (keyset pagination)."""
+        stmt = select(City).order_by(City.id.asc())
+        if cursor is not None:
+            stmt = stmt.where(City.id > cursor)
+        if limit:
+            stmt = stmt.limit(limit)
+        return db.scalars(stmt).all()
+
+    @staticmethod
+    def stream_cities(db: Session) -> Iterator[City]:
+        """Yields every city ordered by id, fetching ``STREAM_BATCH_SIZE`` rows at a time."""
+        stmt = select(City).order_by(City.id.asc())
+        yield from db.scalars(stmt, execution_options={"yield_per": config.STREAM_BATCH_SIZE})
+
+    @staticmethod
+    def get_city_names(db: Session) -> list[tuple[int, str]]:
+        """Retrieves ``(id, name)`` of every city in one query."""
+        return [tuple(row) for row in db.execute(select(City.id, City.name)).all()]
+
     @staticmethod
     def get_city_by_id(db: Session, city_id: int):
         """Fetches a city by its ID."""
@@ -0,0 +1,124 @@
+import csv
+import io
+from datetime import datetime
+from typing import Optional
+import numpy as np
+from sqlalchemy import BigInteger, String, case, cast, extract, func, select, type_coerce
+from sqlalchemy.orm import Session
+from app.config import config
+from app.models import Booking, CabHistory
+from app.utils.columnar import STATE_CODES
+
+
+class ColumnarRepository:
+    """
+    Loads cab_history/bookings slices as NumPy arrays for `app.utils.columnar`, and bulk writes
+    rows computed from them. Rows are fetched with chunked Core queries (``ANALYTICS_CHUNK_SIZE``
+    rows per round trip) and converted chunk by chunk, without ORM objects or per-row datetimes.
+    """
+
+    @staticmethod
+    def _load(db: Session, stmt, dtypes: list) -> list[np.ndarray]:
+        """Runs ``stmt`` in chunks and returns one array per column."""
+        chunks = [[] for _ in dtypes]
+        result = db.connection().execute(stmt, execution_options={"yield_per": config.ANALYTICS_CHUNK_SIZE})
+        for partition in result.partitions():
+            for column, values, dtype in zip(chunks, zip(*partition), dtypes):
+                column.append(np.array(values, dtype=dtype))
+        return [np.concatenate(column) if column else np.empty(0, dtype=dtype) for column, dtype in zip(chunks, dtypes)]
+
+    @staticmethod
+    def _timestamp(db: Session, column):
+        """
+        Selects a timestamp in the form NumPy parses fastest: epoch microseconds on PostgreSQL
+        (whose driver would otherwise build a datetime per value), the stored text on SQLite.
+        """
+        if db.get_bind().dialect.name == "postgresql":
+            return cast(extract("epoch", column) * 1000000, BigInteger)
+        return type_coerce(column, String)
+
+    @staticmethod
+    def count_history(db: Session) -> int:
+        return db.execute(select(func.count()).select_from(CabHistory)).scalar_one()
+
+    @staticmethod
+    def load_history(db: Session, cab_ids: Optional[list[int]] = None,
+                     until: Optional[datetime] = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Loads ``(cab_ids, states, timestamps)`` of cab_history, sorted by cab and time.
+        States are mapped to `STATE_CODES` in SQL.
+        """
+        stmt = select(
+            CabHistory.cab_id,
+            case({state: code for state, code in STATE_CODES.items()}, value=CabHistory.state),
+            ColumnarRepository._timestamp(db, CabHistory.timestamp),
+        )
+        if cab_ids is not None:
+            stmt = stmt.where(CabHistory.cab_id.in_(cab_ids))
+        if until:
+            stmt = stmt.where(CabHistory.timestamp <= until)
+        stmt = stmt.order_by(CabHistory.cab_id, CabHistory.timestamp, CabHistory.id)
+
+        cab_column, states, timestamps = ColumnarRepository._load(db, stmt, [np.int64, np.int8, "datetime64[us]"])
+        return cab_column, states, timestamps
+
+    @staticmethod
+    def load_trip_durations(db: Session, city_id: Optional[int] = None, start: Optional[datetime] = None,
+                            end: Optional[datetime] = None) -> np.ndarray:
+        """Seconds between pickup and drop of completed bookings picked up in ``[start, end)``."""
+        stmt = (
+            select(ColumnarRepository._timestamp(db, Booking.pickup_time), ColumnarRepository._timestamp(db, Booking.drop_time))
+            .where(Booking.drop_time.is_not(None), Booking.pickup_time.is_not(None))
+        )
+        if city_id is not None:
+            stmt = stmt.where(Booking.city_id == city_id)
+        if start:
+            stmt = stmt.where(Booking.pickup_time >= start)
+        if end:
+            stmt = stmt.where(Booking.pickup_time < end)
+        pickups, drops = ColumnarRepository._load(db, stmt, ["datetime64[us]", "datetime64[us]"])
+        return (drops - pickups).astype(np.int64) / 1e6
+
+    @staticmethod
+    def load_pickup_times(db: Session, city_id: Optional[int] = None, start: Optional[datetime] = None,
+                          end: Optional[datetime] = None) -> np.ndarray:
+        """Pickup times (naive UTC ``datetime64[us]``) of bookings picked up in ``[start, end)``."""
+        stmt = select(ColumnarRepository._timestamp(db, Booking.pickup_time)).where(Booking.pickup_time.is_not(None))
+        if city_id is not None:
+            stmt = stmt.where(Booking.city_id == city_id)
+        if start:
+            stmt = stmt.where(Booking.pickup_time >= start)
+        if end:
+            stmt = stmt.where(Booking.pickup_time < end)
+        return ColumnarRepository._load(db, stmt, ["datetime64[us]"])[0]
+
+    @staticmethod
+    def format_timestamps(timestamps: np.ndarray) -> list[Optional[str]]:
+        """``datetime64`` values as the database's text form (``YYYY-MM-DD HH:MM:SS.ffffff``); NaT becomes None."""
+        text = np.char.replace(np.datetime_as_string(timestamps, unit="us"), "T", " ").astype(object)
+        text[np.isnat(timestamps)] = None
+        return text.tolist()
+
+    @staticmethod
+    def copy_rows(db: Session, table: str, columns: list[str], rows: list[tuple]):
+        """Streams rows into a table with PostgreSQL COPY on the session's connection."""
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        cursor = db.connection().connection.cursor()
+        try:
+            cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def write_rows(db: Session, table: str, columns: list[str], rows: list[tuple]):
+        """
+        Bulk writes rows whose values are already in the database's text forms, skipping
+        per-value type processing: COPY on PostgreSQL, one executemany INSERT elsewhere.
+        """
+        if db.get_bind().dialect.name == "postgresql":
+            ColumnarRepository.copy_rows(db, table, columns, rows)
+            return
+        placeholders = ", ".join("?" for _ in columns)
+        db.connection().exec_driver_sql(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", rows)
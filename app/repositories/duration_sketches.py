@@ -0,0 +1,156 @@
+import atexit
+import threading
+from datetime import datetime
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from app.config import config
+from app.database import SessionLocal
+from app.models import City, TripDurationSketch
+from app.repositories.columnar_repository import ColumnarRepository
+from app.utils.quantile_sketch import QuantileSketch
+
+
+class DurationSketches:
+    """
+    Per-city trip duration sketches, persisted in ``trip_duration_sketches``.
+
+    Completed trips are added to in-process delta sketches; a background thread merges the
+    deltas into the persisted rows every ``flush_interval_seconds`` (row-locked read-merge-write,
+    so several processes can flush concurrently). Reads merge the persisted sketch with this
+    process's pending delta. Deltas not yet flushed when the process dies are lost, which only
+    thins the sample; it does not bias the quantiles.
+    """
+
+    def __init__(self, session_factory=SessionLocal, relative_accuracy: float = 0.01,
+                 flush_interval_seconds: float = 10):
+        self.session_factory = session_factory
+        self.relative_accuracy = relative_accuracy
+        self.flush_interval = flush_interval_seconds
+        self._pending: dict[int, QuantileSketch] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._thread = None
+
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.flushed_trips = 0
+
+    def add(self, city_id: int, seconds: float):
+        """Records the duration of one completed trip."""
+        with self._lock:
+            if self._thread is None:
+                self._start()
+            sketch = self._pending.get(city_id)
+            if sketch is None:
+                sketch = self._pending[city_id] = QuantileSketch(self.relative_accuracy)
+            sketch.add(seconds)
+
+    def get(self, db: Session, city_id: int) -> QuantileSketch:
+        """The city's persisted sketch merged with this process's unflushed trips (one primary key lookup)."""
+        stored = db.get(TripDurationSketch, city_id)
+        sketch = QuantileSketch.from_dict(stored.sketch) if stored else QuantileSketch(self.relative_accuracy)
+        with self._lock:
+            pending = self._pending.get(city_id)
+            if pending is not None:
+                sketch.merge(pending)
+        return sketch
+
+    def flush(self) -> int:
+        """Merges every pending delta into the database; returns the number of trips written."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+
+            try:
+                with self.session_factory() as db:
+                    DurationSketches.merge_into(db, pending)
+                    db.commit()
+            except SQLAlchemyError:
+                # Fold the deltas back in for the next attempt
+                with self._lock:
+                    for city_id, sketch in pending.items():
+                        if city_id in self._pending:
+                            sketch.merge(self._pending[city_id])
+                        self._pending[city_id] = sketch
+                self.failed_flushes += 1
+                return 0
+
+            trips = sum(sketch.count for sketch in pending.values())
+            self.flushes += 1
+            self.flushed_trips += trips
+            return trips
+
+    @staticmethod
+    def merge_into(db: Session, sketches: dict[int, QuantileSketch]):
+        """Adds sketches to the persisted rows of their cities within the caller's transaction."""
+        now = datetime.utcnow()
+        empty = QuantileSketch(next(iter(sketches.values())).relative_accuracy).to_dict()
+        dialect_insert = postgresql_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+        db.execute(dialect_insert(TripDurationSketch).values([
+            {"city_id": city_id, "sketch": empty, "updated_at": now} for city_id in sketches
+        ]).on_conflict_do_nothing(index_elements=[TripDurationSketch.city_id]))
+
+        rows = db.execute(
+            select(TripDurationSketch).where(TripDurationSketch.city_id.in_(list(sketches))).with_for_update()
+        ).scalars()
+        for row in rows:
+            sketch = QuantileSketch.from_dict(row.sketch)
+            sketch.merge(sketches[row.city_id])
+            row.sketch = sketch.to_dict()
+            row.updated_at = now
+
+    @staticmethod
+    def rebuild(db: Session, relative_accuracy: float) -> int:
+        """Recomputes every city's sketch from its completed bookings; returns the number of trips."""
+        trips = 0
+        db.execute(delete(TripDurationSketch))
+        for city_id in db.execute(select(City.id)).scalars().all():
+            durations = ColumnarRepository.load_trip_durations(db, city_id=city_id)
+            if len(durations):
+                sketch = QuantileSketch(relative_accuracy)
+                sketch.add_many(durations)
+                db.add(TripDurationSketch(city_id=city_id, sketch=sketch.to_dict()))
+                trips += sketch.count
+        db.commit()
+        return trips
+
+    def close(self):
+        """Stops the background thread and flushes what is pending."""
+        self._closed.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        self.flush()
+
+    def metrics(self) -> dict:
+        """Pending trips and flush counters."""
+        with self._lock:
+            pending = sum(sketch.count for sketch in self._pending.values())
+        return {
+            "pending_trips": pending,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "flushed_trips": self.flushed_trips,
+        }
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, name="duration-sketches", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _run(self):
+        while not self._closed.wait(self.flush_interval):
+            self.flush()
+
+
+# Initialize the process-wide trip duration sketches
+duration_sketches = DurationSketches(
+    relative_accuracy=config.TRIP_DURATION_SKETCH_ACCURACY,
+    flush_interval_seconds=config.TRIP_DURATION_FLUSH_SECONDS,
+)
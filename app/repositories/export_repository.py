@@ -0,0 +1,58 @@
+from datetime import datetime
+from typing import Iterator, Optional
+from sqlalchemy import Table, select
+from sqlalchemy.orm import Session
+from app.config import config
+from app.models import Booking
+from app.repositories.history_partitions import HistoryPartitions
+
+# Exportable tables: the columns exported, in order, and the column the time range filters on
+EXPORT_TABLES = {
+    "bookings": (["id", "cab_id", "city_id", "pickup_time", "drop_time", "created_at"], "pickup_time"),
+    "cab_history": (["id", "cab_id", "state", "timestamp"], "timestamp"),
+}
+
+
+class ExportRepository:
+
+    @staticmethod
+    def _tables(db: Session, table: str) -> list[Table]:
+        """Physical tables holding ``table``'s rows (several for partitioned SQLite history)."""
+        if table == "cab_history":
+            return HistoryPartitions.hot_tables(db)
+        return [Booking.__table__]
+
+    @staticmethod
+    def iter_batches(db: Session, table: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                     after_id: Optional[int] = None, batch_size: Optional[int] = None) -> Iterator[list]:
+        """
+        Yields the rows of ``table`` whose time column is within ``[since, until]``, in id order,
+        ``batch_size`` rows at a time. Each batch is a keyset query (``id > last id``) in its own
+        short read transaction, so an export of any size holds neither a snapshot nor locks for
+        longer than one batch, and can resume after any id it has already returned.
+        """
+        columns, time_column = EXPORT_TABLES[table]
+        batch_size = batch_size or config.EXPORT_BATCH_SIZE
+        tables = ExportRepository._tables(db, table)
+        last_id = after_id
+        while True:
+            rows = []
+            for source in tables:
+                stmt = select(*(source.c[name] for name in columns)).order_by(source.c.id).limit(batch_size)
+                if last_id is not None:
+                    stmt = stmt.where(source.c.id > last_id)
+                if since:
+                    stmt = stmt.where(source.c[time_column] >= since)
+                if until:
+                    stmt = stmt.where(source.c[time_column] <= until)
+                rows.extend(db.execute(stmt).all())
+            db.rollback()  # End the read transaction between batches
+
+            if len(tables) > 1:
+                rows = sorted(rows, key=lambda row: row.id)[:batch_size]
+            if not rows:
+                return
+            yield rows
+            if len(rows) < batch_size:
+                return
+            last_id = rows[-1].id
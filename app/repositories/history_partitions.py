@@ -0,0 +1,407 @@
+import bisect
+import gzip
+import heapq
+import json
+import os
+import re
+from datetime import datetime
+from typing import Iterator, Optional
+from sqlalchemy import Column, DateTime, Enum as SQLAlchemyEnum, Index, Integer, MetaData, Table, delete, func, select, text, tuple_
+from sqlalchemy.orm import Session
+from app.config import config
+from app.models import CabHistory
+from app.state_machine import CabState
+
+_PARTITION_NAME = re.compile(r"^cab_history_p(\d{4})(\d{2})$")
+_ARCHIVE_SUFFIX = ".ndjson.gz"
+# Sidecar of an archive file: the byte offset of every gzip member and the first cab_id in it
+_INDEX_SUFFIX = ".idx"
+
+# Table objects of the SQLite per-month tables, created on demand
+_partition_metadata = MetaData()
+
+
+def month_start(moment: datetime) -> datetime:
+    return datetime(moment.year, moment.month, 1)
+
+
+def add_months(month: datetime, months: int) -> datetime:
+    years, month_index = divmod(month.month - 1 + months, 12)
+    return datetime(month.year + years, month_index + 1, 1)
+
+
+class HistoryPartitions:
+    """
+    Monthly partitions of cab_history and their cold archive (``HISTORY_PARTITIONING``).
+
+    - PostgreSQL: cab_history is range partitioned by timestamp. `ensure_partitions` creates
+      the current and next month ahead of time; a DEFAULT partition catches anything else.
+    - SQLite: cab_history holds the open month; `compact` moves every closed month into its
+      own ``cab_history_pYYYYMM`` table.
+    - `archive` moves partitions older than ``HISTORY_HOT_MONTHS`` to gzip NDJSON files
+      (``cab_history_pYYYYMM.ndjson.gz``) sorted by cab and timestamp, then drops them. Each
+      file is a series of gzip members of about ``HISTORY_ARCHIVE_INDEX_ROWS`` rows starting at a
+      cab boundary; a ``.idx`` sidecar maps cab ids to member offsets, so reading one cab
+      decompresses only the members holding it.
+
+    `read`, `read_latest_first` and `read_last_before` stitch the database and the archive back together.
+    """
+
+    @staticmethod
+    def partition_name(month: datetime) -> str:
+        return f"cab_history_p{month:%Y%m}"
+
+    @staticmethod
+    def _partition_month(name: str) -> Optional[datetime]:
+        match = _PARTITION_NAME.match(name)
+        return datetime(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+    @staticmethod
+    def _is_postgres(db: Session) -> bool:
+        return db.get_bind().dialect.name == "postgresql"
+
+    @staticmethod
+    def _table(name: str) -> Table:
+        """Table object of one per-month table (same columns as cab_history)."""
+        if name not in _partition_metadata.tables:
+            Table(
+                name, _partition_metadata,
+                Column("id", Integer, primary_key=True),
+                Column("cab_id", Integer, nullable=False),
+                Column("state", SQLAlchemyEnum(CabState), nullable=False),
+                Column("timestamp", DateTime, nullable=False),
+                Index(f"ix_{name}_cab_id_timestamp", "cab_id", "timestamp"),
+            )
+        return _partition_metadata.tables[name]
+
+    @staticmethod
+    def list_partitions(db: Session) -> dict[datetime, str]:
+        """Returns the monthly partitions present in the database, oldest first."""
+        if HistoryPartitions._is_postgres(db):
+            names = db.execute(text(
+                "SELECT child.relname FROM pg_inherits "
+                "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+                "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+                "WHERE parent.relname = 'cab_history'"
+            )).scalars()
+        else:
+            names = db.execute(text(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'cab_history_p%'"
+            )).scalars()
+
+        partitions = {}
+        for name in names:
+            month = HistoryPartitions._partition_month(name)
+            if month:
+                partitions[month] = name
+        return dict(sorted(partitions.items()))
+
+    @staticmethod
+    def archived_months(archive_dir: str = None) -> dict[datetime, str]:
+        """Returns the archive files by month, oldest first."""
+        archive_dir = archive_dir or config.HISTORY_ARCHIVE_DIR
+        if not os.path.isdir(archive_dir):
+            return {}
+        archived = {}
+        for filename in os.listdir(archive_dir):
+            if filename.endswith(_ARCHIVE_SUFFIX):
+                month = HistoryPartitions._partition_month(filename[:-len(_ARCHIVE_SUFFIX)])
+                if month:
+                    archived[month] = os.path.join(archive_dir, filename)
+        return dict(sorted(archived.items()))
+
+    @staticmethod
+    def ensure_partitions(db: Session, now: Optional[datetime] = None, months_ahead: int = 1) -> list[str]:
+        """
+        PostgreSQL only: creates the DEFAULT partition and the partitions of the current
+        and the next ``months_ahead`` months. Returns the monthly partition names.
+        """
+        if not HistoryPartitions._is_postgres(db):
+            return []
+        db.execute(text("CREATE TABLE IF NOT EXISTS cab_history_default PARTITION OF cab_history DEFAULT"))
+        current = month_start(now or datetime.utcnow())
+        names = []
+        for offset in range(months_ahead + 1):
+            month = add_months(current, offset)
+            name = HistoryPartitions.partition_name(month)
+            db.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF cab_history "
+                f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{add_months(month, 1):%Y-%m-%d}')"
+            ))
+            names.append(name)
+        db.commit()
+        return names
+
+    @staticmethod
+    def compact(db: Session, now: Optional[datetime] = None) -> dict[str, int]:
+        """
+        SQLite only: moves the rows of every closed month out of cab_history into its
+        ``cab_history_pYYYYMM`` table, one transaction per month. Returns rows moved per table.
+        """
+        if HistoryPartitions._is_postgres(db):
+            return {}
+        current = month_start(now or datetime.utcnow())
+        moved = {}
+        while True:
+            # Every pass empties the oldest closed month, so only months with rows get a table
+            oldest = db.execute(select(func.min(CabHistory.timestamp)).where(CabHistory.timestamp < current)).scalar()
+            if oldest is None:
+                break
+            month = month_start(oldest)
+            in_month = (CabHistory.timestamp >= month, CabHistory.timestamp < add_months(month, 1))
+            table = HistoryPartitions._table(HistoryPartitions.partition_name(month))
+            table.create(db.connection(), checkfirst=True)
+            result = db.execute(table.insert().from_select(
+                ["id", "cab_id", "state", "timestamp"],
+                select(CabHistory.id, CabHistory.cab_id, CabHistory.state, CabHistory.timestamp).where(*in_month),
+            ))
+            db.execute(delete(CabHistory).where(*in_month))
+            db.commit()
+            moved[table.name] = result.rowcount
+        return moved
+
+    @staticmethod
+    def archive(db: Session, archive_dir: str = None, hot_months: int = None,
+                now: Optional[datetime] = None) -> dict[str, int]:
+        """
+        Exports every partition older than the hot window to a gzip NDJSON file and drops it.
+        The file is complete before the partition is dropped, so a failed run never loses rows.
+        Returns the number of rows archived per partition.
+        """
+        archive_dir = archive_dir or config.HISTORY_ARCHIVE_DIR
+        hot_months = hot_months or config.HISTORY_HOT_MONTHS
+        cutoff = add_months(month_start(now or datetime.utcnow()), 1 - hot_months)
+        os.makedirs(archive_dir, exist_ok=True)
+
+        archived = {}
+        for month, name in HistoryPartitions.list_partitions(db).items():
+            if month >= cutoff:
+                continue
+            path = os.path.join(archive_dir, name + _ARCHIVE_SUFFIX)
+            table = HistoryPartitions._table(name)
+            previous = iter(())
+            if os.path.exists(path):
+                # Late rows for an already archived month: merge them into the existing file,
+                # skipping ids a previously interrupted run already wrote
+                in_database = set(db.execute(select(table.c.id)).scalars())
+                previous = (record for record in HistoryPartitions._read_records(path) if record["id"] not in in_database)
+
+            result = db.execute(
+                select(table).order_by(table.c.cab_id, table.c.timestamp),
+                execution_options={"yield_per": config.HISTORY_ARCHIVE_BATCH_SIZE},
+            )
+            records = ({
+                "id": row.id, "cab_id": row.cab_id,
+                "state": CabState(row.state).value, "timestamp": row.timestamp.isoformat(),
+            } for row in result)
+
+            merged = heapq.merge(previous, records, key=lambda record: (record["cab_id"], record["timestamp"]))
+            rows = HistoryPartitions._write_archive(path, merged)
+
+            if HistoryPartitions._is_postgres(db):
+                db.execute(text(f"ALTER TABLE cab_history DETACH PARTITION {name}"))
+            db.execute(text(f"DROP TABLE {name}"))
+            db.commit()
+            archived[name] = rows
+        return archived
+
+    @staticmethod
+    def _write_archive(path: str, records: Iterator[dict]) -> int:
+        """
+        Writes cab-sorted records to ``path`` and its index, a new gzip member starting at the
+        first cab boundary after every ``HISTORY_ARCHIVE_INDEX_ROWS`` rows. Returns the rows written.
+        """
+        index, rows, member_rows, member, previous_cab = [], 0, 0, None, None
+        with open(path + ".tmp", "wb") as raw_file:
+            for record in records:
+                if member is None or (member_rows >= config.HISTORY_ARCHIVE_INDEX_ROWS and record["cab_id"] != previous_cab):
+                    if member is not None:
+                        member.close()  # Leaves raw_file open
+                    index.append([record["cab_id"], raw_file.tell()])
+                    member, member_rows = gzip.GzipFile(fileobj=raw_file, mode="wb"), 0
+                member.write((json.dumps(record) + "\n").encode("utf-8"))
+                member_rows += 1
+                rows += 1
+                previous_cab = record["cab_id"]
+            if member is not None:
+                member.close()
+            size = raw_file.tell()
+
+        with open(path + _INDEX_SUFFIX + ".tmp", "w", encoding="utf-8") as index_file:
+            json.dump({"size": size, "members": index}, index_file)
+        os.replace(path + ".tmp", path)
+        os.replace(path + _INDEX_SUFFIX + ".tmp", path + _INDEX_SUFFIX)
+        return rows
+
+    @staticmethod
+    def _archive_offset(path: str, cab_id: int) -> int:
+        """
+        Byte offset of the gzip member where a cab's rows start, from the archive's index.
+        Falls back to the start of the file for archives without a (matching) index.
+        """
+        try:
+            with open(path + _INDEX_SUFFIX, encoding="utf-8") as index_file:
+                index = json.load(index_file)
+        except (OSError, ValueError):
+            return 0
+        if index.get("size") != os.path.getsize(path):
+            return 0  # Index left behind by an interrupted run
+        members = index["members"]
+        position = bisect.bisect_right([first_cab for first_cab, _ in members], cab_id) - 1
+        return members[position][1] if position >= 0 else 0
+
+    @staticmethod
+    def _read_records(path: str, offset: int = 0) -> Iterator[dict]:
+        with open(path, "rb") as raw_file:
+            raw_file.seek(offset)
+            with gzip.open(raw_file, "rt", encoding="utf-8") as archive_file:
+                for line in archive_file:
+                    yield json.loads(line)
+
+    @staticmethod
+    def _read_archive(path: str, cab_id: int, since: Optional[datetime], until: Optional[datetime]) -> Iterator[CabHistory]:
+        """
+        Streams one cab's rows from an archive file, oldest first. Reading starts at the
+        cab's member (see `_archive_offset`) and stops past the cab.
+        """
+        for record in HistoryPartitions._read_records(path, HistoryPartitions._archive_offset(path, cab_id)):
+            if record["cab_id"] < cab_id:
+                continue
+            if record["cab_id"] > cab_id:
+                break
+            timestamp = datetime.fromisoformat(record["timestamp"])
+            if (since and timestamp < since) or (until and timestamp > until):
+                continue
+            yield CabHistory(id=record["id"], cab_id=cab_id, state=CabState(record["state"]), timestamp=timestamp)
+
+    @staticmethod
+    def hot_tables(db: Session) -> list[Table]:
+        """Tables holding the history that is still in the database."""
+        if HistoryPartitions._is_postgres(db):
+            return [CabHistory.__table__]  # Partitions are read through the parent
+        partitions = HistoryPartitions.list_partitions(db).values()
+        return [CabHistory.__table__] + [HistoryPartitions._table(name) for name in partitions]
+
+    @staticmethod
+    def read(db: Session, cab_id: int, since: Optional[datetime] = None,
+             until: Optional[datetime] = None) -> list[CabHistory]:
+        """Returns a cab's history within ``[since, until]`` from every partition and the archive, oldest first."""
+        entries = {}
+        for month, path in HistoryPartitions.archived_months().items():
+            if (until and month > until) or (since and add_months(month, 1) <= since):
+                continue
+            entries.update((entry.id, entry) for entry in HistoryPartitions._read_archive(path, cab_id, since, until))
+
+        # Database rows win over duplicates left by an interrupted archive run
+        for table in HistoryPartitions.hot_tables(db):
+            stmt = select(table.c.id, table.c.cab_id, table.c.state, table.c.timestamp).where(table.c.cab_id == cab_id)
+            if since:
+                stmt = stmt.where(table.c.timestamp >= since)
+            if until:
+                stmt = stmt.where(table.c.timestamp <= until)
+            entries.update((row.id, CabHistory(**row._mapping)) for row in db.execute(stmt))
+
+        return sorted(entries.values(), key=lambda entry: (entry.timestamp, entry.id))
+
+    @staticmethod
+    def read_latest_first(db: Session, cab_id: int, since: Optional[datetime] = None,
+                          until: Optional[datetime] = None, after: Optional[tuple] = None,
+                          batch_size: int = None) -> Iterator[CabHistory]:
+        """
+        Lazily yields a cab's history within ``[since, until]``, latest first, from every
+        partition and the archive. ``after`` is the ``(timestamp, id)`` the previous page ended at.
+
+        Every table is read in keyset pages of ``batch_size`` rows (latest first, cursor pushed
+        into the query) and the tables and archive files are merged with `heapq.merge`. A
+        monthly table or archive file is only queried or opened once the merge reaches its month,
+        so a short page never touches older months.
+        """
+        batch_size = batch_size or config.STREAM_BATCH_SIZE
+        sources = []
+        for table in HistoryPartitions.hot_tables(db):
+            month = HistoryPartitions._partition_month(table.name)
+            rows = HistoryPartitions._read_table_latest_first(db, table, cab_id, since, until, after, batch_size)
+            sources.append(HistoryPartitions._from_month(month, rows) if month else rows)
+
+        for month, path in reversed(HistoryPartitions.archived_months().items()):
+            if (until and month > until) or (since and add_months(month, 1) <= since) or (after and month > after[0]):
+                continue
+            rows = HistoryPartitions._read_archive_latest_first(path, cab_id, since, until, after)
+            sources.append(HistoryPartitions._from_month(month, rows))
+
+        # Equal keys come out in source order, so database rows win over duplicates left by an
+        # interrupted archive run
+        last_key = None
+        for timestamp, entry_id, entry in heapq.merge(*sources, key=lambda item: item[:2], reverse=True):
+            if entry is None or (timestamp, entry_id) == last_key:
+                continue
+            last_key = (timestamp, entry_id)
+            yield entry
+
+    @staticmethod
+    def _from_month(month: datetime, rows: Iterator[tuple]) -> Iterator[tuple]:
+        """
+        Puts a placeholder keyed by the end of ``month`` ahead of that month's rows, so
+        `heapq.merge` only pulls the rows (and runs their query) once it is past every later row.
+        """
+        yield add_months(month, 1), 0, None
+        yield from rows
+
+    @staticmethod
+    def _read_table_latest_first(db: Session, table: Table, cab_id: int, since: Optional[datetime],
+                                 until: Optional[datetime], after: Optional[tuple], batch_size: int) -> Iterator[tuple]:
+        """Yields ``(timestamp, id, entry)`` of one table, latest first, one keyset page per query."""
+        while True:
+            stmt = select(table.c.id, table.c.cab_id, table.c.state, table.c.timestamp).where(table.c.cab_id == cab_id)
+            if since:
+                stmt = stmt.where(table.c.timestamp >= since)
+            if until:
+                stmt = stmt.where(table.c.timestamp <= until)
+            if after:
+                stmt = stmt.where(tuple_(table.c.timestamp, table.c.id) < after)
+            rows = db.execute(
+                stmt.order_by(table.c.timestamp.desc(), table.c.id.desc()).limit(batch_size)
+            ).all()
+            for row in rows:
+                yield row.timestamp, row.id, CabHistory(**row._mapping)
+            if len(rows) < batch_size:
+                return
+            after = (rows[-1].timestamp, rows[-1].id)
+
+    @staticmethod
+    def _read_archive_latest_first(path: str, cab_id: int, since: Optional[datetime],
+                                   until: Optional[datetime], after: Optional[tuple]) -> Iterator[tuple]:
+        """Yields ``(timestamp, id, entry)`` of one cab in an archive file, latest first (one cab-month in memory)."""
+        entries = [entry for entry in HistoryPartitions._read_archive(path, cab_id, since, until)
+                   if not after or (entry.timestamp, entry.id) < after]
+        entries.sort(key=lambda entry: (entry.timestamp, entry.id), reverse=True)
+        for entry in entries:
+            yield entry.timestamp, entry.id, entry
+
+    @staticmethod
+    def read_last_before(db: Session, cab_id: int, before: datetime) -> Optional[CabHistory]:
+        """Returns a cab's latest history row strictly before ``before``, looking in the archive last."""
+        latest = None
+        for table in HistoryPartitions.hot_tables(db):
+            row = db.execute(
+                select(table.c.id, table.c.cab_id, table.c.state, table.c.timestamp)
+                .where(table.c.cab_id == cab_id, table.c.timestamp < before)
+                .order_by(table.c.timestamp.desc())
+                .limit(1)
+            ).first()
+            if row and (latest is None or row.timestamp > latest.timestamp):
+                latest = CabHistory(**row._mapping)
+        if latest:
+            return latest
+
+        for month, path in reversed(HistoryPartitions.archived_months().items()):
+            if month >= before:
+                continue
+            last = None
+            for entry in HistoryPartitions._read_archive(path, cab_id, None, before):
+                if entry.timestamp >= before:
+                    break
+                last = entry
+            if last:
+                return last
+        return None
@@ -0,0 +1,294 @@
+import atexit
+import json
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from sqlalchemy import event, insert
+from sqlalchemy.exc import DBAPIError, OperationalError, SQLAlchemyError, TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import Session
+from app.config import config
+from app.database import SessionLocal
+from app.models import CabHistory
+from app.repositories.state_intervals import StateIntervals
+from app.utils.ttl_cache import analytics_cache
+
+logger = logging.getLogger(__name__)
+
+# Session.info keys: rows waiting for their transaction to commit, and "the ending transaction committed"
+_PENDING = "history_writer.pending"
+_COMMITTED = "history_writer.committed"
+
+
+class HistoryWriter:
+    """
+    Write-behind buffer for ``cab_history`` rows (``HISTORY_WRITE_MODE=buffered``).
+
+    Transitions are appended to a bounded in-process buffer and inserted in bulk by a
+    background thread once ``flush_size`` rows are queued or ``flush_interval_ms`` has
+    passed. When the buffer is full, writers block until the next flush makes room; writers
+    that must not block (the event loop under ``DB_MODE=async``) hand the overflow to a
+    single background thread that waits instead, so rows still reach the buffer in order.
+    The buffer is drained on shutdown; rows still buffered when the process dies are lost.
+
+    Rows stay in the buffer until they are written, so it never grows past ``max_size``.
+    A flush that fails on a transient error (lost connection, lock timeout) is retried up to
+    ``max_retries`` times; any other error is isolated row by row, and rows that cannot be
+    written are appended to the ``dead_letter_path`` NDJSON file instead of blocking the buffer.
+    """
+
+    def __init__(self, session_factory=SessionLocal, max_size: int = 10000, flush_size: int = 500,
+                 flush_interval_ms: float = 200, max_retries: int = 5, dead_letter_path: str = "history_dead_letter.ndjson"):
+        self.session_factory = session_factory
+        self.max_size = max_size
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_retries = max_retries
+        self.dead_letter_path = dead_letter_path
+        self._retries = 0  # Consecutive transient failures of the rows at the head of the buffer
+        self._buffer = deque()
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        self._overflow = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-overflow")
+        self._overflowing = 0  # Hand-offs queued on the overflow thread and not yet buffered
+
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.flushed_rows = 0
+        self.dead_lettered_rows = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    def enqueue(self, cab_id: int, state: str, timestamp: datetime):
+        """Buffers one history row, blocking while the buffer is full."""
+        with self._condition:
+            if self._thread is None:
+                self._start()
+            while len(self._buffer) >= self.max_size:
+                self._condition.wait()
+            self._append(cab_id, state, timestamp)
+
+    def enqueue_nowait(self, transitions: list[tuple]):
+        """
+        Buffers ``(cab_id, state, timestamp)`` rows without blocking. Rows that do not fit are
+        handed to the overflow thread, and later rows queue behind them until they are buffered.
+        """
+        transitions = list(transitions)
+        with self._condition:
+            if self._thread is None:
+                self._start()
+            while transitions and not self._overflowing and len(self._buffer) < self.max_size:
+                self._append(*transitions.pop(0))
+            if not transitions:
+                return
+            self._overflowing += 1
+        self._overflow.submit(self._enqueue_overflow, transitions)
+
+    def _enqueue_overflow(self, transitions: list[tuple]):
+        try:
+            for transition in transitions:
+                self.enqueue(*transition)
+        finally:
+            with self._condition:
+                self._overflowing -= 1
+                self._condition.notify_all()
+
+    def _append(self, cab_id: int, state: str, timestamp: datetime):
+        # Callers hold self._condition
+        self._buffer.append({"cab_id": cab_id, "state": state, "timestamp": timestamp})
+        if len(self._buffer) >= self.flush_size:
+            self._condition.notify_all()
+
+    def enqueue_on_commit(self, session: Session, transitions: list[tuple], block: bool = True):
+        """
+        Buffers ``(cab_id, state, timestamp)`` rows once the session's current transaction
+        (or savepoint, and then its enclosing transaction) commits. Rows of a transaction that
+        rolls back are dropped, so a failed booking or state change leaves no history behind.
+        With ``block=False`` the commit never waits for room in the buffer, see `enqueue_nowait`.
+        """
+        transaction = session.get_nested_transaction() or session.get_transaction()
+        if transaction is None:
+            if not block:
+                self.enqueue_nowait(transitions)
+                return
+            for transition in transitions:
+                self.enqueue(*transition)
+            return
+        pending = session.info.setdefault(_PENDING, {})
+        pending.setdefault(transaction, []).extend((self, transition, block) for transition in transitions)
+
+    def flush(self) -> int:
+        """Inserts everything buffered so far in one statement; returns the number of rows written."""
+        with self._flush_lock:
+            with self._condition:
+                rows = list(self._buffer)
+            if not rows:
+                return 0
+
+            started = time.perf_counter()
+            try:
+                with self.session_factory() as db:
+                    db.execute(insert(CabHistory), rows)
+                    StateIntervals.record(db, [(row["cab_id"], row["state"], row["timestamp"]) for row in rows])
+                    db.commit()
+                written = rows
+            except SQLAlchemyError as e:
+                self.failed_flushes += 1
+                if HistoryWriter._is_transient(e) and self._retries < self.max_retries:
+                    self._retries += 1  # Rows stay buffered, in order, for the next attempt
+                    return 0
+                written = self._flush_rows_one_by_one(rows)
+
+            self._retries = 0
+            with self._condition:
+                for _ in rows:
+                    self._buffer.popleft()
+                self._condition.notify_all()
+            if not written:
+                return 0
+
+            # Idle times are derived from the intervals written here, not at enqueue time
+            analytics_cache.invalidate(*{("cab", row["cab_id"]) for row in written})
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.flushes += 1
+            self.flushed_rows += len(written)
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            self._total_flush_ms += elapsed_ms
+            return len(written)
+
+    @staticmethod
+    def _is_transient(error: SQLAlchemyError) -> bool:
+        """Errors worth retrying as is: the database was unreachable or busy, not the rows wrong."""
+        return (isinstance(error, (OperationalError, PoolTimeoutError))
+                or (isinstance(error, DBAPIError) and error.connection_invalidated))
+
+    def _flush_rows_one_by_one(self, rows: list[dict]) -> list[dict]:
+        """Writes each row in its own savepoint and dead-letters the ones that fail; returns the rows written."""
+        written, failed = [], []
+        try:
+            with self.session_factory() as db:
+                for row in rows:
+                    try:
+                        with db.begin_nested():
+                            db.execute(insert(CabHistory), [row])
+                            StateIntervals.record(db, [(row["cab_id"], row["state"], row["timestamp"])])
+                        written.append(row)
+                    except SQLAlchemyError:
+                        failed.append(row)
+                db.commit()
+        except SQLAlchemyError:
+            written, failed = [], rows
+        self._dead_letter(failed)
+        return written
+
+    def _dead_letter(self, rows: list[dict]):
+        if not rows:
+            return
+        self.dead_lettered_rows += len(rows)
+        logger.error("Dead-lettering %d cab history rows to %s", len(rows), self.dead_letter_path)
+        try:
+            with open(self.dead_letter_path, "a", encoding="utf-8") as dead_letter_file:
+                for row in rows:
+                    dead_letter_file.write(json.dumps({
+                        "cab_id": row["cab_id"], "state": str(getattr(row["state"], "value", row["state"])),
+                        "timestamp": row["timestamp"].isoformat(),
+                    }) + "\n")
+        except OSError:
+            logger.exception("Could not write the cab history dead-letter file; rows: %s", rows)
+
+    def close(self):
+        """Stops the background thread and drains the buffer."""
+        with self._condition:
+            # Overflowing rows still need the background thread to make room for them
+            self._condition.wait_for(lambda: not self._overflowing)
+            self._closed = True
+            self._condition.notify_all()
+            thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        # Transient failures are retried (with a pause) until the rows are written or dead-lettered
+        while self._buffer:
+            if not self.flush() and self._retries:
+                time.sleep(self.flush_interval)
+
+    def metrics(self) -> dict:
+        """Buffer depth and flush latency counters."""
+        return {
+            "mode": config.HISTORY_WRITE_MODE,
+            "buffer_depth": len(self._buffer),
+            "buffer_capacity": self.max_size,
+            "overflowing_handoffs": self._overflowing,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "flushed_rows": self.flushed_rows,
+            "dead_lettered_rows": self.dead_lettered_rows,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "max_flush_ms": round(self.max_flush_ms, 3),
+            "avg_flush_ms": round(self._total_flush_ms / self.flushes, 3) if self.flushes else 0.0,
+        }
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                # After a failed flush, wait longer before each retry instead of retrying on every enqueue
+                self._condition.wait_for(
+                    lambda: self._closed or (len(self._buffer) >= self.flush_size and not self._retries),
+                    timeout=self.flush_interval * (1 + self._retries),
+                )
+                if self._closed:
+                    return
+            self.flush()
+
+
+@event.listens_for(Session, "after_commit")
+def _mark_committed(session: Session):
+    # Fires for released savepoints too, always right before their after_transaction_end
+    if session.info.get(_PENDING):
+        session.info[_COMMITTED] = True
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _hand_over_pending_rows(session: Session, transaction):
+    """Moves a released savepoint's rows to its parent, buffers a committed transaction's rows, drops the rest."""
+    committed = session.info.pop(_COMMITTED, False)
+    pending = session.info.get(_PENDING)
+    if not pending:
+        return
+    if transaction.parent is not None:
+        rows = pending.pop(transaction, [])
+        if committed:
+            pending.setdefault(transaction.parent, []).extend(rows)
+        return
+
+    rows = session.info.pop(_PENDING).get(transaction, [])
+    if not committed:
+        return
+    nowait = {}
+    for writer, transition, block in rows:
+        if block:
+            writer.enqueue(*transition)
+        else:
+            nowait.setdefault(writer, []).append(transition)
+    for writer, transitions in nowait.items():
+        writer.enqueue_nowait(transitions)
+
+
+# Initialize the process-wide history writer (only used in buffered mode)
+history_writer = HistoryWriter(
+    max_size=config.HISTORY_BUFFER_MAX_SIZE,
+    flush_size=config.HISTORY_FLUSH_SIZE,
+    flush_interval_ms=config.HISTORY_FLUSH_INTERVAL_MS,
+    max_retries=config.HISTORY_FLUSH_MAX_RETRIES,
+    dead_letter_path=config.HISTORY_DEAD_LETTER_PATH,
+)
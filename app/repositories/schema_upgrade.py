@@ -0,0 +1,44 @@
+from sqlalchemy import inspect
+from sqlalchemy.engine import Engine
+import app.models  # Registers every table on Base.metadata
+from app.database import Base
+
+# Columns added to existing tables since the first release: table -> column -> DDL type and default.
+# `create_all` only creates missing tables, so these are added in place.
+ADDED_COLUMNS = {
+    "cabs": {"version": "INTEGER NOT NULL DEFAULT 0"},
+}
+
+
+class SchemaUpgrade:
+    """
+    Brings a database created by an earlier release up to the current models.
+    Every step is idempotent, so it runs at startup and from ``python -m app.cli upgrade-schema``.
+    """
+
+    @staticmethod
+    def upgrade(bind: Engine) -> list[str]:
+        """Adds missing columns and indexes to existing tables. Returns the steps that were applied."""
+        applied = []
+        with bind.begin() as conn:
+            inspector = inspect(conn)
+            tables = set(inspector.get_table_names())
+            for table_name, columns in ADDED_COLUMNS.items():
+                if table_name not in tables:
+                    continue  # Created by create_all with every column
+                existing = {column["name"] for column in inspector.get_columns(table_name)}
+                for column_name, ddl in columns.items():
+                    if column_name not in existing:
+                        conn.exec_driver_sql(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {ddl}")
+                        applied.append(f"column {table_name}.{column_name}")
+
+            for table in Base.metadata.sorted_tables:
+                if table.name not in tables:
+                    continue
+                before = {index["name"] for index in inspect(conn).get_indexes(table.name)}
+                for index in table.indexes:
+                    # Skips existing indexes and the variants meant for another dialect (`ddl_if`)
+                    index.create(conn, checkfirst=True)
+                after = {index["name"] for index in inspect(conn).get_indexes(table.name)}
+                applied.extend(f"index {name}" for name in sorted(after - before))
+        return applied
@@ -0,0 +1,223 @@
+from datetime import datetime, timedelta
+from itertools import groupby
+from typing import Iterable, Iterator, Optional
+from sqlalchemy import case, delete, extract, func, insert, select, update
+from sqlalchemy.orm import Session
+from app.config import config
+from app.models import Cab, CabHistory, CabStateInterval
+from app.repositories.columnar_repository import ColumnarRepository
+from app.repositories.history_partitions import HistoryPartitions
+from app.state_machine import CabState
+from app.utils.columnar import STATES, fold_intervals
+
+_REBUILD_BATCH_SIZE = 5000
+
+
+class StateIntervals:
+    """
+    The ``cab_state_intervals`` table: cab history folded into one row per stretch in a state.
+
+    Every cab_history write also passes its transitions to `record`, which closes the cab's open
+    interval and opens the next one in the same transaction. Each interval carries the cab's idle
+    seconds before it started, so idle time up to a moment is one index seek (`idle_seconds_at`)
+    and idle time within a window is the difference of two.
+
+    Transitions are expected in timestamp order per cab, which holds because state changes of a
+    cab are serialized by its conditional UPDATE; a late one is applied at the start of the open
+    interval. `rebuild` recomputes the table from cab_history.
+    """
+
+    @staticmethod
+    def _fold(cab_id: int, current: Optional[dict], transitions: Iterable[tuple]) -> list[dict]:
+        """
+        Applies ``(timestamp, state)`` transitions of one cab, oldest first, to its open interval
+        ``current`` (updated in place). Returns the new intervals; the last one is left open.
+        """
+        created = []
+        for timestamp, state in transitions:
+            state = CabState(state)
+            if current is not None and state == current["state"]:
+                continue  # Repeated state: the open interval goes on
+            if current is not None and timestamp <= current["start"]:
+                current["state"] = state  # Same instant: the later state wins
+                continue
+
+            cumulative = 0.0
+            if current is not None:
+                current["end"] = timestamp
+                cumulative = current["cumulative_idle_before"]
+                if current["state"] == CabState.IDLE:
+                    cumulative += (timestamp - current["start"]).total_seconds()
+            current = {"cab_id": cab_id, "start": timestamp, "end": None, "state": state,
+                       "cumulative_idle_before": cumulative}
+            created.append(current)
+        return created
+
+    @staticmethod
+    def record(db: Session, transitions: list[tuple]):
+        """
+        Folds ``(cab_id, state, timestamp)`` transitions into the intervals within the caller's
+        transaction: one SELECT of the cabs' open intervals, then one bulk UPDATE and INSERT.
+        """
+        if not transitions:
+            return
+        by_cab = {}
+        for cab_id, state, timestamp in sorted(transitions, key=lambda entry: (entry[0], entry[2])):
+            by_cab.setdefault(cab_id, []).append((timestamp, state))
+
+        open_intervals = {
+            row.cab_id: dict(row._mapping)
+            for row in db.execute(
+                select(CabStateInterval.cab_id, CabStateInterval.start, CabStateInterval.end,
+                       CabStateInterval.state, CabStateInterval.cumulative_idle_before)
+                .where(CabStateInterval.cab_id.in_(by_cab), CabStateInterval.end.is_(None))
+            )
+        }
+
+        updated, created = [], []
+        for cab_id, cab_transitions in by_cab.items():
+            current = open_intervals.get(cab_id)
+            before = dict(current) if current else None
+            created.extend(StateIntervals._fold(cab_id, current, cab_transitions))
+            if current != before:
+                updated.append({key: current[key] for key in ("cab_id", "start", "end", "state")})
+
+        if updated:
+            db.execute(update(CabStateInterval).execution_options(synchronize_session=False), updated)
+        if created:
+            db.execute(insert(CabStateInterval), created)
+
+    @staticmethod
+    def idle_seconds_at(db: Session, cab_id: int, moment: datetime) -> float:
+        """Idle seconds a cab accumulated up to ``moment``, from the interval containing it."""
+        interval = db.execute(
+            select(CabStateInterval.start, CabStateInterval.state, CabStateInterval.cumulative_idle_before)
+            .where(CabStateInterval.cab_id == cab_id, CabStateInterval.start <= moment)
+            .order_by(CabStateInterval.start.desc())
+            .limit(1)
+        ).first()
+        if interval is None:
+            return 0.0
+        idle_seconds = interval.cumulative_idle_before
+        if interval.state == CabState.IDLE:
+            idle_seconds += (moment - interval.start).total_seconds()
+        return idle_seconds
+
+    @staticmethod
+    def states_at(db: Session, city_id: int, moment: datetime) -> list[tuple[int, Optional[CabState]]]:
+        """State of every cab currently in a city at ``moment`` (None before its first interval), one seek per cab."""
+        state = (
+            select(CabStateInterval.state)
+            .where(CabStateInterval.cab_id == Cab.id, CabStateInterval.start <= moment)
+            .order_by(CabStateInterval.start.desc())
+            .limit(1)
+            .scalar_subquery()
+        )
+        return db.execute(select(Cab.id, state).where(Cab.current_city_id == city_id)).all()
+
+    @staticmethod
+    def stream_changes(db: Session, city_id: int, start: datetime, end: datetime) -> Iterator[tuple[int, CabState, datetime]]:
+        """
+        Streams the ``(cab_id, state, timestamp)`` state changes of the cabs currently in a city
+        strictly within ``(start, end)``, in timestamp order: one interval range per cab.
+        """
+        stmt = (
+            select(CabStateInterval.cab_id, CabStateInterval.state, CabStateInterval.start)
+            .where(
+                CabStateInterval.cab_id.in_(select(Cab.id).where(Cab.current_city_id == city_id)),
+                CabStateInterval.start > start,
+                CabStateInterval.start < end,
+            )
+            .order_by(CabStateInterval.start, CabStateInterval.cab_id)
+        )
+        yield from db.execute(stmt, execution_options={"yield_per": config.STREAM_BATCH_SIZE})
+
+    @staticmethod
+    def idle_time(db: Session, cab_id: int, start_time: datetime, end_time: datetime) -> timedelta:
+        """Idle time of a cab within ``[start_time, end_time]``: two index seeks and a subtraction."""
+        idle_seconds = (StateIntervals.idle_seconds_at(db, cab_id, end_time)
+                        - StateIntervals.idle_seconds_at(db, cab_id, start_time))
+        return timedelta(seconds=idle_seconds)
+
+    @staticmethod
+    def seconds_between(dialect_name: str, start, end):
+        """Dialect-specific SQL expression for the number of seconds from ``start`` to ``end``."""
+        if dialect_name == "postgresql":
+            return extract("epoch", end - start)
+        return (func.julianday(end) - func.julianday(start)) * 86400
+
+    @staticmethod
+    def idle_seconds_at_sql(dialect_name: str, cab_id, moment: datetime):
+        """`idle_seconds_at` as a correlated scalar subquery for the cab id expression ``cab_id``."""
+        elapsed = StateIntervals.seconds_between(dialect_name, CabStateInterval.start, moment)
+        return (
+            select(CabStateInterval.cumulative_idle_before
+                   + case((CabStateInterval.state == CabState.IDLE, elapsed), else_=0))
+            .where(CabStateInterval.cab_id == cab_id, CabStateInterval.start <= moment)
+            .order_by(CabStateInterval.start.desc())
+            .limit(1)
+            .scalar_subquery()
+        )
+
+    @staticmethod
+    def _history(db: Session) -> Iterator[tuple]:
+        """Yields every cab_history ``(cab_id, state, timestamp)``, ordered by cab and time."""
+        if config.HISTORY_PARTITIONING:
+            for cab_id in db.scalars(select(Cab.id).order_by(Cab.id)).all():
+                for entry in HistoryPartitions.read(db, cab_id):
+                    yield cab_id, entry.state, entry.timestamp
+            return
+        stmt = (
+            select(CabHistory.cab_id, CabHistory.state, CabHistory.timestamp)
+            .order_by(CabHistory.cab_id, CabHistory.timestamp, CabHistory.id)
+        )
+        yield from db.execute(stmt, execution_options={"yield_per": _REBUILD_BATCH_SIZE})
+
+    @staticmethod
+    def _write_columnar(db: Session) -> int:
+        """Folds the whole history with NumPy (`fold_intervals`) and bulk writes the intervals."""
+        intervals = fold_intervals(*ColumnarRepository.load_history(db))
+        columns = ["cab_id", "start", '"end"', "state", "cumulative_idle_before"]
+        for offset in range(0, len(intervals["cab_id"]), config.ANALYTICS_CHUNK_SIZE):
+            chunk = slice(offset, offset + config.ANALYTICS_CHUNK_SIZE)
+            ColumnarRepository.write_rows(db, "cab_state_intervals", columns, list(zip(
+                intervals["cab_id"][chunk].tolist(),
+                ColumnarRepository.format_timestamps(intervals["start"][chunk]),
+                ColumnarRepository.format_timestamps(intervals["end"][chunk]),
+                [STATES[state].name for state in intervals["state"][chunk].tolist()],
+                intervals["cumulative_idle_before"][chunk].tolist(),
+            )))
+        return len(intervals["cab_id"])
+
+    @staticmethod
+    def _folded_intervals(db: Session) -> Iterator[list[dict]]:
+        """Folds the history cab by cab with `_fold` and yields insert batches."""
+        batch = []
+        for cab_id, entries in groupby(StateIntervals._history(db), key=lambda entry: entry[0]):
+            batch.extend(StateIntervals._fold(cab_id, None, ((timestamp, state) for _, state, timestamp in entries)))
+            if len(batch) >= _REBUILD_BATCH_SIZE:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    @staticmethod
+    def rebuild(db: Session) -> int:
+        """
+        Recomputes cab_state_intervals from cab_history (including monthly tables and archived
+        months when partitioning is on) and commits; returns the number of intervals written.
+        From ``ANALYTICS_COLUMNAR_MIN_ROWS`` history rows (unpartitioned) the fold runs in NumPy.
+        """
+        columnar = (not config.HISTORY_PARTITIONING
+                    and ColumnarRepository.count_history(db) >= config.ANALYTICS_COLUMNAR_MIN_ROWS)
+
+        db.execute(delete(CabStateInterval))
+        if columnar:
+            written = StateIntervals._write_columnar(db)
+        else:
+            written = 0
+            for batch in StateIntervals._folded_intervals(db):
+                db.execute(insert(CabStateInterval), batch)
+                written += len(batch)
+        db.commit()
+        return written
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field
-from datetime import datetime
+from pydantic import BaseModel, Field, field_validator
+from datetime import date, datetime, timezone
 from typing import Optional, List
 from app.state_machine import CabState
 
@@ -32,11 +32,48 @@ class CabResponse(CabBase):
     id: int
     state: CabState
     last_idle_time: datetime
+    version: int = 0
 
     class Config:
         from_attributes = True
 
 
+class TelemetryEvent(BaseModel):
+    cab_id: int
+    city_id: Optional[int] = None
+    state: Optional[CabState] = None
+    timestamp: Optional[datetime] = None
+
+    @field_validator("timestamp")
+    @classmethod
+    def naive_utc(cls, timestamp: Optional[datetime]) -> Optional[datetime]:
+        """Aware timestamps are stored (and compared) as naive UTC, like every other timestamp."""
+        if timestamp is None or timestamp.tzinfo is None:
+            return timestamp
+        return timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+class TelemetryReport(BaseModel):
+    received: int = 0
+    invalid: int = 0
+    applied: int = 0
+    unchanged: int = 0
+    rejected: int = 0  # State changes not allowed by the transition table
+    conflicts: int = 0  # Cabs changed by another writer since they were read; left untouched
+    unknown_cabs: List[int] = []
+
+
+class CabImportError(BaseModel):
+    row: int
+    error: str
+
+
+class CabImportReport(BaseModel):
+    imported: int = 0
+    failed: int = 0
+    errors: List[CabImportError] = []
+
+
 class BookingBase(BaseModel):
     cab_id: int
     city_id: int
@@ -56,6 +93,32 @@ class BookingResponse(BookingBase):
         from_attributes = True
 
 
+class BatchBookingItem(BaseModel):
+    city_id: int
+    count: int = Field(1, ge=1, example=5)
+
+
+class BatchBookedCab(BaseModel):
+    booking_id: int
+    cab_id: int
+
+
+class BatchBookingResult(BaseModel):
+    city_id: int
+    requested: int
+    bookings: List[BatchBookedCab] = []
+    error: Optional[str] = None
+
+
+class BulkCompleteRequest(BaseModel):
+    booking_ids: List[int] = Field(..., example=[1, 2, 3])
+
+
+class BulkCompleteResult(BaseModel):
+    booking_id: int
+    status: str  # "completed", "not_found" or "already_completed"
+
+
 class CabHistoryBase(BaseModel):
     cab_id: int
     state: CabState
@@ -67,3 +130,38 @@ class CabHistoryResponse(CabHistoryBase):
 
     class Config:
         from_attributes = True
+
+
+class CabIdleTime(BaseModel):
+    cab_id: int
+    idle_seconds: float
+
+
+class CityDemand(BaseModel):
+    city_id: int
+    bookings: int
+
+
+class TripDurationQuantiles(BaseModel):
+    city_id: int
+    trips: int
+    mode: str  # "exact" (small cities) or "sketch"
+    relative_error: float  # Bound on each quantile's relative error; 0 in exact mode
+    quantiles: dict[str, float]  # Seconds, e.g. {"p50": 1260.0}
+
+
+class UtilizationSeries(BaseModel):
+    city_id: int
+    start: datetime
+    end: datetime
+    bucket_seconds: int
+    states: list[CabState]
+    counts: list[list[float]]  # counts[b][s]: average cabs in states[s] during bucket b (from start + b * bucket_seconds)
+
+
+class DemandHeatmap(BaseModel):
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    hours: list[str]  # The 168 UTC hours of the week, "Mon 00" to "Sun 23"
+    city_ids: list[int]
+    counts: list[list[int]]  # counts[i][h]: bookings of city_ids[i] in hours[h]
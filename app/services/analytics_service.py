@@ -1,16 +1,208 @@
 from sqlalchemy.orm import Session
+from fastapi import HTTPException
+from typing import Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 from app.repositories.booking_repository import BookingRepository
 from app.repositories.cab_repository import CabRepository
-from datetime import datetime, timedelta
+from app.repositories.columnar_repository import ColumnarRepository
+from app.repositories.duration_sketches import duration_sketches
+from app.repositories.state_intervals import StateIntervals
+from app.config import config
+from app.schemas import CabIdleTime, CityDemand, DemandHeatmap, TripDurationQuantiles, UtilizationSeries
+from app.utils.columnar import STATES
+from app.utils.columnar import hour_of_week_matrix
+from app.utils.utilization import sweep_utilization
+from app.utils.demand_windows import DEMAND_WINDOWS, demand_windows
+from app.utils.ttl_cache import analytics_cache
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+import numpy as np
+
+
+TRIP_DURATION_QUANTILES = (50, 90, 95, 99)
+UTILIZATION_MAX_BUCKETS = 10080  # A week of minutes
+HOURS_OF_WEEK = [f"{day} {hour:02d}" for day in ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun") for hour in range(24)]
 
 
 class AnalyticsService:
+    """
+    Analytics queries. Results are served through `analytics_cache`, keyed on the normalized
+    parameters and tagged with the cities/cabs they depend on; writers call `invalidate`
+    after committing so a cached result never outlives a change to its entities.
+    """
+
     @staticmethod
     def get_cab_idle_time(db: Session, cab_id: int, start_time: datetime, end_time: datetime):
         """Calculates total idle time of a cab within a given duration."""
-        return CabRepository.get_idle_time(db, cab_id, start_time, end_time)
+        start_time, end_time = AnalyticsService._naive_utc(start_time), AnalyticsService._naive_utc(end_time)
+        return analytics_cache.get_or_compute(
+            ("cab_idle_time", cab_id, start_time, end_time),
+            [("cab", cab_id)],
+            lambda: CabRepository.get_idle_time(db, cab_id, start_time, end_time),
+        )
+
+    @staticmethod
+    def get_fleet_idle_times(db: Session, city_id: int, start_time: datetime, end_time: datetime,
+                             order: str = "most", limit: Optional[int] = None) -> list[CabIdleTime]:
+        """Idle time of every cab in a city within a duration, most (or least) idle first."""
+        start_time, end_time = AnalyticsService._naive_utc(start_time), AnalyticsService._naive_utc(end_time)
+        rows = analytics_cache.get_or_compute(
+            ("fleet_idle_time", city_id, start_time, end_time, order, limit),
+            [("city", city_id)],
+            lambda: tuple(CabRepository.get_fleet_idle_times(db, city_id, start_time, end_time, order == "most", limit)),
+            # Also tagged with the listed cabs, so a cab leaving the city drops the result
+            result_tags=lambda rows: [("cab", cab_id) for cab_id, _ in rows],
+        )
+        return [CabIdleTime(cab_id=cab_id, idle_seconds=idle_seconds) for cab_id, idle_seconds in rows]
+
+    @staticmethod
+    def get_peak_demand_hours(db: Session, city_id: int, start_date: Optional[date] = None,
+                              end_date: Optional[date] = None, timezone: str = "UTC"):
+        """
+        Finds the peak demand hour (0-23, local to ``timezone``) of a city, optionally only
+        for bookings picked up between ``start_date`` and ``end_date`` (local dates, inclusive).
+        """
+        zone = AnalyticsService._zone(timezone)
+
+        def compute():
+            hourly = AnalyticsService.get_hourly_demand(db, city_id, start_date, end_date, zone.key)
+            return max(hourly, key=lambda hour: (hourly[hour], -hour)) if hourly else None
+
+        return analytics_cache.get_or_compute(
+            ("peak_demand", city_id, start_date, end_date, zone.key), [("city", city_id)], compute
+        )
+
+    @staticmethod
+    def get_utilization(db: Session, city_id: int, start_time: datetime, end_time: datetime,
+                        bucket_seconds: int) -> UtilizationSeries:
+        """
+        Average number of the city's cabs in each state per bucket of ``[start_time, end_time)``:
+        the cabs' states at the start plus one timestamp-ordered pass over their state changes.
+        """
+        start_time, end_time = AnalyticsService._naive_utc(start_time), AnalyticsService._naive_utc(end_time)
+        if (end_time - start_time).total_seconds() / bucket_seconds > UTILIZATION_MAX_BUCKETS:
+            raise HTTPException(status_code=400, detail=f"At most {UTILIZATION_MAX_BUCKETS} buckets per request")
+
+        counts = sweep_utilization(
+            StateIntervals.states_at(db, city_id, start_time),
+            StateIntervals.stream_changes(db, city_id, start_time, end_time),
+            start_time, end_time, bucket_seconds,
+        )
+        return UtilizationSeries(city_id=city_id, start=start_time, end=end_time, bucket_seconds=bucket_seconds,
+                                 states=STATES, counts=counts)
+
+    @staticmethod
+    def get_demand_heatmap(db: Session, start_date: Optional[date] = None,
+                           end_date: Optional[date] = None) -> DemandHeatmap:
+        """
+        Bookings of every city per UTC hour of the week over ``[start_date, end_date]``, as a dense
+        ``cities x 168`` matrix: one GROUP BY over the hourly_demand rollup scattered with NumPy.
+        Ranges that can still receive bookings (ending yesterday or later) are dropped from the
+        cache by every booking; older ranges only expire.
+        """
+        def compute():
+            rows = BookingRepository.get_weekly_demand(db, start_date, end_date)
+            cities, matrix = hour_of_week_matrix(*np.array(rows, dtype=np.int64).reshape(-1, 4).T)
+            return DemandHeatmap(start_date=start_date, end_date=end_date, hours=HOURS_OF_WEEK,
+                                 city_ids=cities.tolist(), counts=matrix.tolist())
+
+        open_range = end_date is None or end_date >= datetime.utcnow().date() - timedelta(days=1)
+        return analytics_cache.get_or_compute(
+            ("demand_heatmap", start_date, end_date), [("bookings",)] if open_range else [], compute
+        )
+
+    @staticmethod
+    def get_trip_duration_quantiles(db: Session, city_id: int) -> TripDurationQuantiles:
+        """
+        p50/p90/p95/p99 trip durations of a city, in seconds: the value of rank ``floor(q * (n - 1))``.
+        Cities with up to ``TRIP_DURATION_EXACT_MAX`` trips are answered exactly from their bookings;
+        larger ones from the city's quantile sketch, within ``TRIP_DURATION_SKETCH_ACCURACY`` relative error.
+        """
+        sketch = duration_sketches.get(db, city_id)
+        if sketch.count > config.TRIP_DURATION_EXACT_MAX:
+            return TripDurationQuantiles(
+                city_id=city_id, trips=sketch.count, mode="sketch", relative_error=sketch.relative_accuracy,
+                quantiles={f"p{q}": sketch.quantile(q / 100) for q in TRIP_DURATION_QUANTILES},
+            )
+
+        durations = ColumnarRepository.load_trip_durations(db, city_id=city_id)
+        if not len(durations):
+            raise HTTPException(status_code=404, detail="No completed trips for this city")
+        values = np.percentile(durations, TRIP_DURATION_QUANTILES, method="lower")
+        return TripDurationQuantiles(
+            city_id=city_id, trips=len(durations), mode="exact", relative_error=0.0,
+            quantiles={f"p{q}": float(value) for q, value in zip(TRIP_DURATION_QUANTILES, values)},
+        )
+
+    @staticmethod
+    def get_top_cities(window: str, k: int) -> list[CityDemand]:
+        """The ``k`` cities with the most bookings in the last ``window`` (15m, 1h or 24h), from memory."""
+        return [CityDemand(city_id=city_id, bookings=count) for city_id, count in demand_windows.top(window, k)]
+
+    @staticmethod
+    def load_demand_windows(db: Session):
+        """Rebuilds the top cities counters from the bookings of the longest window."""
+        now = datetime.utcnow()
+        since = now - timedelta(seconds=max(DEMAND_WINDOWS.values()))
+        demand_windows.load(BookingRepository.get_recent_demand(db, since), now)
+
+    @staticmethod
+    def invalidate(city_ids=(), cab_ids=(), booked: bool = False):
+        """Drops cached results that depend on any of the given cities or cabs (or on new bookings if ``booked``)."""
+        analytics_cache.invalidate(*[("city", city_id) for city_id in city_ids],
+                                   *[("cab", cab_id) for cab_id in cab_ids],
+                                   *([("bookings",)] if booked else []))
 
     @staticmethod
-    def get_peak_demand_hours(db: Session, city_id: int):
-        """Finds peak hours for cab demand in a city."""
-        return BookingRepository.analyze_peak_demand(db, city_id)
+    def _naive_utc(moment: datetime) -> datetime:
+        """Aware datetimes as the naive UTC form timestamps are stored in."""
+        if moment.tzinfo is None:
+            return moment
+        return moment.astimezone(dt_timezone.utc).replace(tzinfo=None)
+
+    @staticmethod
+    def _zone(timezone: str) -> ZoneInfo:
+        try:
+            return ZoneInfo(timezone)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise HTTPException(status_code=400, detail=f"Unknown timezone: {timezone}")
+
+    @staticmethod
+    def get_hourly_demand(db: Session, city_id: int, start_date: Optional[date] = None,
+                          end_date: Optional[date] = None, timezone: str = "UTC") -> dict[int, int]:
+        """
+        Counts a city's bookings per local hour of day.
+        - UTC: one GROUP BY hour over the hourly_demand rollup (at most 24 rows).
+        - Whole-hour offsets: the rollup buckets of the range, shifted into local time.
+        - Other offsets (e.g. +05:30): the range's bookings grouped into quarter-hour slots.
+        """
+        zone = AnalyticsService._zone(timezone)
+        if zone.key in ("UTC", "Etc/UTC"):
+            return BookingRepository.get_hourly_demand(db, city_id, start_date, end_date)
+
+        # Local day boundaries as naive UTC, the way pickup times are stored
+        def to_utc(day: date) -> datetime:
+            return datetime.combine(day, time(), zone).astimezone(dt_timezone.utc).replace(tzinfo=None)
+
+        start = to_utc(start_date) if start_date else None
+        end = to_utc(end_date + timedelta(days=1)) if end_date else None
+
+        hourly = {}
+        buckets = BookingRepository.get_hourly_demand_buckets(
+            db, city_id, start.date() if start else None, end.date() if end else None
+        )
+        for day, hour, count in buckets:
+            bucket = datetime.combine(day, time(hour))
+            if (start and bucket < start) or (end and bucket >= end):
+                continue
+            local = bucket.replace(tzinfo=dt_timezone.utc).astimezone(zone)
+            if local.minute:
+                break  # Hour buckets straddle local hours; count the bookings themselves instead
+            hourly[local.hour] = hourly.get(local.hour, 0) + count
+        else:
+            return hourly
+
+        hourly = {}
+        for day, hour, minute, count in BookingRepository.get_demand_slots(db, city_id, start, end):
+            slot = datetime.combine(day, time(hour, minute), dt_timezone.utc).astimezone(zone)
+            hourly[slot.hour] = hourly.get(slot.hour, 0) + count
+        return hourly
@@ -0,0 +1,115 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import OperationalError
+from fastapi import HTTPException
+from datetime import datetime
+from typing import Optional
+from app.config import config
+from app.state_machine import CabState
+from app.repositories.async_cab_repository import AsyncCabRepository
+from app.repositories.async_booking_repository import AsyncBookingRepository
+from app.repositories.duration_sketches import duration_sketches
+from app.services.analytics_service import AnalyticsService
+from app.services.cab_service import CabService
+from app.utils.demand_windows import demand_windows
+from app.utils.dispatch_index import dispatch_index
+
+
+class AsyncBookingService:
+    """Async counterpart of `BookingService`, sharing the process-wide dispatch index."""
+
+    @staticmethod
+    async def book_cab(db: AsyncSession, city_id: int):
+        """
+        Books the longest idle cab in the city.
+        Same algorithm as `BookingService.book_cab`: pop from the dispatch index, claim with a
+        conditional UPDATE and commit the booking and history row in one transaction, with the
+        same bounds on lost claims and reloads.
+        """
+        conflicts = 0
+        attempts = 0
+        reloaded = False
+        while True:
+            cab_id, reloaded = await AsyncBookingService._next_candidate(db, city_id, reloaded)
+            if cab_id is None:
+                raise HTTPException(status_code=404, detail="No available cabs in this city")
+
+            try:
+                if not await AsyncCabRepository.claim_cab(db, cab_id, city_id):
+                    # Taken by a concurrent booking, try the next cab
+                    attempts += 1
+                    if attempts >= config.BOOKING_MAX_CLAIM_ATTEMPTS:
+                        raise HTTPException(status_code=503, detail="Booking contention, please retry")
+                    continue
+
+                booking = await AsyncBookingRepository.create_booking(db, cab_id, city_id)
+                await AsyncCabRepository.create_cab_history(db, cab_id, CabState.ON_TRIP)
+
+                await db.commit()
+                demand_windows.record(city_id)
+                AnalyticsService.invalidate(city_ids=[city_id], cab_ids=[cab_id], booked=True)
+                return booking
+
+            except OperationalError:
+                await db.rollback()
+                dispatch_index.invalidate(city_id)
+                reloaded = False
+                conflicts += 1
+                if conflicts > config.BOOKING_CLAIM_RETRIES:
+                    raise HTTPException(status_code=503, detail="Booking contention, please retry")
+
+            except HTTPException:
+                raise
+
+            except Exception:
+                await db.rollback()
+                dispatch_index.invalidate(city_id)
+                raise HTTPException(status_code=500, detail="Failed to book cab")
+
+    @staticmethod
+    async def _next_candidate(db: AsyncSession, city_id: int, reloaded: bool) -> tuple[Optional[int], bool]:
+        """Pops the next candidate cab id, reloading the city at most once (see `BookingService._next_candidate`)."""
+        if not reloaded and dispatch_index.needs_load(city_id):
+            dispatch_index.load_city(city_id, await AsyncCabRepository.get_idle_cab_keys(db, city_id))
+            reloaded = True
+
+        cab_id = dispatch_index.pop(city_id)
+        if cab_id is None and not reloaded:
+            dispatch_index.load_city(city_id, await AsyncCabRepository.get_idle_cab_keys(db, city_id))
+            reloaded = True
+            cab_id = dispatch_index.pop(city_id)
+        return cab_id, reloaded
+
+    @staticmethod
+    async def get_booking_by_id(db: AsyncSession, booking_id: int):
+        """Fetches a booking by its ID."""
+        return await AsyncBookingRepository.get_booking_by_id(db, booking_id)
+
+    @staticmethod
+    async def complete_booking(db: AsyncSession, booking_id: int):
+        """Completes a booking by setting the drop time and marking the cab as IDLE."""
+        booking = await AsyncBookingRepository.get_booking_by_id(db, booking_id)
+        if not booking:
+            raise HTTPException(status_code=404, detail="Booking not found")
+
+        if booking.drop_time is not None:
+            raise HTTPException(status_code=400, detail="Booking is already completed")
+
+        try:
+            booking.drop_time = datetime.utcnow()
+            # The cab is released unless it is already IDLE
+            cab = await AsyncCabRepository.update_cab_state(db, booking.cab_id, CabState.IDLE.value)
+            if cab:
+                await AsyncCabRepository.create_cab_history(db, cab.id, cab.state)
+            await db.commit()
+        except HTTPException:
+            raise
+        except Exception:
+            await db.rollback()
+            raise HTTPException(status_code=500, detail="Internal server error")
+
+        if cab:
+            CabService.sync_dispatch_index(cab)
+            AnalyticsService.invalidate(cab_ids=[cab.id])
+        if booking.pickup_time:
+            duration_sketches.add(booking.city_id, (booking.drop_time - booking.pickup_time).total_seconds())
+        return booking
@@ -0,0 +1,78 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import SQLAlchemyError
+from fastapi import HTTPException
+from app.repositories.async_cab_repository import AsyncCabRepository
+from app.services.analytics_service import AnalyticsService
+from app.services.async_city_service import AsyncCityService
+from app.services.cab_service import CabService
+from app.schemas import CabCreate
+from app.models import Cab
+from app.state_machine import CabState
+from typing import Optional
+
+
+class AsyncCabService:
+    """Async counterpart of `CabService`."""
+
+    @staticmethod
+    async def register_cab(db: AsyncSession, cab_data: CabCreate) -> Cab:
+        """Registers a new cab and logs initial history in one transaction."""
+        if not await AsyncCityService.city_exists(db, cab_data.current_city_id):
+            raise HTTPException(status_code=400, detail="Invalid city ID: City does not exist.")
+
+        try:
+            cab = await AsyncCabRepository.create_cab(db, cab_data.model_dump())
+            await AsyncCabRepository.create_cab_history(db, cab.id, cab.state)
+            await db.commit()
+        except SQLAlchemyError as e:
+            await db.rollback()
+            raise HTTPException(status_code=500, detail=f"Error registering cab: {str(e)}")
+
+        CabService.sync_dispatch_index(cab)
+        AnalyticsService.invalidate(city_ids=[cab.current_city_id], cab_ids=[cab.id])
+        return cab
+
+    @staticmethod
+    async def change_cab_location(db: AsyncSession, cab_id: int, city_id: int) -> Cab:
+        """Changes a cab's location (city)."""
+        cab = await AsyncCabRepository.update_cab_location(db, cab_id, city_id)
+        CabService.sync_dispatch_index(cab)
+        AnalyticsService.invalidate(city_ids=[city_id], cab_ids=[cab_id])
+        return cab
+
+    @staticmethod
+    async def update_cab_state(db: AsyncSession, cab_id: int, new_state: str,
+                               expected_version: Optional[int] = None) -> Cab:
+        """Updates a cab's state following the transition table, see `CabService.update_cab_state`."""
+        cab = await AsyncCabRepository.update_cab_state(db, cab_id, new_state, expected_version)
+        if not cab:
+            await db.rollback()
+            if await db.get(Cab, cab_id) is None:
+                raise HTTPException(status_code=404, detail="Cab not found")
+            raise HTTPException(
+                status_code=409,
+                detail=f"Cab cannot move to {CabState(new_state).value} from its current state/version"
+            )
+
+        await AsyncCabRepository.create_cab_history(db, cab.id, cab.state)
+        await db.commit()
+
+        CabService.sync_dispatch_index(cab)
+        AnalyticsService.invalidate(cab_ids=[cab_id])
+        return cab
+
+    @staticmethod
+    async def get_available_cabs(db: AsyncSession, city_id: int) -> list[Cab]:
+        """Finds available cabs in a city."""
+        available_cabs = await AsyncCabRepository.get_available_cabs(db, city_id)
+        if not available_cabs:
+            raise HTTPException(status_code=404, detail="No available cabs found")
+        return available_cabs
+
+    @staticmethod
+    async def get_cab_history(db: AsyncSession, cab_id: int):
+        """Gets cab history from repository."""
+        history = await AsyncCabRepository.get_cab_history(db, cab_id)
+        if not history:
+            raise HTTPException(status_code=404, detail="No history found for this cab")
+        return history
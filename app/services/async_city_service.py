@@ -0,0 +1,53 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.repositories.async_city_repository import AsyncCityRepository
+from app.schemas import CityCreate
+from app.utils.city_registry import city_registry
+
+
+class AsyncCityService:
+    """Async counterpart of `CityService`."""
+
+    @staticmethod
+    async def register_city(db: AsyncSession, city_data: CityCreate):
+        """Registers a new city."""
+        city = await AsyncCityRepository.create_city(db, city_data.model_dump())
+        if city:
+            city_registry.put(city.id, city.name)
+        return city
+
+    @staticmethod
+    async def get_all_cities(db: AsyncSession):
+        """Retrieves all registered cities."""
+        return await AsyncCityRepository.get_all_cities(db)
+
+    @staticmethod
+    async def get_city_by_id(db: AsyncSession, city_id: int):
+        """Fetches a city by its ID."""
+        return await AsyncCityRepository.get_city_by_id(db, city_id)
+
+    @staticmethod
+    async def update_city(db: AsyncSession, city_id: int, updated_data: dict):
+        """Updates a city's details."""
+        city = await AsyncCityRepository.update_city(db, city_id, updated_data)
+        if city:
+            city_registry.put(city.id, city.name)
+        return city
+
+    @staticmethod
+    async def delete_city(db: AsyncSession, city_id: int):
+        """Deletes a city by ID."""
+        deleted = await AsyncCityRepository.delete_city(db, city_id)
+        city_registry.remove(city_id)
+        return deleted
+
+    @staticmethod
+    async def city_exists(db: AsyncSession, city_id: int) -> bool:
+        """Checks a city id against the registry; only unknown ids fall back to the database."""
+        if city_registry.needs_load():
+            city_registry.load(await AsyncCityRepository.get_city_names(db))
+        if city_registry.get_name(city_id) is not None:
+            return True
+        city = await AsyncCityRepository.get_city_by_id(db, city_id)  # Created by another worker since the last load
+        if city:
+            city_registry.put(city.id, city.name)
+        return city is not None
@@ -0,0 +1,150 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from fastapi import HTTPException
+from app.config import config
+from app.database import SessionLocal
+from app.services.analytics_service import AnalyticsService
+from app.services.booking_service import BookingService
+from app.utils.demand_windows import demand_windows
+from app.utils.dispatch_index import dispatch_index
+
+
+class _CityQueue:
+    """Pending booking requests of one city, served by a dedicated worker thread."""
+
+    def __init__(self):
+        self.requests: deque[Future] = deque()
+        self.condition = threading.Condition()
+        self.worker = None
+
+
+class BookingDispatcher:
+    """
+    Coalesces concurrent single-cab bookings per city into one multi-cab claim.
+
+    Requests wait at most ``max_wait_ms`` (or until ``max_batch_size`` requests are
+    queued) and are then served together by `BookingService.book_cabs`. Requests are
+    answered in arrival order, so the longest idle cabs go to the earliest callers;
+    callers that cannot be served get ``None``.
+
+    A city's worker thread is started by its first request and exits after
+    ``idle_timeout_seconds`` without requests; `close` serves what is queued and stops them all.
+    """
+
+    def __init__(self, session_factory=SessionLocal, max_wait_ms: float = 5, max_batch_size: int = 50,
+                 idle_timeout_seconds: float = 60):
+        self.session_factory = session_factory
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.idle_timeout = idle_timeout_seconds
+        self._lock = threading.Lock()
+        self._cities: dict[int, _CityQueue] = {}
+        self._closed = False
+
+    def book(self, city_id: int):
+        """Queues a booking for the city and blocks until its batch has been dispatched."""
+        return self.submit(city_id).result()
+
+    def submit(self, city_id: int) -> Future:
+        """Queues a booking for the city and returns a future resolved with the booking row."""
+        future = Future()
+        # Queued under the dispatcher lock, so an idle worker cannot retire in between
+        with self._lock:
+            if self._closed:
+                future.set_exception(HTTPException(status_code=503, detail="Booking dispatcher is shutting down"))
+                return future
+            city = self._cities.get(city_id)
+            if city is None:
+                city = self._cities[city_id] = _CityQueue()
+                city.worker = threading.Thread(
+                    target=self._run, args=(city_id, city), name=f"booking-dispatcher-{city_id}", daemon=True
+                )
+                city.worker.start()
+
+            with city.condition:
+                city.requests.append(future)
+                city.condition.notify()
+        return future
+
+    def close(self, timeout: float = 10):
+        """Serves the requests already queued, then stops every worker (called on shutdown)."""
+        with self._lock:
+            self._closed = True
+            cities = list(self._cities.values())
+        for city in cities:
+            with city.condition:
+                city.condition.notify()
+        for city in cities:
+            city.worker.join(timeout)
+
+    def workers(self) -> int:
+        """Number of cities with a running worker thread."""
+        with self._lock:
+            return len(self._cities)
+
+    def _retire(self, city_id: int, city: _CityQueue) -> bool:
+        """Removes an idle city so its worker can exit; False if a request arrived meanwhile."""
+        with self._lock, city.condition:
+            if city.requests:
+                return False
+            if self._cities.get(city_id) is city:
+                del self._cities[city_id]
+            return True
+
+    def _run(self, city_id: int, city: _CityQueue):
+        while True:
+            with city.condition:
+                idle_since = time.monotonic()
+                while not city.requests and not self._closed:
+                    remaining = idle_since + self.idle_timeout - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    city.condition.wait(remaining)
+                idle = not city.requests
+
+            if idle:
+                if self._retire(city_id, city):
+                    return
+                continue
+
+            with city.condition:
+                # Give concurrent requests a short window to join the batch
+                deadline = time.monotonic() + self.max_wait
+                while len(city.requests) < self.max_batch_size and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    city.condition.wait(remaining)
+
+                size = min(len(city.requests), self.max_batch_size)
+                batch = [city.requests.popleft() for _ in range(size)]
+
+            self._dispatch(city_id, batch)
+
+    def _dispatch(self, city_id: int, batch: list[Future]):
+        """Claims cabs for the whole batch in one transaction and resolves every future."""
+        try:
+            with self.session_factory() as db:
+                bookings = BookingService.book_cabs(db, city_id, len(batch))
+                db.commit()
+        except Exception:
+            dispatch_index.invalidate(city_id)
+            for future in batch:
+                future.set_exception(HTTPException(status_code=500, detail="Failed to book cab"))
+            return
+
+        if bookings:
+            demand_windows.record(city_id, len(bookings))
+        AnalyticsService.invalidate(city_ids=[city_id], cab_ids=[booking.cab_id for booking in bookings], booked=True)
+        for position, future in enumerate(batch):
+            future.set_result(bookings[position] if position < len(bookings) else None)
+
+
+# Initialize the process-wide dispatcher (only used when enabled in config)
+booking_dispatcher = BookingDispatcher(
+    max_wait_ms=config.BOOKING_DISPATCHER_MAX_WAIT_MS,
+    max_batch_size=config.BOOKING_DISPATCHER_MAX_BATCH,
+    idle_timeout_seconds=config.BOOKING_DISPATCHER_IDLE_TIMEOUT_SECONDS,
+)
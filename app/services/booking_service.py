@@ -1,11 +1,18 @@
 from sqlalchemy.orm import Session
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
 from fastapi import HTTPException
 from app.state_machine import CabState
 from app.repositories.cab_repository import CabRepository
 from app.repositories.booking_repository import BookingRepository
-from app.services.cab_service import CabService
+from app.repositories.duration_sketches import duration_sketches
+from app.services.analytics_service import AnalyticsService
+from app.config import config
+from app.schemas import BatchBookingItem, BatchBookingResult, BatchBookedCab, BulkCompleteResult
+from app.utils.cursor import decode_cursor, encode_cursor
+from app.utils.demand_windows import demand_windows
+from app.utils.dispatch_index import dispatch_index
 from datetime import datetime
-import random
+from typing import Optional
 
 
 class BookingService:
@@ -13,48 +20,185 @@ class BookingService:
     def book_cab(db: Session, city_id: int):
         """
         Books an available cab based on idle time.
-        - Fetches the longest idle cab using a single optimized DB query.
-        - If multiple cabs have the same idle time, selects one randomly.
-        - Updates the cab's status to `ON_TRIP` while ensuring transaction integrity.
+        - Picks the longest idle cab from the in-memory dispatch index (random among ties).
+        - Claims it with one conditional UPDATE (IDLE -> ON_TRIP); if a concurrent request
+          won the race, the next candidate is tried, up to ``BOOKING_MAX_CLAIM_ATTEMPTS`` cabs.
+        - The city is reloaded from the database at most once per attempt cycle (again only
+          after lock contention invalidated the index).
+        - The claim, the booking and the history row are committed in a single transaction.
         """
+        conflicts = 0
+        attempts = 0
+        reloaded = False
+        while True:
+            cab_id, reloaded = BookingService._next_candidate(db, city_id, reloaded)
+            if cab_id is None:
+                raise HTTPException(status_code=404, detail="No available cabs in this city")
 
-        available_cabs = CabRepository.get_available_cabs(db, city_id)
+            try:
+                if not CabRepository.claim_cab(db, cab_id, city_id):
+                    # Taken by a concurrent booking, try the next cab
+                    attempts += 1
+                    if attempts >= config.BOOKING_MAX_CLAIM_ATTEMPTS:
+                        raise HTTPException(status_code=503, detail="Booking contention, please retry")
+                    continue
 
-        if not available_cabs:
-            raise HTTPException(status_code=404, detail="No available cabs in this city")
+                booking = BookingRepository.create_booking(db, cab_id, city_id)
+                CabRepository.create_cab_history(db, cab_id, CabState.ON_TRIP, commit=False)
 
-        # Identify cabs with the longest idle time
-        longest_idle_time = available_cabs[0].last_idle_time
-        longest_idle_cabs = [cab for cab in available_cabs if cab.last_idle_time == longest_idle_time]
+                db.commit()
+                demand_windows.record(city_id)
+                AnalyticsService.invalidate(city_ids=[city_id], cab_ids=[cab_id], booked=True)
+                return booking
 
-        # Randomly select a cab if multiple have the same idle time
-        assigned_cab = random.choice(longest_idle_cabs)
+            except OperationalError:
+                # Lock contention (e.g. SQLite "database is locked"); retry with a fresh candidate
+                db.rollback()
+                dispatch_index.invalidate(city_id)
+                reloaded = False
+                conflicts += 1
+                if conflicts > config.BOOKING_CLAIM_RETRIES:
+                    raise HTTPException(status_code=503, detail="Booking contention, please retry")
+
+            except HTTPException:
+                raise
+
+            except Exception as e:
+                db.rollback()  # Rollback in case of failure
+                dispatch_index.invalidate(city_id)
+                raise HTTPException(status_code=500, detail="Failed to book cab")
+
+    @staticmethod
+    def book_cabs(db: Session, city_id: int, count: int):
+        """
+        Books up to ``count`` cabs in a city within the caller's transaction.
+        - Candidates are popped from the dispatch index (longest idle first) and claimed
+          with one set-based UPDATE; cabs lost to concurrent requests are replaced.
+        - Bookings and ON_TRIP history rows are bulk inserted. Nothing is committed here.
+        Returns the created ``(id, cab_id)`` booking rows in dispatch order.
+        """
+        claimed = []
+        reloaded = False
+        while len(claimed) < count:
+            if not reloaded and dispatch_index.needs_load(city_id):
+                dispatch_index.load_city(city_id, CabRepository.get_idle_cab_keys(db, city_id))
+                reloaded = True
+
+            candidates = dispatch_index.pop_many(city_id, count - len(claimed))
+            if not candidates:
+                if reloaded:
+                    break
+                dispatch_index.invalidate(city_id)
+                continue
+
+            won = set(CabRepository.claim_cabs(db, city_id, candidates))
+            claimed.extend(cab_id for cab_id in candidates if cab_id in won)
+
+        if not claimed:
+            return []
+
+        bookings = BookingRepository.create_bookings(db, city_id, claimed)
+        CabRepository.create_cab_histories(db, [(cab_id, CabState.ON_TRIP) for cab_id in claimed])
+        return bookings
+
+    @staticmethod
+    def book_batch(db: Session, items: list[BatchBookingItem]) -> list[BatchBookingResult]:
+        """
+        Books cabs for a batch of ``{city_id, count}`` requests in one transaction.
+        Requests for the same city are served together, and every city runs in its own
+        SAVEPOINT so a failing city does not abort the rest of the batch.
+        """
+        requested = {}
+        for item in items:
+            requested[item.city_id] = requested.get(item.city_id, 0) + item.count
+
+        assigned = {}
+        for city_id, count in requested.items():
+            try:
+                with db.begin_nested():
+                    assigned[city_id] = list(BookingService.book_cabs(db, city_id, count))
+            except SQLAlchemyError:
+                dispatch_index.invalidate(city_id)
+                assigned[city_id] = None
 
         try:
-            # Create booking record (ensures cab status change is tied to a successful booking)
-            booking = BookingRepository.create_booking(db, assigned_cab.id, city_id)
+            db.commit()
+        except SQLAlchemyError:
+            db.rollback()
+            for city_id in requested:
+                dispatch_index.invalidate(city_id)
+            raise HTTPException(status_code=500, detail="Failed to book cabs")
 
-            # Use repository method to update cab state
-            CabService.update_cab_state(db, booking.cab_id, CabState.ON_TRIP.value)
+        for city_id, bookings in assigned.items():
+            if bookings:
+                demand_windows.record(city_id, len(bookings))
+        AnalyticsService.invalidate(
+            city_ids=list(requested),
+            cab_ids=[booking.cab_id for bookings in assigned.values() if bookings for booking in bookings],
+            booked=True,
+        )
 
-            db.commit()  # Commit transaction after both operations succeed
-            db.refresh(booking)
+        results = []
+        for item in items:
+            bookings = assigned[item.city_id]
+            if bookings is None:
+                results.append(BatchBookingResult(
+                    city_id=item.city_id, requested=item.count, error="Failed to book cabs"
+                ))
+                continue
 
-            return booking
+            taken, assigned[item.city_id] = bookings[:item.count], bookings[item.count:]
+            error = None
+            if not taken:
+                error = "No available cabs in this city"
+            elif len(taken) < item.count:
+                error = f"Only {len(taken)} of {item.count} cabs available"
 
-        except Exception as e:
-            db.rollback()  # Rollback in case of failure
-            raise HTTPException(status_code=500, detail="Failed to book cab")
+            results.append(BatchBookingResult(
+                city_id=item.city_id,
+                requested=item.count,
+                bookings=[BatchBookedCab(booking_id=b.id, cab_id=b.cab_id) for b in taken],
+                error=error,
+            ))
+        return results
+
+    @staticmethod
+    def _next_candidate(db: Session, city_id: int, reloaded: bool) -> tuple[Optional[int], bool]:
+        """
+        Pops the next candidate cab id from the dispatch index.
+        Unless ``reloaded`` is set, the city is reloaded from the database when its index is
+        stale or runs dry, so cabs that became idle outside this process are never missed.
+        Returns the cab id (None when there is none) and whether the city has been reloaded.
+        """
+        if not reloaded and dispatch_index.needs_load(city_id):
+            dispatch_index.load_city(city_id, CabRepository.get_idle_cab_keys(db, city_id))
+            reloaded = True
+
+        cab_id = dispatch_index.pop(city_id)
+        if cab_id is None and not reloaded:
+            dispatch_index.load_city(city_id, CabRepository.get_idle_cab_keys(db, city_id))
+            reloaded = True
+            cab_id = dispatch_index.pop(city_id)
+        return cab_id, reloaded
 
     @staticmethod
     def get_city_by_id(db: Session, booking_id: int):
         """Fetches a booking by its ID."""
         return BookingRepository.get_booking_by_id(db, booking_id)
 
+    @staticmethod
+    def get_active_bookings(db: Session, city_id: Optional[int], cursor: Optional[str], limit: int):
+        """Returns a page of in-flight bookings and the cursor of the next page (None on the last page)."""
+        after_id = decode_cursor(cursor)[1] if cursor else None
+        bookings = BookingRepository.get_active_bookings(db, city_id, after_id, limit)
+        next_cursor = encode_cursor(None, bookings[-1].id) if len(bookings) == limit else None
+        return bookings, next_cursor
+
     @staticmethod
     def complete_booking(db: Session, booking_id: int):
         """
         Completes a booking by setting the drop time and marking the cab as IDLE.
+        The drop time, the cab release and the history row commit together.
         """
         try:
             # Fetch the booking
@@ -65,15 +209,21 @@ class BookingService:
             if booking.drop_time is not None:
                 raise HTTPException(status_code=400, detail="Booking is already completed")
 
-            # Update drop time
-            booking.drop_time = datetime.utcnow()
-
-            # Use repository method to update cab state
-            CabService.update_cab_state(db, booking.cab_id, CabState.IDLE.value)
+            # Update drop time and release the cab (skipped if it is already IDLE)
+            now = datetime.utcnow()
+            booking.drop_time = now
+            released = CabRepository.release_cabs(db, [booking.cab_id], now)
+            CabRepository.create_cab_histories(db, [(cab.id, CabState.IDLE) for cab in released])
 
             # Commit changes
             db.commit()
+
+            for cab in released:
+                dispatch_index.mark_idle(cab.id, cab.current_city_id, cab.last_idle_time)
+            AnalyticsService.invalidate(cab_ids=[cab.id for cab in released])
             db.refresh(booking)
+            if booking.pickup_time:
+                duration_sketches.add(booking.city_id, (booking.drop_time - booking.pickup_time).total_seconds())
             return booking
 
         except HTTPException:
@@ -82,3 +232,47 @@ class BookingService:
         except Exception as e:
             db.rollback()
             raise HTTPException(status_code=500, detail="Internal server error")
+
+    @staticmethod
+    def complete_bookings(db: Session, booking_ids: list[int]) -> list[BulkCompleteResult]:
+        """
+        Completes many bookings in one transaction.
+        - Sets ``drop_time`` and flips the cabs to IDLE with set-based UPDATEs.
+        - Bulk inserts the IDLE history rows.
+        - Reports ``not_found`` / ``already_completed`` per id instead of failing the batch.
+        """
+        booking_ids = list(dict.fromkeys(booking_ids))
+        now = datetime.utcnow()
+
+        try:
+            rows = BookingRepository.complete_bookings(db, booking_ids, now)
+            completed = {row.id: row.cab_id for row in rows}
+            released = []
+            if completed:
+                released = CabRepository.release_cabs(db, list(set(completed.values())), now)
+                CabRepository.create_cab_histories(db, [(cab.id, CabState.IDLE) for cab in released])
+            db.commit()
+        except SQLAlchemyError:
+            db.rollback()
+            raise HTTPException(status_code=500, detail="Failed to complete bookings")
+
+        for cab in released:
+            dispatch_index.mark_idle(cab.id, cab.current_city_id, cab.last_idle_time)
+        AnalyticsService.invalidate(cab_ids=[cab.id for cab in released])
+        for row in rows:
+            if row.pickup_time:
+                duration_sketches.add(row.city_id, (now - row.pickup_time).total_seconds())
+
+        leftover = [booking_id for booking_id in booking_ids if booking_id not in completed]
+        existing = BookingRepository.get_existing_ids(db, leftover) if leftover else set()
+
+        results = []
+        for booking_id in booking_ids:
+            if booking_id in completed:
+                status = "completed"
+            elif booking_id in existing:
+                status = "already_completed"
+            else:
+                status = "not_found"
+            results.append(BulkCompleteResult(booking_id=booking_id, status=status))
+        return results
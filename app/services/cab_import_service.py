@@ -0,0 +1,137 @@
+import csv
+import json
+from datetime import datetime
+from typing import IO, Iterator, Optional
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import SQLAlchemyError
+from app.config import config
+from app.repositories.cab_repository import CabRepository
+from app.schemas import CabImportError, CabImportReport
+from app.services.analytics_service import AnalyticsService
+from app.services.city_service import CityService
+from app.utils.dispatch_index import dispatch_index
+
+
+class CabImportService:
+    """Streaming bulk onboarding of cabs from CSV or NDJSON."""
+
+    @staticmethod
+    def detect_format(filename: Optional[str]) -> str:
+        """Infers the file format from its name; anything that is not ``.csv`` is NDJSON."""
+        return "csv" if filename and filename.lower().endswith(".csv") else "ndjson"
+
+    @staticmethod
+    def parse_rows(stream: IO[str], file_format: str) -> Iterator[tuple[int, object]]:
+        """
+        Lazily yields ``(row_number, record)`` pairs from a text stream.
+        A record is a dict, or an error message when the line cannot be decoded. Bytes that are
+        not UTF-8 end the file with an error at the row being read: the text stream decodes
+        in chunks, so the rows after it cannot be located reliably.
+        """
+        is_csv = file_format == "csv"
+        rows = iter(csv.DictReader(stream) if is_csv else stream)
+        row_number = 1 if is_csv else 0  # Row 1 of a CSV is the header
+        while True:
+            try:
+                row = next(rows)
+            except StopIteration:
+                return
+            except UnicodeDecodeError as e:
+                yield row_number + 1, f"Invalid UTF-8 ({e.reason}); the rest of the file was not read"
+                return
+            row_number += 1
+
+            if is_csv:
+                yield row_number, row
+                continue
+            if not row.strip():
+                continue
+            try:
+                record = json.loads(row)
+            except json.JSONDecodeError as e:
+                yield row_number, f"Invalid JSON: {e.msg}"
+                continue
+            yield row_number, record if isinstance(record, dict) else "Expected a JSON object"
+
+    @staticmethod
+    def import_cabs(db: Session, stream: IO[str], file_format: str) -> CabImportReport:
+        """
+        Validates and inserts cabs in batches of ``CAB_IMPORT_BATCH_SIZE``.
+        - City ids are checked against a snapshot of the city registry.
+        - Every batch (cabs plus their initial IDLE history) commits on its own; invalid
+          rows and failed batches are reported per row instead of failing the file.
+        """
+        report = CabImportReport()
+        city_ids = CityService.get_city_ids(db)
+        seen_plates = set()
+        batch = []
+
+        for row_number, record in CabImportService.parse_rows(stream, file_format):
+            cab, error = CabImportService._validate(record, city_ids, seen_plates)
+            if error:
+                CabImportService._fail(report, row_number, error)
+                continue
+            batch.append((row_number, cab))
+            if len(batch) >= config.CAB_IMPORT_BATCH_SIZE:
+                CabImportService._flush(db, batch, report)
+                batch = []
+
+        if batch:
+            CabImportService._flush(db, batch, report)
+        report.errors.sort(key=lambda error: error.row)
+        return report
+
+    @staticmethod
+    def _validate(record, city_ids: set[int], seen_plates: set[str]):
+        """Returns ``(cab, None)`` for a valid record or ``(None, error)``."""
+        if isinstance(record, str):
+            return None, record
+
+        plate_number = str(record.get("plate_number") or "").strip()
+        if not plate_number:
+            return None, "Missing plate_number"
+        if plate_number in seen_plates:
+            return None, "Duplicate plate number in file"
+
+        try:
+            city_id = int(record.get("current_city_id"))
+        except (TypeError, ValueError):
+            return None, "Invalid current_city_id"
+        if city_id not in city_ids:
+            return None, "Invalid city ID: City does not exist."
+
+        seen_plates.add(plate_number)
+        return {"plate_number": plate_number, "current_city_id": city_id}, None
+
+    @staticmethod
+    def _flush(db: Session, batch: list[tuple[int, dict]], report: CabImportReport):
+        """Inserts one batch, skipping plates that are already registered."""
+        existing = CabRepository.get_existing_plates(db, [cab["plate_number"] for _, cab in batch])
+        rows = []
+        for row_number, cab in batch:
+            if cab["plate_number"] in existing:
+                CabImportService._fail(report, row_number, "Plate number already registered")
+            else:
+                rows.append((row_number, cab))
+        if not rows:
+            return
+
+        idle_since = datetime.utcnow()
+        try:
+            cab_ids = CabRepository.bulk_create_cabs(db, [cab for _, cab in rows], idle_since)
+            db.commit()
+        except SQLAlchemyError as e:
+            db.rollback()
+            for row_number, _ in rows:
+                CabImportService._fail(report, row_number, f"Database error: {e.__class__.__name__}")
+            return
+
+        report.imported += len(cab_ids)
+        for cab_id, (_, cab) in zip(cab_ids, rows):
+            dispatch_index.mark_idle(cab_id, cab["current_city_id"], idle_since)
+        AnalyticsService.invalidate(city_ids={cab["current_city_id"] for _, cab in rows})
+
+    @staticmethod
+    def _fail(report: CabImportReport, row_number: int, error: str):
+        report.failed += 1
+        report.errors.append(CabImportError(row=row_number, error=error))
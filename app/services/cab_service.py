@@ -1,10 +1,17 @@
 from sqlalchemy.orm import Session
 from fastapi import HTTPException
 from app.repositories.cab_repository import CabRepository
+from app.services.analytics_service import AnalyticsService
 from app.services.city_service import CityService
-from app.schemas import CabCreate
+from app.schemas import CabCreate, CabHistoryResponse, CabResponse
 from app.models import Cab
+from app.state_machine import CabState
+from app.utils.cursor import decode_cursor, encode_cursor
+from app.utils.dispatch_index import dispatch_index
+from app.utils.streaming import stream_ndjson
 from sqlalchemy.exc import SQLAlchemyError
+from typing import Iterator, Optional
+from datetime import datetime
 
 
 class CabService:
@@ -12,8 +19,7 @@ class CabService:
     def register_cab(db: Session, cab_data: CabCreate) -> Cab:
         """Registers a new cab and logs initial history."""
         try:
-            city = CityService.get_city_by_id(db, cab_data.current_city_id)
-            if not city:
+            if not CityService.city_exists(db, cab_data.current_city_id):
                 raise HTTPException(status_code=400, detail="Invalid city ID: City does not exist.")
 
             cab = CabRepository.create_cab(db, cab_data.model_dump())
@@ -21,6 +27,8 @@ class CabService:
             # Log initial cab state in history
             CabRepository.create_cab_history(db, cab.id, cab.state)
 
+            CabService.sync_dispatch_index(cab)
+            AnalyticsService.invalidate(city_ids=[cab.current_city_id], cab_ids=[cab.id])
             return cab
         except SQLAlchemyError as e:
             raise HTTPException(status_code=500, detail=f"Error registering cab: {str(e)}")
@@ -31,18 +39,44 @@ class CabService:
         cab = CabRepository.update_cab_location(db, cab_id, city_id)
         if not cab:
             raise HTTPException(status_code=404, detail="Cab not found")
+        CabService.sync_dispatch_index(cab)
+        AnalyticsService.invalidate(city_ids=[city_id], cab_ids=[cab_id])
         return cab
 
     @staticmethod
-    def update_cab_state(db: Session, cab_id: int, new_state: str) -> Cab:
-        """Updates a cab's state (Idle, On Trip, etc.)."""
-        cab = CabRepository.update_cab_state(db, cab_id, new_state)
+    def update_cab_state(db: Session, cab_id: int, new_state: str, expected_version: Optional[int] = None) -> CabResponse:
+        """
+        Updates a cab's state (Idle, On Trip, etc.) following the transition table.
+        The conditional UPDATE and the history row commit together; an invalid, stale
+        (``expected_version`` mismatch) or raced transition fails with 409 without locking,
+        and a missing cab with 404.
+        """
+        cab = CabRepository.update_cab_state(db, cab_id, new_state, expected_version)
         if not cab:
-            raise HTTPException(status_code=404, detail="Cab not found")
+            db.rollback()
+            # Only a rejected UPDATE pays for telling the two failures apart
+            if db.get(Cab, cab_id) is None:
+                raise HTTPException(status_code=404, detail="Cab not found")
+            raise HTTPException(
+                status_code=409,
+                detail=f"Cab cannot move to {CabState(new_state).value} from its current state/version"
+            )
 
-        # Log initial cab state in history
-        CabRepository.create_cab_history(db, cab.id, cab.state)
-        return cab
+        CabRepository.create_cab_history(db, cab.id, cab.state, commit=False)
+        updated = CabResponse.model_validate(cab)  # Snapshot before commit expires the instance
+        db.commit()
+
+        CabService.sync_dispatch_index(updated)
+        AnalyticsService.invalidate(cab_ids=[cab_id])
+        return updated
+
+    @staticmethod
+    def sync_dispatch_index(cab):
+        """Mirrors a cab's current state and location into the dispatch index."""
+        if cab.state == CabState.IDLE:
+            dispatch_index.mark_idle(cab.id, cab.current_city_id, cab.last_idle_time)
+        else:
+            dispatch_index.discard(cab.id)
 
     @staticmethod
     def get_available_cabs(db: Session, city_id: int) -> list[Cab]:
@@ -52,6 +86,19 @@ class CabService:
             raise HTTPException(status_code=404, detail="No available cabs found")
         return available_cabs
 
+    @staticmethod
+    def get_available_cabs_page(db: Session, city_id: int, cursor: Optional[str], limit: Optional[int]):
+        """Returns one page of available cabs and the cursor of the next page (None on the last page)."""
+        after = decode_cursor(cursor) if cursor else None
+        cabs = CabRepository.get_available_cabs_page(db, city_id, after, limit)
+        next_cursor = encode_cursor(cabs[-1].last_idle_time, cabs[-1].id) if limit and len(cabs) == limit else None
+        return cabs, next_cursor
+
+    @staticmethod
+    def stream_available_cabs(city_id: int) -> Iterator[str]:
+        """Streams every available cab of a city as NDJSON."""
+        return stream_ndjson(CabResponse, lambda db: CabRepository.stream_available_cabs(db, city_id))
+
     @staticmethod
     def get_cab_history(db: Session, cab_id: int):
         """Gets cab history from repository."""
@@ -59,3 +106,17 @@ class CabService:
         if not history:
             raise HTTPException(status_code=404, detail="No history found for this cab")
         return history
+
+    @staticmethod
+    def get_cab_history_page(db: Session, cab_id: int, since: Optional[datetime], until: Optional[datetime],
+                             cursor: Optional[str], limit: Optional[int]):
+        """Returns one page of cab history and the cursor of the next page (None on the last page)."""
+        after = decode_cursor(cursor) if cursor else None
+        history = CabRepository.get_cab_history_page(db, cab_id, since, until, after, limit)
+        next_cursor = encode_cursor(history[-1].timestamp, history[-1].id) if limit and len(history) == limit else None
+        return history, next_cursor
+
+    @staticmethod
+    def stream_cab_history(cab_id: int, since: Optional[datetime], until: Optional[datetime]) -> Iterator[str]:
+        """Streams cab history as NDJSON, latest first."""
+        return stream_ndjson(CabHistoryResponse, lambda db: CabRepository.stream_cab_history(db, cab_id, since, until))
@@ -1,6 +1,10 @@
+from typing import Iterator, Optional
 from sqlalchemy.orm import Session
 from app.repositories.city_repository import CityRepository
-from app.schemas import CityCreate
+from app.schemas import CityCreate, CityResponse
+from app.utils.city_registry import city_registry
+from app.utils.cursor import decode_cursor, encode_cursor
+from app.utils.streaming import stream_ndjson
 
 
 class CityService:
@@ -8,13 +12,29 @@ class CityService:
     @staticmethod
     def register_city(db: Session, city_data: CityCreate):
         """Registers a new city."""
-        return CityRepository.create_city(db, city_data.dict())
+        city = CityRepository.create_city(db, city_data.dict())
+        if city:
+            city_registry.put(city.id, city.name)
+        return city
 
     @staticmethod
     def get_all_cities(db: Session):
         """Retrieves all registered cities."""
         return CityRepository.get_all_cities(db)
 
+    @staticmethod
+    def get_cities_page(db: Session, cursor: Optional[str], limit: Optional[int]):
+        """Returns one page of cities and the cursor of the next page (None on the last page)."""
+        after_id = decode_cursor(cursor)[1] if cursor else None
+        cities = CityRepository.get_cities_page(db, after_id, limit)
+        next_cursor = encode_cursor(None, cities[-1].id) if limit and len(cities) == limit else None
+        return cities, next_cursor
+
+    @staticmethod
+    def stream_cities() -> Iterator[str]:
+        """Streams every city as NDJSON."""
+        return stream_ndjson(CityResponse, CityRepository.stream_cities)
+
     @staticmethod
     def get_city_by_id(db: Session, city_id: int):
         """Fetches a city by its ID."""
@@ -23,9 +43,38 @@ class CityService:
     @staticmethod
     def update_city(db: Session, city_id: int, updated_data: dict):
         """Updates a city's details."""
-        return CityRepository.update_city(db, city_id, updated_data)
+        city = CityRepository.update_city(db, city_id, updated_data)
+        if city:
+            city_registry.put(city.id, city.name)
+        return city
 
     @staticmethod
     def delete_city(db: Session, city_id: int):
         """Deletes a city by ID."""
-        return CityRepository.delete_city(db, city_id)
+        deleted = CityRepository.delete_city(db, city_id)
+        city_registry.remove(city_id)
+        return deleted
+
+    @staticmethod
+    def load_registry(db: Session):
+        """(Re)loads the in-process city registry from the database."""
+        city_registry.load(CityRepository.get_city_names(db))
+
+    @staticmethod
+    def city_exists(db: Session, city_id: int) -> bool:
+        """Checks a city id against the registry; only unknown ids fall back to the database."""
+        if city_registry.needs_load():
+            CityService.load_registry(db)
+        if city_registry.get_name(city_id) is not None:
+            return True
+        city = CityRepository.get_city_by_id(db, city_id)  # Created by another worker since the last load
+        if city:
+            city_registry.put(city.id, city.name)
+        return city is not None
+
+    @staticmethod
+    def get_city_ids(db: Session) -> set[int]:
+        """Ids of every city, from the registry."""
+        if city_registry.needs_load():
+            CityService.load_registry(db)
+        return city_registry.ids()
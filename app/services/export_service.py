@@ -0,0 +1,73 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from enum import Enum
+from typing import Iterator, Optional
+from fastapi import HTTPException
+from app.database import SessionLocal
+from app.repositories.export_repository import EXPORT_TABLES, ExportRepository
+
+EXPORT_MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+
+class ExportService:
+    """Streaming bulk export of bookings and cab history as CSV or NDJSON, optionally gzipped."""
+
+    @staticmethod
+    def validate_table(table: str):
+        if table not in EXPORT_TABLES:
+            raise HTTPException(status_code=404, detail=f"Unknown table; exportable tables: {', '.join(EXPORT_TABLES)}")
+
+    @staticmethod
+    def filename(table: str, file_format: str, compress: bool) -> str:
+        return f"{table}.{file_format}" + (".gz" if compress else "")
+
+    @staticmethod
+    def _value(value):
+        if isinstance(value, datetime):
+            return value.isoformat()
+        if isinstance(value, Enum):
+            return value.value
+        return value
+
+    @staticmethod
+    def _encode(batch: list, columns: list[str], file_format: str) -> str:
+        if file_format == "ndjson":
+            return "".join(
+                json.dumps({name: ExportService._value(value) for name, value in zip(columns, row)}) + "\n"
+                for row in batch
+            )
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator="\n").writerows(
+            [ExportService._value(value) for value in row] for row in batch
+        )
+        return buffer.getvalue()
+
+    @staticmethod
+    def export(table: str, file_format: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+               after_id: Optional[int] = None, compress: bool = False) -> Iterator[bytes]:
+        """
+        Yields the export one batch at a time, so memory stays bounded whatever the row count.
+        Rows come in id order: an interrupted export resumes with ``after_id`` set to the last id received.
+        The stream owns its session, so it stays open exactly as long as the response body.
+        """
+        columns = EXPORT_TABLES[table][0]
+        compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31: gzip container
+
+        def chunks() -> Iterator[str]:
+            if file_format == "csv" and after_id is None:
+                yield ",".join(columns) + "\n"
+            with SessionLocal() as db:
+                for batch in ExportRepository.iter_batches(db, table, since, until, after_id):
+                    yield ExportService._encode(batch, columns, file_format)
+
+        for chunk in chunks():
+            data = chunk.encode()
+            if compressor:
+                data = compressor.compress(data)
+            if data:
+                yield data
+        if compressor:
+            yield compressor.flush()
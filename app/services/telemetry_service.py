@@ -0,0 +1,107 @@
+from datetime import datetime
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import SQLAlchemyError
+from fastapi import HTTPException
+from app.repositories.cab_repository import CabRepository
+from app.services.analytics_service import AnalyticsService
+from app.schemas import TelemetryEvent, TelemetryReport
+from app.state_machine import CabState, can_transition
+from app.utils.dispatch_index import dispatch_index
+
+
+class TelemetryService:
+    """High-rate ingestion of cab location/state events from the vehicle gateway."""
+
+    @staticmethod
+    def parse_ndjson(payload: bytes) -> tuple[list[TelemetryEvent], int]:
+        """Parses an NDJSON payload; returns the valid events and the number of invalid lines."""
+        events, invalid = [], 0
+        for line in payload.splitlines():
+            if not line.strip():
+                continue
+            try:
+                events.append(TelemetryEvent.model_validate_json(line))
+            except ValidationError:
+                invalid += 1
+        return events, invalid
+
+    @staticmethod
+    def latest_per_cab(events: list[TelemetryEvent]) -> dict[int, TelemetryEvent]:
+        """
+        Keeps only the newest event of every cab.
+        Events are ordered by timestamp when present, otherwise by arrival order.
+        """
+        latest = {}
+        for event in events:
+            current = latest.get(event.cab_id)
+            if current is None or not (event.timestamp and current.timestamp and event.timestamp < current.timestamp):
+                latest[event.cab_id] = event
+        return latest
+
+    @staticmethod
+    def ingest(db: Session, events: list[TelemetryEvent], invalid: int = 0) -> TelemetryReport:
+        """
+        Applies a batch of telemetry events in one transaction.
+        - Deduplicates by cab, keeping the latest event.
+        - State changes not allowed by the transition table are rejected.
+        - Reads the current rows with one SELECT; every change is written with the conditional
+          UPDATE of `CabRepository.update_cab_state` (transition table and version in the WHERE),
+          so it only lands if the cab is unchanged since the read (otherwise it counts as a
+          conflict). State changes are logged with one bulk history INSERT.
+        """
+        report = TelemetryReport(received=len(events) + invalid, invalid=invalid)
+        latest = TelemetryService.latest_per_cab(events)
+        if not latest:
+            return report
+
+        now = datetime.utcnow()
+        current = CabRepository.get_cab_snapshots(db, list(latest))
+        updates = []
+        for cab_id, event in latest.items():
+            cab = current.get(cab_id)
+            if cab is None:
+                report.unknown_cabs.append(cab_id)
+                continue
+
+            state = event.state or cab.state
+            city_id = event.city_id if event.city_id is not None else cab.current_city_id
+            if state == cab.state and city_id == cab.current_city_id:
+                report.unchanged += 1
+                continue
+
+            if state != cab.state and not can_transition(cab.state, state):
+                report.rejected += 1  # Checked again by the UPDATE itself, against the current row
+                continue
+
+            timestamp = event.timestamp or now
+            last_idle_time = cab.last_idle_time
+            if state != cab.state and state == CabState.IDLE:
+                last_idle_time = timestamp
+            updates.append({
+                "id": cab_id, "version": cab.version, "state": state, "current_city_id": city_id,
+                "last_idle_time": last_idle_time, "previous_state": cab.state, "timestamp": timestamp,
+            })
+
+        try:
+            written_ids = CabRepository.update_cabs_at_version(db, updates)
+            written = [row for row in updates if row["id"] in written_ids]
+            CabRepository.create_cab_histories(db, [
+                (row["id"], row["state"], row["timestamp"]) for row in written if row["state"] != row["previous_state"]
+            ])
+            db.commit()
+        except SQLAlchemyError:
+            db.rollback()
+            raise HTTPException(status_code=500, detail="Failed to apply telemetry")
+
+        for row in written:
+            if row["state"] == CabState.IDLE:
+                dispatch_index.mark_idle(row["id"], row["current_city_id"], row["last_idle_time"])
+            else:
+                dispatch_index.discard(row["id"])
+        AnalyticsService.invalidate(city_ids={row["current_city_id"] for row in written},
+                                    cab_ids=[row["id"] for row in written])
+
+        report.applied = len(written)
+        report.conflicts = len(updates) - len(written)
+        return report
@@ -5,3 +5,23 @@ class CabState(str, Enum):
     IDLE = "IDLE"
     ON_TRIP = "ON_TRIP"
     MAINTENANCE = "MAINTENANCE"
+
+
+# Allowed transitions: current state -> states it may move to
+TRANSITIONS = {
+    CabState.IDLE: frozenset({CabState.ON_TRIP, CabState.MAINTENANCE}),
+    CabState.ON_TRIP: frozenset({CabState.IDLE}),
+    CabState.MAINTENANCE: frozenset({CabState.IDLE}),
+}
+
+# Compiled once at import: target state -> states it can be reached from.
+# Used directly in conditional UPDATEs (`WHERE state IN (...)`).
+ALLOWED_SOURCES = {
+    target: tuple(source for source, targets in TRANSITIONS.items() if target in targets)
+    for target in CabState
+}
+
+
+def can_transition(current: CabState, target: CabState) -> bool:
+    """Returns True if a cab may move from ``current`` to ``target``."""
+    return target in TRANSITIONS[CabState(current)]
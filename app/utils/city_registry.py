@@ -0,0 +1,67 @@
+import threading
+import time
+from typing import Iterable, Optional, Tuple
+from app.config import config
+
+
+class CityRegistry:
+    """
+    In-process id <-> name map of every city, used to validate city ids without a query.
+
+    Cities change rarely and are read on every cab registration, so the registry is loaded
+    once at startup and kept current by this process's creates, updates and deletes. Other
+    workers' changes are picked up when the registry is reloaded after ``refresh_seconds``;
+    until then a city created elsewhere is found by the database fallback in
+    `CityService.city_exists`, and a city deleted elsewhere is still accepted.
+    """
+
+    def __init__(self, refresh_seconds: float = 300):
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._names: dict[int, str] = {}
+        self._ids: dict[str, int] = {}
+        self._loaded_at: Optional[float] = None
+
+    def needs_load(self) -> bool:
+        """Returns True if the registry has never been loaded or is due for a refresh."""
+        with self._lock:
+            return self._loaded_at is None or time.monotonic() - self._loaded_at >= self.refresh_seconds
+
+    def load(self, cities: Iterable[Tuple[int, str]]):
+        """Replaces the registry with ``(city_id, name)`` pairs."""
+        names = dict(cities)
+        with self._lock:
+            self._names = names
+            self._ids = {name: city_id for city_id, name in names.items()}
+            self._loaded_at = time.monotonic()
+
+    def get_name(self, city_id: int) -> Optional[str]:
+        return self._names.get(city_id)
+
+    def get_id(self, name: str) -> Optional[int]:
+        return self._ids.get(name)
+
+    def ids(self) -> set[int]:
+        """Snapshot of every known city id."""
+        with self._lock:
+            return set(self._names)
+
+    def put(self, city_id: int, name: str):
+        """Records a created or renamed city."""
+        with self._lock:
+            previous = self._names.get(city_id)
+            if previous is not None and self._ids.get(previous) == city_id:
+                del self._ids[previous]
+            self._names[city_id] = name
+            self._ids[name] = city_id
+
+    def remove(self, city_id: int):
+        """Forgets a deleted city."""
+        with self._lock:
+            name = self._names.pop(city_id, None)
+            if name is not None and self._ids.get(name) == city_id:
+                del self._ids[name]
+
+
+# Initialize the process-wide city registry
+city_registry = CityRegistry(refresh_seconds=config.CITY_REGISTRY_REFRESH_SECONDS)
@@ -0,0 +1,104 @@
+"""
+Vectorized (NumPy/pandas) analytics over columnar slices of cab history and bookings.
+
+History columns are parallel arrays sorted by cab and time: ``cab_ids`` (int64), ``states``
+(int8 codes from `STATE_CODES`) and ``timestamps`` (naive UTC ``datetime64[us]``), as loaded by
+`ColumnarRepository`. Every function is O(rows) NumPy work without per-row Python.
+"""
+from typing import Sequence
+import numpy as np
+import pandas as pd
+from app.state_machine import CabState
+
+STATE_CODES = {state: code for code, state in enumerate(CabState)}
+STATES = list(CabState)
+IDLE_CODE = STATE_CODES[CabState.IDLE]
+
+_NAT = np.datetime64("NaT", "us")
+
+
+def run_starts(*keys: np.ndarray) -> np.ndarray:
+    """Boolean mask of the rows where any of the (sorted) ``keys`` changes from the previous row."""
+    starts = np.zeros(len(keys[0]), dtype=bool)
+    if len(starts):
+        starts[0] = True
+        for key in keys:
+            starts[1:] |= key[1:] != key[:-1]
+    return starts
+
+
+def fold_intervals(cab_ids: np.ndarray, states: np.ndarray, timestamps: np.ndarray) -> dict[str, np.ndarray]:
+    """
+    Vectorized counterpart of `StateIntervals._fold` over every cab at once: the last state of
+    each instant wins and repeated states extend the running interval. Returns the interval
+    columns; ``end`` is NaT for each cab's open interval and ``cumulative_idle_before`` is in seconds.
+    """
+    last_of_instant = np.append(run_starts(cab_ids, timestamps)[1:], True)
+    cab_ids, states, timestamps = cab_ids[last_of_instant], states[last_of_instant], timestamps[last_of_instant]
+
+    keep = run_starts(cab_ids, states)
+    cab_ids, states, starts = cab_ids[keep], states[keep], timestamps[keep]
+
+    first_of_cab = run_starts(cab_ids)
+    closed = np.append(~first_of_cab[1:], False)
+    ends = np.where(closed, np.append(starts[1:], _NAT), _NAT)
+
+    # Idle microseconds of each closed IDLE interval, accumulated per cab (exclusive prefix sum)
+    idle_us = np.where(closed & (states == IDLE_CODE), (ends - starts).astype(np.int64), 0)
+    before = np.cumsum(idle_us) - idle_us
+    before -= before[np.flatnonzero(first_of_cab)][np.cumsum(first_of_cab) - 1]
+
+    return {"cab_id": cab_ids, "start": starts, "end": ends, "state": states,
+            "cumulative_idle_before": before / 1e6}
+
+
+def idle_seconds(cab_ids: np.ndarray, states: np.ndarray, timestamps: np.ndarray,
+                 start: np.datetime64, end: np.datetime64) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Idle seconds of every cab within ``[start, end]``, with `CabRepository.get_idle_time`
+    semantics: each IDLE row lasts until the cab's next row (or ``end``), clipped to the window.
+    The history must include each cab's last row before ``start``. Returns ``(cab_ids, seconds)``.
+    """
+    start, end = np.datetime64(start, "us"), np.datetime64(end, "us")
+    first_of_cab = run_starts(cab_ids)
+    if not len(first_of_cab):
+        return cab_ids, np.zeros(0)
+
+    has_next = np.append(~first_of_cab[1:], False)
+    until = np.where(has_next, np.append(timestamps[1:], end), end)
+    overlap = np.minimum(until, end) - np.maximum(timestamps, start)
+    idle_us = np.where(states == IDLE_CODE, np.maximum(overlap.astype(np.int64), 0), 0)
+
+    first = np.flatnonzero(first_of_cab)
+    return cab_ids[first], np.add.reduceat(idle_us, first) / 1e6
+
+
+def hourly_histogram(timestamps: np.ndarray, timezone: str = "UTC") -> np.ndarray:
+    """Counts naive UTC ``timestamps`` per local hour of day (24 buckets) in ``timezone``."""
+    hours = pd.DatetimeIndex(timestamps).tz_localize("UTC").tz_convert(timezone).hour
+    return np.bincount(np.asarray(hours), minlength=24)
+
+
+def hour_of_week_matrix(city_ids: np.ndarray, weekdays: np.ndarray, hours: np.ndarray,
+                        counts: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Scatters ``(city, weekday, hour, count)`` rows (weekday 0 = Sunday) into a dense
+    ``cities x 168`` matrix whose columns run from Monday 00 to Sunday 23.
+    Returns ``(sorted unique city ids, matrix)``.
+    """
+    cities, rows = np.unique(city_ids, return_inverse=True)
+    matrix = np.zeros((len(cities), 168), dtype=np.int64)
+    np.add.at(matrix, (rows, (weekdays + 6) % 7 * 24 + hours), counts)
+    return cities, matrix
+
+
+def duration_summary(seconds: np.ndarray, percentiles: Sequence[float] = (50, 90, 99)) -> dict:
+    """Count, mean and percentiles (linear interpolation) of durations in seconds."""
+    if not len(seconds):
+        return {"count": 0}
+    values = np.percentile(seconds, percentiles)
+    return {
+        "count": int(len(seconds)),
+        "mean": float(seconds.mean()),
+        **{f"p{percentile:g}": float(value) for percentile, value in zip(percentiles, values)},
+    }
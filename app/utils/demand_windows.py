@@ -0,0 +1,101 @@
+import heapq
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Iterable, Optional, Tuple
+from app.config import config
+
+# Sliding windows served by `GET /analytics/top_cities`, in seconds
+DEMAND_WINDOWS = {"15m": 15 * 60, "1h": 60 * 60, "24h": 24 * 60 * 60}
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+class DemandWindows:
+    """
+    In-memory per-city booking counts over sliding windows (e.g. the last 15 minutes).
+
+    Bookings are counted in fixed ``bucket_seconds`` buckets, so a window covers its current,
+    partially elapsed bucket plus the previous ones, and its edge is exact to one bucket.
+    Every window keeps a running total per city; when time moves on, the buckets that slid
+    out of a window are subtracted from it. Recording a booking and expiring a bucket are
+    O(1) per city, memory is O(cities x buckets of the longest window), and a top-k query is
+    a partial sort of the per-city totals.
+
+    Like the dispatch index, the counters are a per-process view: they are rebuilt from the
+    bookings table on startup and then only see the bookings made by this process.
+    """
+
+    def __init__(self, windows: dict[str, int], bucket_seconds: int = 60):
+        self.bucket_seconds = bucket_seconds
+        self._sizes = {name: max(1, seconds // bucket_seconds) for name, seconds in windows.items()}
+        self._span = max(self._sizes.values())
+        self._lock = threading.Lock()
+        self._buckets: dict[int, Counter] = {}  # bucket -> city_id -> bookings
+        self._totals = {name: Counter() for name in windows}
+        self._now: Optional[int] = None  # Latest bucket seen
+
+    def _bucket(self, moment: datetime) -> int:
+        return int((moment - _EPOCH).total_seconds() // self.bucket_seconds)
+
+    def record(self, city_id: int, count: int = 1, moment: Optional[datetime] = None):
+        """Counts ``count`` bookings of a city made at ``moment`` (naive UTC, default now)."""
+        with self._lock:
+            bucket = self._bucket(moment or datetime.utcnow())
+            self._advance(bucket)
+            self._add(city_id, bucket, count)
+
+    def load(self, rows: Iterable[Tuple[int, datetime, int]], now: Optional[datetime] = None):
+        """Replaces every counter with ``(city_id, pickup_time, bookings)`` rows."""
+        with self._lock:
+            self._buckets = {}
+            self._totals = {name: Counter() for name in self._sizes}
+            self._now = self._bucket(now or datetime.utcnow())
+            for city_id, moment, count in rows:
+                self._add(city_id, self._bucket(moment), count)
+
+    def top(self, window: str, k: int, now: Optional[datetime] = None) -> list[Tuple[int, int]]:
+        """The ``k`` cities with the most bookings in ``window``, as ``(city_id, bookings)``."""
+        with self._lock:
+            self._advance(self._bucket(now or datetime.utcnow()))
+            return heapq.nlargest(k, self._totals[window].items(), key=lambda item: (item[1], -item[0]))
+
+    def _add(self, city_id: int, bucket: int, count: int):
+        bucket = min(bucket, self._now)  # Clock skew: count early arrivals in the current bucket
+        if bucket <= self._now - self._span:
+            return
+        self._buckets.setdefault(bucket, Counter())[city_id] += count
+        for name, size in self._sizes.items():
+            if bucket > self._now - size:
+                self._totals[name][city_id] += count
+
+    def _advance(self, now: int):
+        """Moves time forward to bucket ``now``, subtracting the buckets that left each window."""
+        if self._now is None:
+            self._now = now
+        if now <= self._now:
+            return
+
+        for name, size in self._sizes.items():
+            first, last = self._now - size + 1, now - size + 1  # Expire buckets in [first, last)
+            if last - first >= size:
+                self._totals[name] = Counter()
+                continue
+            totals = self._totals[name]
+            for bucket in range(first, last):
+                for city_id, count in self._buckets.get(bucket, {}).items():
+                    totals[city_id] -= count
+                    if totals[city_id] <= 0:
+                        del totals[city_id]
+
+        first, last = self._now - self._span + 1, now - self._span + 1
+        if last - first >= self._span:
+            self._buckets = {}
+        else:
+            for bucket in range(first, last):
+                self._buckets.pop(bucket, None)
+        self._now = now
+
+
+# Initialize the process-wide demand counters
+demand_windows = DemandWindows(DEMAND_WINDOWS, bucket_seconds=config.DEMAND_WINDOW_BUCKET_SECONDS)
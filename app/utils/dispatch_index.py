@@ -0,0 +1,129 @@
+import heapq
+import random
+import threading
+import time
+from datetime import datetime
+from typing import Iterable, Optional, Tuple
+from app.config import config
+
+
+class DispatchIndex:
+    """
+    In-memory, per-city priority index of IDLE cabs used by the booking hot path.
+
+    Each city owns a min-heap keyed on ``(last_idle_time, random tie-breaker)`` so the
+    longest idle cab is always at the head, and cabs with identical idle times are
+    picked uniformly at random. Removals are lazy: the live entry of every cab is kept
+    in ``_entries`` and stale heap items are skipped when popped.
+
+    The index is a cache, not the source of truth. A city is (re)loaded from the
+    database when it is first used, when its heap runs empty and after
+    ``refresh_seconds``, and every popped cab must still be claimed in the database.
+    """
+
+    def __init__(self, refresh_seconds: float = 30):
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._heaps: dict[int, list] = {}
+        self._live: dict[int, int] = {}
+        self._loaded_at: dict[int, float] = {}
+        self._entries: dict[int, Tuple[int, tuple]] = {}  # cab_id -> (city_id, heap item)
+
+    @staticmethod
+    def _key(last_idle_time: Optional[datetime]) -> datetime:
+        # NULL idle times sort first, mirroring ORDER BY last_idle_time NULLS FIRST
+        return last_idle_time or datetime.min
+
+    def needs_load(self, city_id: int) -> bool:
+        """Returns True if the city has never been loaded, is empty or is due for a refresh."""
+        with self._lock:
+            loaded_at = self._loaded_at.get(city_id)
+            if loaded_at is None or not self._live.get(city_id):
+                return True
+            return time.monotonic() - loaded_at >= self.refresh_seconds
+
+    def load_city(self, city_id: int, idle_cabs: Iterable[Tuple[int, Optional[datetime]]]):
+        """Replaces the city's heap with the given ``(cab_id, last_idle_time)`` pairs."""
+        with self._lock:
+            self._drop_city(city_id)
+            heap = []
+            for cab_id, last_idle_time in idle_cabs:
+                self._remove_entry(cab_id)
+                item = (self._key(last_idle_time), random.random(), cab_id)
+                heap.append(item)
+                self._entries[cab_id] = (city_id, item)
+            heapq.heapify(heap)
+            self._heaps[city_id] = heap
+            self._live[city_id] = len(heap)
+            self._loaded_at[city_id] = time.monotonic()
+
+    def mark_idle(self, cab_id: int, city_id: Optional[int], last_idle_time: Optional[datetime]):
+        """Adds (or moves) a cab that is IDLE in ``city_id``."""
+        with self._lock:
+            self._remove_entry(cab_id)
+            # Cities that were never loaded will pick the cab up from the database
+            if city_id is None or city_id not in self._heaps:
+                return
+            item = (self._key(last_idle_time), random.random(), cab_id)
+            heapq.heappush(self._heaps[city_id], item)
+            self._entries[cab_id] = (city_id, item)
+            self._live[city_id] += 1
+
+    def discard(self, cab_id: int):
+        """Removes a cab that is no longer available for dispatch."""
+        with self._lock:
+            self._remove_entry(cab_id)
+
+    def pop(self, city_id: int) -> Optional[int]:
+        """Removes and returns the id of the longest idle cab in the city, if any."""
+        with self._lock:
+            heap = self._heaps.get(city_id)
+            while heap:
+                item = heapq.heappop(heap)
+                entry = self._entries.get(item[2])
+                if entry is not None and entry[1] is item:
+                    del self._entries[item[2]]
+                    self._live[city_id] -= 1
+                    return item[2]
+            return None
+
+    def pop_many(self, city_id: int, count: int) -> list[int]:
+        """Pops up to ``count`` cab ids from the city, longest idle first."""
+        cab_ids = []
+        while len(cab_ids) < count:
+            cab_id = self.pop(city_id)
+            if cab_id is None:
+                break
+            cab_ids.append(cab_id)
+        return cab_ids
+
+    def invalidate(self, city_id: Optional[int] = None):
+        """Forgets one city (or every city) so it is reloaded on next use."""
+        with self._lock:
+            for cid in [city_id] if city_id is not None else list(self._heaps):
+                self._drop_city(cid)
+
+    def _drop_city(self, city_id: int):
+        for _, _, cab_id in self._heaps.pop(city_id, []):
+            entry = self._entries.get(cab_id)
+            if entry is not None and entry[0] == city_id:
+                del self._entries[cab_id]
+        self._live.pop(city_id, None)
+        self._loaded_at.pop(city_id, None)
+
+    def _remove_entry(self, cab_id: int):
+        entry = self._entries.pop(cab_id, None)
+        if entry is None:
+            return
+        city_id = entry[0]
+        self._live[city_id] -= 1
+        heap = self._heaps[city_id]
+        # Compact once stale items dominate the heap
+        if len(heap) > 64 and len(heap) > 2 * self._live[city_id]:
+            live = [item for item in heap if self._entries.get(item[2], (None, None))[1] is item]
+            heapq.heapify(live)
+            self._heaps[city_id] = live
+
+
+# Initialize the process-wide dispatch index
+dispatch_index = DispatchIndex(refresh_seconds=config.DISPATCH_INDEX_REFRESH_SECONDS)
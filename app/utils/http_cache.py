@@ -0,0 +1,24 @@
+import hashlib
+import json
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+
+
+def cached_json_response(request: Request, content, max_age: float) -> Response:
+    """
+    JSON response with a strong ``ETag`` (hash of the body) and ``Cache-Control: private, max-age``.
+    A request whose ``If-None-Match`` matches the current body gets an empty 304 instead.
+    Models are serialized by pydantic directly, which keeps large payloads fast.
+    """
+    if isinstance(content, BaseModel):
+        body = content.model_dump_json().encode()
+    else:
+        body = json.dumps(jsonable_encoder(content), separators=(",", ":")).encode()
+    etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+    headers = {"ETag": etag, "Cache-Control": f"private, max-age={int(max_age)}"}
+
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (tag.strip() for tag in if_none_match.split(",")) or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
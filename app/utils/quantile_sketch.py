@@ -0,0 +1,80 @@
+import math
+from typing import Optional
+import numpy as np
+
+# Values at or below this are counted as zero (durations are in seconds)
+MIN_VALUE = 1e-3
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch with a relative error guarantee (DDSketch).
+
+    Positive values are counted in logarithmic bins: bin ``i`` holds the values in
+    ``(gamma^(i-1), gamma^i]`` with ``gamma = (1 + a) / (1 - a)``, and answers with
+    ``2 gamma^i / (gamma + 1)``. Any quantile estimate is therefore within a factor
+    ``1 +/- a`` (``a = relative_accuracy``) of the exact value of the same rank, however many
+    values were added. Sketches merge by adding bin counts, so per-process or per-batch
+    sketches can be combined without loss; their size grows with log(max / min) of the
+    values (about 570 bins for 1 s to 1 day at 1%), not with their number.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01, bins: Optional[dict[int, int]] = None, zero_count: int = 0):
+        self.relative_accuracy = relative_accuracy
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self.bins: dict[int, int] = dict(bins or {})
+        self.zero_count = zero_count
+        self.count = zero_count + sum(self.bins.values())
+
+    def add(self, value: float, count: int = 1):
+        if value <= MIN_VALUE:
+            self.zero_count += count
+        else:
+            index = math.ceil(math.log(value) / self._log_gamma)
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.count += count
+
+    def add_many(self, values: np.ndarray):
+        """Adds an array of values in one vectorized pass."""
+        positive = values[values > MIN_VALUE]
+        self.zero_count += len(values) - len(positive)
+        indexes, counts = np.unique(np.ceil(np.log(positive) / self._log_gamma).astype(np.int64), return_counts=True)
+        for index, count in zip(indexes.tolist(), counts.tolist()):
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.count += len(values)
+
+    def merge(self, other: "QuantileSketch"):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimates the value of rank ``floor(q * (count - 1))``; None when the sketch is empty."""
+        if not self.count:
+            return None
+        rank = math.floor(q * (self.count - 1))
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if rank < seen:
+                return 2 * self._gamma ** index / (self._gamma + 1)
+        return 2 * self._gamma ** max(self.bins) / (self._gamma + 1)
+
+    def to_dict(self) -> dict:
+        """JSON-serializable form; bin indexes become string keys."""
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "zero_count": self.zero_count,
+            "bins": {str(index): count for index, count in self.bins.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "QuantileSketch":
+        return cls(data["relative_accuracy"], {int(index): count for index, count in data["bins"].items()},
+                   data["zero_count"])
@@ -0,0 +1,16 @@
+from typing import Callable, Iterable, Iterator
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+from app.database import SessionLocal
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def stream_ndjson(schema: type[BaseModel], rows: Callable[[Session], Iterable]) -> Iterator[str]:
+    """
+    Yields ``rows(db)`` serialized with ``schema``, one JSON document per line.
+    The stream owns its session, so it stays open exactly as long as the response body.
+    """
+    with SessionLocal() as db:
+        for row in rows(db):
+            yield schema.model_validate(row).model_dump_json() + "\n"
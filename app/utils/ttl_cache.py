@@ -0,0 +1,115 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, Iterable, Optional
+from app.config import config
+
+Tag = tuple  # The entity a cached value was computed from, e.g. ("city", 3) or ("cab", 42)
+
+
+class TTLCache:
+    """
+    Bounded, thread-safe LRU cache whose entries also expire after ``ttl_seconds``.
+
+    Every entry is tagged with the entities it was computed from, so a write can drop exactly
+    the affected entries with `invalidate`. Invalidations are numbered and each tag remembers
+    its last one: a value computed while one of its tags was invalidated is returned but not
+    stored, so a slow computation cannot put a pre-write result back into the cache.
+
+    The cache is per process; in multi-process deployments other workers' entries only
+    expire, which bounds their staleness to ``ttl_seconds``.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl_seconds: float = 30):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()  # key -> (expires_at, value, tags)
+        self._keys_by_tag: dict[Tag, set] = {}
+        self._invalidated_at: dict[Tag, int] = {}  # tag -> sequence number of its last invalidation
+        self._sequence = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get_or_compute(self, key: Hashable, tags: Iterable[Tag], compute: Callable[[], object],
+                       result_tags: Optional[Callable[[object], Iterable[Tag]]] = None):
+        """
+        Returns the cached value of ``key``, or computes, stores and returns it.
+        ``result_tags`` adds tags that are only known from the computed value.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                self._remove(key)
+                self.expirations += 1
+            self.misses += 1
+            started_at = self._sequence
+
+        value = compute()
+        tags = frozenset(tags) | frozenset(result_tags(value) if result_tags else ())
+
+        with self._lock:
+            if any(self._invalidated_at.get(tag, 0) > started_at for tag in tags):
+                return value  # Invalidated while computing
+            self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value, tags)
+            for tag in tags:
+                self._keys_by_tag.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+        return value
+
+    def invalidate(self, *tags: Tag):
+        """Drops every entry computed from any of ``tags``."""
+        with self._lock:
+            self._sequence += 1
+            for tag in tags:
+                self._invalidated_at[tag] = self._sequence
+                for key in self._keys_by_tag.pop(tag, ()):
+                    if key in self._entries:
+                        self._remove(key)
+                        self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_tag.clear()
+
+    def metrics(self) -> dict:
+        """Size and hit/miss/eviction counters."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "capacity": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+    def _remove(self, key: Hashable):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_tag[tag]
+
+
+# Initialize the process-wide cache in front of AnalyticsService
+analytics_cache = TTLCache(max_size=config.ANALYTICS_CACHE_MAX_SIZE, ttl_seconds=config.ANALYTICS_CACHE_TTL_SECONDS)
@@ -0,0 +1,58 @@
+import math
+from datetime import datetime
+from typing import Iterable, Optional
+from app.state_machine import CabState
+from app.utils.columnar import STATE_CODES, STATES
+
+
+def sweep_utilization(initial_states: Iterable[tuple[int, Optional[CabState]]],
+                      changes: Iterable[tuple[int, CabState, datetime]],
+                      start: datetime, end: datetime, bucket_seconds: int) -> list[list[float]]:
+    """
+    Sweep-line over state changes: the average number of cabs in each state (`STATES` order)
+    during every ``bucket_seconds`` bucket of ``[start, end)``; the last bucket may be shorter.
+
+    ``initial_states`` holds each cab's state at ``start`` (None if it had none yet) and
+    ``changes`` its later ``(cab_id, state, timestamp)`` changes in timestamp order. The sweep
+    keeps the number of cabs per state and, for the open bucket, the cab-seconds spent in each
+    state: O(changes + buckets) time, one row of state counts per bucket.
+    """
+    total = (end - start).total_seconds()
+    bucket_count = math.ceil(total / bucket_seconds)
+    counts = [0] * len(STATES)
+    current = {}
+    for cab_id, state in initial_states:
+        if state is not None:
+            current[cab_id] = STATE_CODES[CabState(state)]
+            counts[current[cab_id]] += 1
+
+    series = []
+    area = [0.0] * len(STATES)  # Cab-seconds per state in the open bucket, up to `position`
+    position = 0.0
+
+    def close_buckets(until: float):
+        """Closes every bucket that ends at or before ``until`` seconds after ``start``."""
+        nonlocal area, position
+        while len(series) < bucket_count:
+            edge = min((len(series) + 1) * bucket_seconds, total)
+            if edge > until:
+                return
+            length = edge - len(series) * bucket_seconds
+            series.append([round((spent + count * (edge - position)) / length, 3) for spent, count in zip(area, counts)])
+            area, position = [0.0] * len(STATES), edge
+
+    for cab_id, state, timestamp in changes:
+        offset = (timestamp - start).total_seconds()
+        close_buckets(offset)
+        for code, count in enumerate(counts):
+            area[code] += count * (offset - position)
+        position = offset
+
+        previous = current.get(cab_id)
+        if previous is not None:
+            counts[previous] -= 1
+        current[cab_id] = STATE_CODES[CabState(state)]
+        counts[current[cab_id]] += 1
+
+    close_buckets(total)
+    return series
@@ -0,0 +1,28 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.database import Base
+
+
+@pytest.fixture
+def sqlite_engine():
+    """Fresh in-memory SQLite database with every table, on one connection shared across threads."""
+    # Streamed responses read the database from a worker thread
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db(sqlite_engine):
+    """Session on the in-memory database; test modules override it to seed their rows."""
+    with Session(sqlite_engine) as session:
+        yield session
+
+
+@pytest.fixture
+def session_factory(sqlite_engine):
+    """Session factory for code that opens its own sessions (flushers, streamed responses)."""
+    return sessionmaker(bind=sqlite_engine)
@@ -1,7 +1,10 @@
 from unittest.mock import patch, MagicMock
 from fastapi.testclient import TestClient
-from datetime import datetime
+from datetime import date, datetime, timedelta, timezone
 from app.main import app
+from app.schemas import CabIdleTime, DemandHeatmap, TripDurationQuantiles
+from app.services.analytics_service import HOURS_OF_WEEK, AnalyticsService
+from app.utils.ttl_cache import analytics_cache
 
 client = TestClient(app)
 
@@ -20,6 +23,18 @@ def test_get_cab_idle_time_success(mock_get_cab_idle_time):
     assert response.json() == {"idle_time": 120}
 
 
+@patch("app.services.analytics_service.AnalyticsService.get_cab_idle_time")
+def test_get_cab_idle_time_is_an_iso_8601_duration(mock_get_cab_idle_time):
+    """Test the idle time keeps its ISO 8601 duration encoding through the cached response."""
+    mock_get_cab_idle_time.return_value = timedelta(hours=2, seconds=0.5)
+
+    response = client.get("/analytics/cab_idle_time/2?start_time=2025-03-06T10:00:00&end_time=2025-03-06T13:00:00")
+
+    assert response.status_code == 200
+    assert response.text == '{"idle_time":"PT2H0.5S"}'
+    assert "ETag" in response.headers
+
+
 @patch("app.services.analytics_service.AnalyticsService.get_peak_demand_hours")
 def test_get_peak_demand_hours_success(mock_get_peak_demand_hours):
     """Test fetching peak demand hours successfully."""
@@ -52,3 +67,159 @@ def test_get_peak_demand_hours_not_found(mock_get_peak_demand_hours):
 
     assert response.status_code == 404
     assert response.json() == {"detail": "No booking data available for this city"}
+
+
+@patch("app.services.analytics_service.AnalyticsService.get_peak_demand_hours")
+def test_get_peak_demand_hours_with_range_and_timezone(mock_get_peak_demand_hours):
+    """Test the date range and time zone are passed to the service."""
+    mock_get_peak_demand_hours.return_value = 9
+
+    response = client.get(
+        "/analytics/peak_demand/1",
+        params={"start_date": "2025-03-01", "end_date": "2025-03-31", "timezone": "Asia/Kolkata"},
+    )
+
+    assert response.status_code == 200
+    assert response.json() == {"peak_hours": 9}
+    assert mock_get_peak_demand_hours.call_args.args[1:] == (1, date(2025, 3, 1), date(2025, 3, 31), "Asia/Kolkata")
+
+
+def test_get_peak_demand_hours_invalid_range():
+    """Test a date range that ends before it starts is rejected."""
+    response = client.get("/analytics/peak_demand/1", params={"start_date": "2025-03-02", "end_date": "2025-03-01"})
+
+    assert response.status_code == 400
+
+
+def test_get_peak_demand_hours_unknown_timezone():
+    """Test an unknown time zone is rejected."""
+    response = client.get("/analytics/peak_demand/1", params={"timezone": "Mars/Olympus"})
+
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Unknown timezone: Mars/Olympus"}
+
+
+@patch("app.services.analytics_service.AnalyticsService.get_fleet_idle_times")
+def test_get_fleet_idle_time_success(mock_get_fleet_idle_times):
+    """Test fetching the idle time of a city's cabs, least idle first and capped."""
+    mock_get_fleet_idle_times.return_value = [
+        CabIdleTime(cab_id=2, idle_seconds=60.0),
+        CabIdleTime(cab_id=1, idle_seconds=3600.0),
+    ]
+
+    response = client.get("/analytics/idle_time", params={
+        "city_id": 1, "start": "2025-03-06T10:00:00", "end": "2025-03-06T12:00:00", "order": "least", "limit": 2,
+    })
+
+    assert response.status_code == 200
+    assert response.json() == [{"cab_id": 2, "idle_seconds": 60.0}, {"cab_id": 1, "idle_seconds": 3600.0}]
+    assert mock_get_fleet_idle_times.call_args.args[1:] == (
+        1, datetime(2025, 3, 6, 10), datetime(2025, 3, 6, 12), "least", 2
+    )
+
+
+def test_get_fleet_idle_time_invalid_time():
+    """Test fleet idle time with an empty time range."""
+    response = client.get("/analytics/idle_time", params={
+        "city_id": 1, "start": "2025-03-06T12:00:00", "end": "2025-03-06T12:00:00",
+    })
+
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Start time must be before end time"}
+
+
+@patch("app.services.analytics_service.AnalyticsService.get_peak_demand_hours")
+def test_analytics_response_etag(mock_get_peak_demand_hours):
+    """Test analytics responses carry ETag/Cache-Control and answer a matching If-None-Match with 304."""
+    mock_get_peak_demand_hours.return_value = 18
+
+    response = client.get("/analytics/peak_demand/1")
+    assert response.headers["cache-control"].startswith("private, max-age=")
+
+    cached = client.get("/analytics/peak_demand/1", headers={"If-None-Match": response.headers["etag"]})
+    assert cached.status_code == 304
+    assert cached.content == b""
+
+    mock_get_peak_demand_hours.return_value = 19
+    changed = client.get("/analytics/peak_demand/1", headers={"If-None-Match": response.headers["etag"]})
+    assert changed.status_code == 200
+    assert changed.json() == {"peak_hours": 19}
+
+
+@patch("app.services.analytics_service.CabRepository.get_idle_time")
+def test_cab_idle_time_cached_until_cab_write(mock_get_idle_time):
+    """Test repeated idle time queries hit the cache until the cab is written to."""
+    analytics_cache.clear()
+    mock_get_idle_time.return_value = timedelta(minutes=5)
+    start, end = datetime(2025, 3, 6, 10), datetime(2025, 3, 6, 12)
+
+    for _ in range(3):
+        assert AnalyticsService.get_cab_idle_time(None, 1, start, end) == timedelta(minutes=5)
+    # The same window given in another time zone normalizes to the same key
+    AnalyticsService.get_cab_idle_time(None, 1, start.replace(tzinfo=timezone.utc), end.replace(tzinfo=timezone.utc))
+    assert mock_get_idle_time.call_count == 1
+
+    AnalyticsService.invalidate(cab_ids=[2])
+    AnalyticsService.get_cab_idle_time(None, 1, start, end)
+    assert mock_get_idle_time.call_count == 1
+
+    AnalyticsService.invalidate(cab_ids=[1])
+    AnalyticsService.get_cab_idle_time(None, 1, start, end)
+    assert mock_get_idle_time.call_count == 2
+
+
+@patch("app.services.analytics_service.demand_windows.top")
+def test_get_top_cities(mock_top):
+    """Test the top cities endpoint ranks cities from the in-memory counters."""
+    mock_top.return_value = [(3, 12), (1, 7)]
+
+    response = client.get("/analytics/top_cities?window=15m&k=2")
+
+    assert response.status_code == 200
+    assert response.json() == [{"city_id": 3, "bookings": 12}, {"city_id": 1, "bookings": 7}]
+    mock_top.assert_called_once_with("15m", 2)
+    assert client.get("/analytics/top_cities?window=2h").status_code == 422
+
+
+@patch("app.services.analytics_service.AnalyticsService.get_demand_heatmap")
+def test_get_demand_heatmap(mock_get_demand_heatmap):
+    """Test the heatmap is returned as a dense matrix with its axis labels."""
+    mock_get_demand_heatmap.return_value = DemandHeatmap(
+        start_date=date(2025, 3, 1), end_date=date(2025, 3, 31), hours=HOURS_OF_WEEK,
+        city_ids=[1, 4], counts=[[1] * 168, [0] * 168],
+    )
+
+    response = client.get("/analytics/demand_heatmap?start_date=2025-03-01&end_date=2025-03-31")
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["hours"][0] == "Mon 00" and body["hours"][-1] == "Sun 23"
+    assert body["city_ids"] == [1, 4]
+    assert [sum(row) for row in body["counts"]] == [168, 0]
+    assert "etag" in response.headers
+    assert client.get("/analytics/demand_heatmap?start_date=2025-03-31&end_date=2025-03-01").status_code == 400
+
+
+@patch("app.services.analytics_service.AnalyticsService.get_trip_duration_quantiles")
+def test_get_trip_duration(mock_get_trip_duration_quantiles):
+    """Test trip duration percentiles are returned with their mode and error bound."""
+    mock_get_trip_duration_quantiles.return_value = TripDurationQuantiles(
+        city_id=1, trips=5000, mode="sketch", relative_error=0.01,
+        quantiles={"p50": 1200.0, "p90": 2400.0, "p95": 3000.0, "p99": 4200.0},
+    )
+
+    response = client.get("/analytics/trip_duration/1")
+
+    assert response.status_code == 200
+    assert response.json()["mode"] == "sketch"
+    assert response.json()["quantiles"]["p99"] == 4200.0
+
+
+def test_get_utilization_invalid_requests():
+    """Test utilization rejects an empty window and too many buckets."""
+    response = client.get("/analytics/utilization?city_id=1&start=2025-03-06T12:00:00&end=2025-03-06T10:00:00")
+    assert response.status_code == 400
+
+    response = client.get("/analytics/utilization?city_id=1&start=2025-03-01T00:00:00&end=2025-03-31T00:00:00&bucket=1")
+    assert response.status_code == 400
+    assert response.json() == {"detail": "At most 10080 buckets per request"}
@@ -0,0 +1,61 @@
+from concurrent.futures import Future
+from unittest.mock import patch, AsyncMock, MagicMock
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.api import async_routes, booking_routes
+from app.database import get_async_db
+from app.main import with_async_routes
+
+async_app = FastAPI()
+async_app.include_router(with_async_routes(booking_routes.router, async_routes.booking_router))
+async_app.dependency_overrides[get_async_db] = lambda: MagicMock()
+
+client = TestClient(async_app)
+
+
+@patch("app.services.async_booking_service.AsyncBookingService.book_cab", new_callable=AsyncMock)
+def test_async_book_cab_success(mock_book_cab):
+    """Test booking a cab through the async route."""
+    mock_book_cab.return_value = MagicMock(id=1, cab_id=101)
+
+    response = client.post("/bookings/1")
+
+    assert response.status_code == 200
+    assert response.json() == {"message": "Cab booked successfully", "booking_id": 1, "cab_id": 101}
+
+
+@patch("app.api.async_routes.booking_dispatcher.submit")
+@patch("app.services.async_booking_service.AsyncBookingService.book_cab", new_callable=AsyncMock)
+def test_async_book_cab_uses_dispatcher_when_enabled(mock_book_cab, mock_submit):
+    """Test the async booking route goes through the dispatcher when it is enabled."""
+    future = Future()
+    future.set_result(MagicMock(id=2, cab_id=102))
+    mock_submit.return_value = future
+
+    with patch("app.api.async_routes.config.BOOKING_DISPATCHER_ENABLED", True):
+        response = client.post("/bookings/1")
+
+    assert response.json()["cab_id"] == 102
+    mock_submit.assert_called_once_with(1)
+    mock_book_cab.assert_not_called()
+
+
+@patch("app.services.async_booking_service.AsyncBookingService.get_booking_by_id", new_callable=AsyncMock)
+def test_async_get_booking_not_found(mock_get_booking_by_id):
+    """Test fetching a missing booking through the async route."""
+    mock_get_booking_by_id.return_value = None
+
+    response = client.get("/bookings/1")
+
+    assert response.status_code == 404
+    assert response.json() == {"detail": "Booking not found"}
+
+
+def test_with_async_routes_keeps_static_paths_first():
+    """Test async endpoints replace their sync counterparts without shadowing static paths."""
+    merged = with_async_routes(booking_routes.router, async_routes.booking_router)
+    endpoints = {(route.path, tuple(route.methods)): route.endpoint for route in merged.routes}
+
+    assert endpoints[("/bookings/{city_id}", ("POST",))] is async_routes.book_cab
+    assert endpoints[("/bookings/batch", ("POST",))] is booking_routes.book_cabs_batch
+    assert [route.path for route in merged.routes].index("/bookings/batch") == 0
@@ -0,0 +1,76 @@
+import time
+from unittest.mock import patch, MagicMock
+from fastapi import HTTPException
+from app.services.booking_dispatcher import BookingDispatcher
+import pytest
+
+
+@patch("app.services.booking_dispatcher.BookingService.book_cabs")
+def test_concurrent_requests_share_one_claim(mock_book_cabs):
+    """Test requests queued within the wait window are served by a single multi-cab claim."""
+    mock_book_cabs.return_value = [MagicMock(id=1, cab_id=101), MagicMock(id=2, cab_id=102)]
+    dispatcher = BookingDispatcher(session_factory=MagicMock(), max_wait_ms=100, max_batch_size=10)
+
+    futures = [dispatcher.submit(1) for _ in range(3)]
+    results = [future.result(timeout=5) for future in futures]
+
+    mock_book_cabs.assert_called_once()
+    assert mock_book_cabs.call_args.args[1:] == (1, 3)
+    assert [booking.cab_id for booking in results[:2]] == [101, 102]
+    assert results[2] is None
+
+
+@patch("app.services.booking_dispatcher.BookingService.book_cabs")
+def test_batches_are_capped_at_max_batch_size(mock_book_cabs):
+    """Test a burst larger than the batch size is split into several claims."""
+    mock_book_cabs.side_effect = lambda db, city_id, count: [MagicMock(id=i, cab_id=i) for i in range(count)]
+    dispatcher = BookingDispatcher(session_factory=MagicMock(), max_wait_ms=100, max_batch_size=2)
+
+    futures = [dispatcher.submit(1) for _ in range(5)]
+    for future in futures:
+        assert future.result(timeout=5) is not None
+
+    assert all(call.args[2] <= 2 for call in mock_book_cabs.call_args_list)
+
+
+@patch("app.services.booking_dispatcher.BookingService.book_cabs")
+def test_failed_claim_fails_every_request_in_batch(mock_book_cabs):
+    """Test a database failure is surfaced to every request of the batch."""
+    mock_book_cabs.side_effect = RuntimeError("database unavailable")
+    dispatcher = BookingDispatcher(session_factory=MagicMock(), max_wait_ms=1, max_batch_size=10)
+
+    with pytest.raises(HTTPException) as exc_info:
+        dispatcher.submit(1).result(timeout=5)
+
+    assert exc_info.value.status_code == 500
+
+
+@patch("app.services.booking_dispatcher.BookingService.book_cabs")
+def test_idle_workers_exit_and_restart_on_demand(mock_book_cabs):
+    """Test a city's worker exits after the idle timeout and a later request starts a new one."""
+    mock_book_cabs.side_effect = lambda db, city_id, count: [MagicMock(id=i, cab_id=i) for i in range(count)]
+    dispatcher = BookingDispatcher(session_factory=MagicMock(), max_wait_ms=1, idle_timeout_seconds=0.05)
+
+    dispatcher.submit(1).result(timeout=5)
+    deadline = time.monotonic() + 5
+    while dispatcher.workers() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert dispatcher.workers() == 0
+
+    assert dispatcher.submit(1).result(timeout=5) is not None
+
+
+@patch("app.services.booking_dispatcher.BookingService.book_cabs")
+def test_close_serves_queued_requests_and_rejects_new_ones(mock_book_cabs):
+    """Test shutdown dispatches what is queued, stops the workers and refuses later bookings."""
+    mock_book_cabs.side_effect = lambda db, city_id, count: [MagicMock(id=i, cab_id=i) for i in range(count)]
+    dispatcher = BookingDispatcher(session_factory=MagicMock(), max_wait_ms=10000, idle_timeout_seconds=60)
+
+    futures = [dispatcher.submit(city_id) for city_id in (1, 2)]
+    dispatcher.close()
+
+    assert all(future.result(timeout=0) is not None for future in futures)
+    assert dispatcher.workers() == 0
+    with pytest.raises(HTTPException) as exc_info:
+        dispatcher.submit(1).result(timeout=0)
+    assert exc_info.value.status_code == 503
@@ -1,4 +1,7 @@
+from itertools import count
 from unittest.mock import patch, MagicMock
+import pytest
+from fastapi import HTTPException
 from fastapi.testclient import TestClient
 from datetime import datetime
 from app.main import app
@@ -84,3 +87,170 @@ def test_complete_booking_not_found(mock_complete_booking):
 
     assert response.status_code == 404
     assert response.json() == {"detail": "Booking not found or already completed"}
+
+
+@patch("app.services.booking_service.CabRepository.create_cab_history")
+@patch("app.services.booking_service.BookingRepository.create_booking")
+@patch("app.services.booking_service.CabRepository.claim_cab")
+@patch("app.services.booking_service.BookingService._next_candidate")
+def test_book_cab_retries_when_claim_is_lost(mock_next_candidate, mock_claim_cab, mock_create_booking, mock_history):
+    """Test booking moves on to the next cab when a concurrent request claimed the first one."""
+    from app.services.booking_service import BookingService
+
+    mock_next_candidate.side_effect = [(101, True), (102, True)]
+    mock_claim_cab.side_effect = [None, 102]
+    mock_create_booking.return_value = MagicMock(id=1, cab_id=102)
+    db = MagicMock()
+
+    booking = BookingService.book_cab(db, 1)
+
+    assert booking.cab_id == 102
+    assert mock_claim_cab.call_count == 2
+    mock_create_booking.assert_called_once_with(db, 102, 1)
+    db.commit.assert_called_once()
+
+
+@patch("app.services.booking_service.CabRepository.get_idle_cab_keys")
+@patch("app.services.booking_service.CabRepository.claim_cab")
+def test_book_cab_bounds_lost_claims_and_reloads(mock_claim_cab, mock_idle_cab_keys):
+    """Test a booking that keeps losing its claims gives up, and reloads the city only once."""
+    from app.services.booking_service import BookingService
+    from app.utils.dispatch_index import dispatch_index
+
+    cab_ids = count(1)
+    mock_idle_cab_keys.side_effect = lambda db, city_id: [(next(cab_ids), datetime(2025, 1, 1)) for _ in range(3)]
+    mock_claim_cab.return_value = None
+
+    dispatch_index.invalidate(99)
+    with patch("app.services.booking_service.config.BOOKING_MAX_CLAIM_ATTEMPTS", 100), \
+            pytest.raises(HTTPException) as exc_info:
+        BookingService.book_cab(MagicMock(), 99)
+    assert exc_info.value.status_code == 404  # Index ran dry after the single reload
+    assert mock_idle_cab_keys.call_count == 1
+    assert mock_claim_cab.call_count == 3
+
+    mock_idle_cab_keys.side_effect = lambda db, city_id: [(next(cab_ids), datetime(2025, 1, 1)) for _ in range(50)]
+    mock_claim_cab.reset_mock()
+    dispatch_index.invalidate(99)
+    with patch("app.services.booking_service.config.BOOKING_MAX_CLAIM_ATTEMPTS", 5), \
+            pytest.raises(HTTPException) as exc_info:
+        BookingService.book_cab(MagicMock(), 99)
+    assert exc_info.value.status_code == 503
+    assert mock_claim_cab.call_count == 5
+
+
+@patch("app.services.booking_service.BookingService.book_batch")
+def test_book_cabs_batch(mock_book_batch):
+    """Test batch booking returns per-item results including partial failures."""
+    from app.schemas import BatchBookingResult, BatchBookedCab
+
+    mock_book_batch.return_value = [
+        BatchBookingResult(city_id=1, requested=1, bookings=[BatchBookedCab(booking_id=1, cab_id=101)]),
+        BatchBookingResult(city_id=2, requested=2, error="No available cabs in this city"),
+    ]
+
+    response = client.post("/bookings/batch", json=[{"city_id": 1, "count": 1}, {"city_id": 2, "count": 2}])
+
+    assert response.status_code == 200
+    assert response.json() == [
+        {"city_id": 1, "requested": 1, "bookings": [{"booking_id": 1, "cab_id": 101}], "error": None},
+        {"city_id": 2, "requested": 2, "bookings": [], "error": "No available cabs in this city"},
+    ]
+
+
+def test_book_cabs_batch_rejects_invalid_count():
+    """Test batch items must request at least one cab."""
+    response = client.post("/bookings/batch", json=[{"city_id": 1, "count": 0}])
+
+    assert response.status_code == 422
+
+
+@patch("app.services.booking_service.BookingService.book_cabs")
+def test_book_batch_isolates_failing_city(mock_book_cabs):
+    """Test a database error in one city does not abort the other cities in the batch."""
+    from sqlalchemy.exc import OperationalError
+    from app.schemas import BatchBookingItem
+    from app.services.booking_service import BookingService
+
+    mock_book_cabs.side_effect = [
+        OperationalError("UPDATE cabs", params=None, orig=Exception("locked")),
+        [MagicMock(id=7, cab_id=201)],
+    ]
+
+    results = BookingService.book_batch(MagicMock(), [BatchBookingItem(city_id=1, count=1), BatchBookingItem(city_id=2)])
+
+    assert results[0].error == "Failed to book cabs"
+    assert results[1].error is None
+    assert results[1].bookings[0].cab_id == 201
+
+
+@patch("app.services.booking_service.BookingService.complete_bookings")
+def test_complete_bookings_bulk(mock_complete_bookings):
+    """Test bulk completion reports a status per booking id."""
+    from app.schemas import BulkCompleteResult
+
+    mock_complete_bookings.return_value = [
+        BulkCompleteResult(booking_id=1, status="completed"),
+        BulkCompleteResult(booking_id=2, status="already_completed"),
+        BulkCompleteResult(booking_id=3, status="not_found"),
+    ]
+
+    response = client.post("/bookings/complete", json={"booking_ids": [1, 2, 3]})
+
+    assert response.status_code == 200
+    assert [item["status"] for item in response.json()] == ["completed", "already_completed", "not_found"]
+    mock_complete_bookings.assert_called_once()
+
+
+@patch("app.services.booking_service.duration_sketches")
+@patch("app.services.booking_service.BookingRepository.get_existing_ids")
+@patch("app.services.booking_service.CabRepository.create_cab_histories")
+@patch("app.services.booking_service.CabRepository.release_cabs")
+@patch("app.services.booking_service.BookingRepository.complete_bookings")
+def test_complete_bookings_classifies_leftovers(mock_complete, mock_release, mock_histories, mock_existing,
+                                                mock_sketches):
+    """Test bookings that were not completed are split into already completed and missing."""
+    from app.services.booking_service import BookingService
+
+    mock_complete.return_value = [MagicMock(id=1, cab_id=101, city_id=1, pickup_time=datetime.utcnow())]
+    mock_release.return_value = [MagicMock(id=101, current_city_id=1, last_idle_time=datetime.utcnow())]
+    mock_existing.return_value = {2}
+    db = MagicMock()
+
+    results = BookingService.complete_bookings(db, [1, 2, 3, 1])
+
+    assert [(r.booking_id, r.status) for r in results] == [(1, "completed"), (2, "already_completed"), (3, "not_found")]
+    mock_release.assert_called_once()
+    db.commit.assert_called_once()
+    mock_sketches.add.assert_called_once()  # The completed trip feeds the city's duration sketch
+
+
+@patch("app.services.booking_service.BookingRepository.get_active_bookings")
+def test_get_active_bookings_paginates(mock_get_active_bookings):
+    """Test active bookings return the next cursor in a header when the page is full."""
+    from app.utils.cursor import encode_cursor
+
+    mock_get_active_bookings.return_value = [
+        MagicMock(id=booking_id, cab_id=100 + booking_id, city_id=1, pickup_time=datetime.utcnow(),
+                  drop_time=None, created_at=datetime.utcnow())
+        for booking_id in (4, 5)
+    ]
+
+    response = client.get("/bookings/active", params={"city_id": 1, "cursor": encode_cursor(None, 3), "limit": 2})
+
+    assert response.status_code == 200
+    assert [item["id"] for item in response.json()] == [4, 5]
+    assert response.headers["X-Next-Cursor"] == encode_cursor(None, 5)
+    assert mock_get_active_bookings.call_args.args[1:] == (1, 3, 2)
+
+
+@patch("app.services.booking_service.BookingRepository.get_active_bookings")
+def test_get_active_bookings_last_page(mock_get_active_bookings):
+    """Test the last page of active bookings has no next cursor."""
+    mock_get_active_bookings.return_value = []
+
+    response = client.get("/bookings/active")
+
+    assert response.status_code == 200
+    assert response.json() == []
+    assert "X-Next-Cursor" not in response.headers
@@ -1,8 +1,12 @@
 import pytest
 from fastapi.testclient import TestClient
 from unittest.mock import patch, MagicMock
+from sqlalchemy import insert
 from app.main import app
-from app.schemas import CabResponse, CabHistoryResponse
+from app.models import Cab
+from app.repositories.cab_repository import CabRepository
+from app.schemas import CabResponse, CabHistoryResponse, TelemetryEvent
+from app.services.telemetry_service import TelemetryService
 from app.state_machine import CabState
 from datetime import datetime
 
@@ -150,6 +154,30 @@ def test_get_available_cabs_no_cabs(mock_get_available_cabs):
     assert response.json() == []
 
 
+@patch("app.services.cab_service.CabService.get_available_cabs_page")
+def test_get_available_cabs_page(mock_get_page):
+    """Test a paginated listing returns one page and the next cursor in a header."""
+    mock_get_page.return_value = (
+        [CabResponse(id=3, plate_number="XYZ-3", current_city_id=1, state=CabState.IDLE, last_idle_time=datetime.utcnow())],
+        "next-page",
+    )
+
+    response = client.get("/cabs/available/1", params={"limit": 1, "cursor": "this-page"})
+
+    assert response.status_code == 200
+    assert [cab["id"] for cab in response.json()] == [3]
+    assert response.headers["X-Next-Cursor"] == "next-page"
+    assert mock_get_page.call_args.args[1:] == (1, "this-page", 1)
+
+
+def test_get_available_cabs_invalid_cursor():
+    """Test a malformed cursor is rejected."""
+    response = client.get("/cabs/available/1", params={"cursor": "not-a-cursor", "limit": 10})
+
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid cursor"}
+
+
 @patch("app.services.cab_service.CabService.get_cab_history")
 def test_get_cab_history(mock_get_cab_history):
     """Test fetching cab state change history."""
@@ -183,3 +211,265 @@ def test_get_cab_history(mock_get_cab_history):
     assert history[1]["cab_id"] == 1
     assert history[1]["state"] == "ON_TRIP"
     assert "timestamp" in history[1]
+
+
+@patch("app.services.cab_import_service.CabImportService.import_cabs")
+def test_import_cabs_detects_csv(mock_import_cabs):
+    """Test the import endpoint picks the format from the file name and returns the report."""
+    from app.schemas import CabImportReport, CabImportError
+
+    mock_import_cabs.return_value = CabImportReport(imported=1, failed=1, errors=[CabImportError(row=3, error="Invalid current_city_id")])
+
+    response = client.post("/cabs/import", files={"file": ("cabs.csv", "plate_number,current_city_id\nA-1,1\nA-2,x\n")})
+
+    assert response.status_code == 200
+    assert response.json() == {"imported": 1, "failed": 1, "errors": [{"row": 3, "error": "Invalid current_city_id"}]}
+    assert mock_import_cabs.call_args.args[2] == "csv"
+
+
+@patch("app.services.cab_import_service.CabRepository.bulk_create_cabs")
+@patch("app.services.cab_import_service.CabRepository.get_existing_plates")
+@patch("app.services.cab_import_service.CityService.get_city_ids")
+def test_import_cabs_reports_row_errors(mock_city_ids, mock_existing_plates, mock_bulk_create):
+    """Test invalid NDJSON rows are reported while valid rows are inserted in one batch."""
+    import io
+    from app.services.cab_import_service import CabImportService
+
+    mock_city_ids.return_value = {1}
+    mock_existing_plates.return_value = {"OLD-1"}
+    mock_bulk_create.return_value = [10]
+    stream = io.StringIO(
+        '{"plate_number": "NEW-1", "current_city_id": 1}\n'
+        '{"plate_number": "OLD-1", "current_city_id": 1}\n'
+        '{"plate_number": "NEW-2", "current_city_id": 9}\n'
+        'not json\n'
+    )
+
+    report = CabImportService.import_cabs(MagicMock(), stream, "ndjson")
+
+    assert report.imported == 1
+    assert [(error.row, error.error) for error in report.errors] == [
+        (2, "Plate number already registered"),
+        (3, "Invalid city ID: City does not exist."),
+        (4, "Invalid JSON: Expecting value"),
+    ]
+    mock_bulk_create.assert_called_once()
+
+
+@patch("app.services.cab_import_service.CabRepository.bulk_create_cabs")
+@patch("app.services.cab_import_service.CabRepository.get_existing_plates")
+@patch("app.services.cab_import_service.CityService.get_city_ids")
+def test_import_cabs_reports_invalid_utf8_as_a_row_error(mock_city_ids, mock_existing_plates, mock_bulk_create):
+    """Test a non-UTF-8 upload keeps the batches imported so far and reports the bad row instead of failing."""
+    mock_city_ids.return_value = {1}
+    mock_existing_plates.return_value = set()
+    mock_bulk_create.side_effect = lambda db, cabs, idle_since: list(range(len(cabs)))
+    # Larger than one decoded chunk, so the first rows are read before the Latin-1 plate
+    upload = "plate_number,current_city_id\n".encode() + b"".join(f"KA-{i:05d},1\n".encode() for i in range(2000))
+    upload += "MH-\u00e9,1\n".encode("latin-1")
+
+    with patch("app.services.cab_import_service.config.CAB_IMPORT_BATCH_SIZE", 100):
+        response = client.post("/cabs/import", files={"file": ("cabs.csv", upload)})
+
+    assert response.status_code == 200
+    report = response.json()
+    assert report["imported"] > 0
+    assert report["failed"] == 1
+    assert report["errors"][0]["error"].startswith("Invalid UTF-8")
+    assert report["errors"][0]["row"] == report["imported"] + 2
+
+
+@patch("app.services.telemetry_service.TelemetryService.ingest")
+def test_ingest_telemetry(mock_ingest):
+    """Test NDJSON telemetry is parsed and invalid lines are counted."""
+    from app.schemas import TelemetryReport
+
+    mock_ingest.return_value = TelemetryReport(received=3, invalid=1, applied=2)
+    payload = '{"cab_id": 1, "state": "IDLE"}\n{"cab_id": 2, "city_id": 3}\nnot json\n'
+
+    response = client.post("/cabs/telemetry", content=payload)
+
+    assert response.status_code == 200
+    assert response.json()["applied"] == 2
+    events, invalid = mock_ingest.call_args.args[1:]
+    assert [event.cab_id for event in events] == [1, 2]
+    assert invalid == 1
+
+
+def test_telemetry_keeps_latest_event_per_cab():
+    """Test telemetry deduplication keeps the newest event of every cab."""
+    from app.schemas import TelemetryEvent
+    from app.services.telemetry_service import TelemetryService
+
+    events = [
+        TelemetryEvent(cab_id=1, state=CabState.ON_TRIP, timestamp=datetime(2025, 3, 6, 10, 5)),
+        TelemetryEvent(cab_id=1, state=CabState.IDLE, timestamp=datetime(2025, 3, 6, 10, 0)),
+        TelemetryEvent(cab_id=2, city_id=1),
+        TelemetryEvent(cab_id=2, city_id=2),
+    ]
+
+    latest = TelemetryService.latest_per_cab(events)
+
+    assert latest[1].state == CabState.ON_TRIP
+    assert latest[2].city_id == 2
+
+
+def test_telemetry_compares_aware_and_naive_timestamps():
+    """Test aware timestamps are normalised to naive UTC, so mixed batches deduplicate."""
+    events = TelemetryService.parse_ndjson(
+        b'{"cab_id": 1, "state": "IDLE", "timestamp": "2025-03-06T10:05:00+05:30"}\n'
+        b'{"cab_id": 1, "state": "ON_TRIP", "timestamp": "2025-03-06T10:00:00"}\n'
+    )[0]
+
+    latest = TelemetryService.latest_per_cab(events)
+
+    assert events[0].timestamp == datetime(2025, 3, 6, 4, 35)
+    assert latest[1].state == CabState.ON_TRIP
+
+
+def test_telemetry_does_not_overwrite_a_concurrent_claim(db):
+    """Test a cab claimed between the telemetry read and write is left as the claim wrote it."""
+    db.execute(insert(Cab), [{"id": 1, "plate_number": "KA-01", "current_city_id": 1, "state": CabState.IDLE}])
+    db.commit()
+    stale = CabRepository.get_cab_snapshots(db, [1])
+    CabRepository.claim_cab(db, 1, 1)  # A booking wins the race
+    db.commit()
+
+    with patch("app.services.telemetry_service.CabRepository.get_cab_snapshots", return_value=stale), \
+            patch("app.services.telemetry_service.dispatch_index") as mock_index:
+        report = TelemetryService.ingest(db, [TelemetryEvent(cab_id=1, city_id=2, state=CabState.MAINTENANCE)])
+
+    cab = db.get(Cab, 1)
+    assert (report.applied, report.conflicts) == (0, 1)
+    assert (cab.state, cab.current_city_id, cab.version) == (CabState.ON_TRIP, 1, 1)
+    mock_index.mark_idle.assert_not_called()
+    mock_index.discard.assert_not_called()
+
+
+@patch("app.services.cab_service.CabService.update_cab_state")
+def test_update_cab_state_conflict(mock_update_state):
+    """Test a disallowed or stale transition is reported as 409 and the version is passed on."""
+    from fastapi import HTTPException
+
+    mock_update_state.side_effect = HTTPException(status_code=409, detail="Cab cannot move to ON_TRIP from its current state/version")
+
+    response = client.put("/cabs/1/state/ON_TRIP?expected_version=3")
+
+    assert response.status_code == 409
+    assert mock_update_state.call_args.args[1:] == (1, "ON_TRIP", 3)
+
+
+@patch("app.services.cab_service.CabRepository.update_cab_state")
+def test_update_cab_state_fails_fast_without_history(mock_repo_update_state):
+    """Test a transition rejected by the conditional UPDATE rolls back and logs no history."""
+    from fastapi import HTTPException
+    from app.services.cab_service import CabService
+
+    mock_repo_update_state.return_value = None
+    db = MagicMock()
+
+    with pytest.raises(HTTPException) as exc_info:
+        CabService.update_cab_state(db, 1, "ON_TRIP")
+
+    assert exc_info.value.status_code == 409
+    db.rollback.assert_called_once()
+    db.add.assert_not_called()
+    db.commit.assert_not_called()
+
+
+def test_update_cab_state_missing_cab_is_404(db):
+    """Test a state change for a cab that does not exist is reported as not found."""
+    from fastapi import HTTPException
+    from app.services.cab_service import CabService
+
+    with pytest.raises(HTTPException) as exc_info:
+        CabService.update_cab_state(db, 42, CabState.ON_TRIP)
+
+    assert (exc_info.value.status_code, exc_info.value.detail) == (404, "Cab not found")
+
+
+@patch("app.services.cab_service.dispatch_index")
+def test_update_cab_state_stale_or_disallowed_is_409(mock_index, db):
+    """Test an existing cab rejects a stale version and a transition the table does not allow with 409."""
+    from fastapi import HTTPException
+    from app.services.cab_service import CabService
+
+    db.execute(insert(Cab), [{"id": 1, "plate_number": "KA-01", "current_city_id": 1, "state": CabState.IDLE, "version": 2}])
+    db.commit()
+
+    for new_state, expected_version in ((CabState.ON_TRIP, 1), (CabState.IDLE, None)):
+        with pytest.raises(HTTPException) as exc_info:
+            CabService.update_cab_state(db, 1, new_state, expected_version)
+        assert exc_info.value.status_code == 409
+
+    assert (db.get(Cab, 1).state, db.get(Cab, 1).version) == (CabState.IDLE, 2)
+
+
+@patch("app.services.cab_service.CabService.get_cab_history_page")
+def test_get_cab_history_time_filtered_page(mock_get_page):
+    """Test since/until/limit switch the history endpoint to keyset pages."""
+    mock_get_page.return_value = (
+        [CabHistoryResponse(id=7, cab_id=1, state=CabState.IDLE, timestamp=datetime(2025, 1, 2))],
+        None,
+    )
+
+    response = client.get("/cabs/1/history", params={"since": "2025-01-01T00:00:00", "limit": 50})
+
+    assert response.status_code == 200
+    assert [entry["id"] for entry in response.json()] == [7]
+    assert "X-Next-Cursor" not in response.headers
+    assert mock_get_page.call_args.args[1:] == (1, datetime(2025, 1, 1), None, None, 50)
+
+
+@patch("app.services.cab_service.CabService.stream_cab_history")
+def test_stream_cab_history(mock_stream):
+    """Test the opt-in streaming mode returns NDJSON."""
+    mock_stream.return_value = iter(['{"id": 2}\n', '{"id": 1}\n'])
+
+    response = client.get("/cabs/1/history", params={"stream": True})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert response.text.splitlines() == ['{"id": 2}', '{"id": 1}']
+
+
+def test_telemetry_updates_enforce_the_transition_table(db):
+    """Test a telemetry write is rejected by the database when the cab's current state cannot make the transition."""
+    db.execute(insert(Cab), [
+        {"id": 1, "plate_number": "KA-01", "current_city_id": 1, "state": CabState.ON_TRIP},
+        {"id": 2, "plate_number": "KA-02", "current_city_id": 1, "state": CabState.ON_TRIP},
+    ])
+    rows = [
+        {"id": 1, "version": 0, "previous_state": CabState.IDLE, "state": CabState.MAINTENANCE,
+         "current_city_id": 1, "last_idle_time": None},
+        {"id": 2, "version": 0, "previous_state": CabState.ON_TRIP, "state": CabState.ON_TRIP,
+         "current_city_id": 2, "last_idle_time": None},
+    ]
+
+    assert CabRepository.update_cabs_at_version(db, rows) == {2}
+    assert db.get(Cab, 1).state == CabState.ON_TRIP
+
+
+def test_telemetry_updates_are_one_statement_per_batch(db):
+    """Test telemetry writes go out as one UPDATE per batch and stale rows come back as conflicts."""
+    from sqlalchemy import event
+
+    db.execute(insert(Cab), [
+        {"id": cab_id, "plate_number": f"KA-{cab_id}", "current_city_id": 1, "state": CabState.IDLE, "version": 1}
+        for cab_id in (1, 2, 3)
+    ])
+    rows = [
+        {"id": cab_id, "version": 0 if cab_id == 2 else 1, "previous_state": CabState.IDLE, "state": CabState.IDLE,
+         "current_city_id": 5, "last_idle_time": datetime(2025, 1, 1)}
+        for cab_id in (1, 2, 3)
+    ]
+    statements = []
+    event.listen(db.get_bind(), "before_cursor_execute", lambda conn, cursor, statement, *args: statements.append(statement))
+
+    with patch("app.repositories.cab_repository.config.TELEMETRY_UPDATE_BATCH_SIZE", 2):
+        written = CabRepository.update_cabs_at_version(db, rows)
+
+    assert written == {1, 3}
+    assert len([statement for statement in statements if "UPDATE cabs" in statement]) == 2
+    assert [(cab.current_city_id, cab.version) for cab in db.query(Cab).order_by(Cab.id)] == [(5, 2), (1, 1), (5, 2)]
+    assert db.get(Cab, 3).last_idle_time == datetime(2025, 1, 1)
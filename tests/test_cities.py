@@ -1,10 +1,14 @@
 import pytest
 from unittest.mock import patch, MagicMock
+from fastapi import HTTPException
 from fastapi.testclient import TestClient
 from sqlalchemy.exc import IntegrityError
 from app.main import app
-from app.schemas import CityResponse
+from app.schemas import CabCreate, CityCreate, CityResponse
 from app.repositories.city_repository import CityRepository
+from app.services.cab_service import CabService
+from app.services.city_service import CityService
+from app.utils.city_registry import CityRegistry
 
 client = TestClient(app)
 
@@ -114,6 +118,33 @@ def test_delete_city_not_found(mock_delete_city):
     assert response.json() == {"detail": "City not found"}
 
 
+@patch("app.services.city_service.CityService.get_cities_page")
+def test_get_cities_page(mock_get_page):
+    """Test a paginated city listing returns the next cursor in a header."""
+    mock_get_page.return_value = ([CityResponse(id=3, name="Pune"), CityResponse(id=4, name="Goa")], "next-page")
+
+    response = client.get("/cities/", params={"cursor": "this-page", "limit": 2})
+
+    assert response.status_code == 200
+    assert [city["id"] for city in response.json()] == [3, 4]
+    assert response.headers["X-Next-Cursor"] == "next-page"
+    mock_get_page.assert_called_once()
+    assert mock_get_page.call_args.args[1:] == ("this-page", 2)
+
+
+@patch("app.services.city_service.CityRepository.get_cities_page")
+def test_get_cities_page_cursor_is_opaque(mock_get_cities_page):
+    """Test the city cursor is encoded like every other listing's and decoded back to the last id."""
+    from app.utils.cursor import encode_cursor
+
+    mock_get_cities_page.return_value = [CityResponse(id=3, name="Pune"), CityResponse(id=4, name="Goa")]
+
+    cities, next_cursor = CityService.get_cities_page(MagicMock(), encode_cursor(None, 2), 2)
+
+    assert next_cursor == encode_cursor(None, 4)
+    assert mock_get_cities_page.call_args.args[1:] == (2, 2)
+
+
 @patch("app.repositories.city_repository.Session")
 def test_get_all_cities_empty(mock_session):
     """Test retrieving cities when no cities exist."""
@@ -123,3 +154,35 @@ def test_get_all_cities_empty(mock_session):
     result = CityRepository.get_all_cities(mock_db)
 
     assert result == []
+
+
+def test_create_city_is_one_upsert(db):
+    """Test a city is created by INSERT ... ON CONFLICT and a duplicate name returns None."""
+    city = CityRepository.create_city(db, {"name": "Delhi"})
+
+    assert (city.id, city.name) == (1, "Delhi")
+    assert CityRepository.create_city(db, {"name": "Delhi"}) is None
+    assert CityRepository.get_city_names(db) == [(1, "Delhi")]
+
+
+def test_register_cab_validates_city_against_registry(db):
+    """Test cab registration checks cities in memory, falls back to the database for unknown ids and sees deletes."""
+    registry = CityRegistry()
+    with patch("app.services.city_service.city_registry", registry):
+        delhi = CityService.register_city(db, CityCreate(name="Delhi"))
+        CityService.load_registry(db)
+        pune = CityRepository.create_city(db, {"name": "Pune"})  # As if created by another worker
+
+        with patch("app.services.city_service.CityRepository.get_city_by_id") as mock_get_city:
+            assert CityService.city_exists(db, delhi.id)
+            mock_get_city.assert_not_called()
+        assert CityService.city_exists(db, pune.id)
+        assert registry.get_id("Pune") == pune.id
+
+        CityService.update_city(db, delhi.id, {"name": "New Delhi"})
+        assert (registry.get_name(delhi.id), registry.get_id("Delhi")) == ("New Delhi", None)
+
+        CityService.delete_city(db, delhi.id)
+        with pytest.raises(HTTPException) as error:
+            CabService.register_cab(db, CabCreate(plate_number="KA-01", current_city_id=delhi.id))
+        assert error.value.status_code == 400
@@ -0,0 +1,87 @@
+from datetime import date, datetime, timedelta
+from unittest.mock import patch
+import numpy as np
+import pytest
+from sqlalchemy import insert, select
+from app.models import Booking, Cab, CabHistory, CabStateInterval, City, HourlyDemand
+from app.repositories.booking_repository import BookingRepository
+from app.repositories.cab_repository import CabRepository
+from app.repositories.columnar_repository import ColumnarRepository
+from app.repositories.state_intervals import StateIntervals
+from app.state_machine import CabState
+from app.utils.columnar import duration_summary, hour_of_week_matrix, hourly_histogram, idle_seconds
+
+T0 = datetime(2025, 3, 1, 8)
+
+
+@pytest.fixture
+def db(db):
+    db.execute(insert(Cab), [{"id": cab_id, "plate_number": f"KA-{cab_id}"} for cab_id in (1, 2, 3)])
+    states = [CabState.IDLE, CabState.ON_TRIP, CabState.IDLE, CabState.MAINTENANCE, CabState.IDLE]
+    db.execute(insert(CabHistory), [
+        {"cab_id": cab_id, "state": state, "timestamp": T0 + timedelta(minutes=37 * step * cab_id)}
+        for cab_id in (1, 2, 3) for step, state in enumerate(states)
+    ])
+    db.execute(insert(Booking), [
+        {"cab_id": 1, "city_id": 1, "pickup_time": T0 + timedelta(hours=hour), "drop_time": T0 + timedelta(hours=hour, minutes=minutes)}
+        for hour, minutes in [(0, 10), (1, 20), (1, 30), (15, 40)]
+    ])
+    db.commit()
+    return db
+
+
+def rows(db):
+    return db.execute(select(CabStateInterval.__table__).order_by("cab_id", "start")).all()
+
+
+def test_columnar_rebuild_matches_row_by_row_fold(db):
+    """Test the NumPy interval fold writes the same intervals as the per-cab Python fold."""
+    StateIntervals.rebuild(db)
+    expected = rows(db)
+
+    with patch("app.config.config.ANALYTICS_COLUMNAR_MIN_ROWS", 1):
+        assert StateIntervals.rebuild(db) == len(expected)
+
+    assert rows(db) == expected
+
+
+def test_vectorized_idle_seconds_match_idle_time(db):
+    """Test window idle time over arrays agrees with the repository for every cab."""
+    StateIntervals.rebuild(db)
+    start, end = T0 + timedelta(minutes=50), T0 + timedelta(hours=6)
+
+    cab_ids, seconds = idle_seconds(*ColumnarRepository.load_history(db, until=end), start, end)
+
+    assert cab_ids.tolist() == [1, 2, 3]
+    assert seconds.tolist() == [CabRepository.get_idle_time(db, cab_id, start, end).total_seconds() for cab_id in (1, 2, 3)]
+
+
+def test_trip_durations_and_hourly_histogram(db):
+    """Test trip duration percentiles and the local-hour demand histogram."""
+    summary = duration_summary(ColumnarRepository.load_trip_durations(db, city_id=1))
+    histogram = hourly_histogram(ColumnarRepository.load_pickup_times(db, city_id=1), "Asia/Kolkata")
+
+    assert summary["count"] == 4 and summary["mean"] == 1500.0 and summary["p50"] == 1500.0
+    # 08:00/09:00/23:00 UTC are 13:30/14:30/04:30 in India
+    assert np.flatnonzero(histogram).tolist() == [4, 13, 14]
+    assert histogram[14] == 2
+
+
+def test_hour_of_week_matrix_from_rollup(db):
+    """Test the weekly rollup query scattered into a dense city x hour-of-week matrix."""
+    db.execute(insert(City), [{"id": 1, "name": "Mysuru"}, {"id": 2, "name": "Pune"}])
+    db.execute(insert(HourlyDemand), [
+        # 2025-03-03 is a Monday, 2025-03-09 a Sunday
+        {"city_id": 1, "day": date(2025, 3, 3), "hour": 0, "count": 2},
+        {"city_id": 1, "day": date(2025, 3, 10), "hour": 0, "count": 3},
+        {"city_id": 2, "day": date(2025, 3, 9), "hour": 23, "count": 4},
+        {"city_id": 2, "day": date(2025, 3, 20), "hour": 5, "count": 9},
+    ])
+
+    rows = BookingRepository.get_weekly_demand(db, date(2025, 3, 1), date(2025, 3, 15))
+    cities, matrix = hour_of_week_matrix(*np.array(rows, dtype=np.int64).reshape(-1, 4).T)
+
+    assert cities.tolist() == [1, 2]
+    assert matrix.shape == (2, 168)
+    assert matrix[0, 0] == 5 and matrix[1, 167] == 4
+    assert matrix.sum() == 9
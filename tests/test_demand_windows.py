@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import insert
+from app.models import Booking, City
+from app.repositories.booking_repository import BookingRepository
+from app.utils.demand_windows import DEMAND_WINDOWS, DemandWindows
+
+NOW = datetime(2025, 3, 1, 12)
+
+
+def test_windows_slide_and_rank_cities():
+    """Test bookings leave each window as it slides past them and cities are ranked by count."""
+    windows = DemandWindows(DEMAND_WINDOWS, bucket_seconds=60)
+    windows.load([], now=NOW - timedelta(hours=2))
+    for minutes_ago, city_id, count in [(90, 1, 5), (50, 2, 3), (10, 3, 2), (5, 2, 1), (1, 1, 1)]:
+        windows.record(city_id, count, moment=NOW - timedelta(minutes=minutes_ago))
+
+    assert windows.top("15m", 10, now=NOW) == [(3, 2), (1, 1), (2, 1)]  # Ties by city id
+    assert windows.top("1h", 2, now=NOW) == [(2, 4), (3, 2)]
+    assert windows.top("24h", 10, now=NOW) == [(1, 6), (2, 4), (3, 2)]
+
+    later = NOW + timedelta(minutes=12)
+    assert windows.top("15m", 10, now=later) == [(1, 1)]
+    assert windows.top("24h", 10, now=NOW + timedelta(days=2)) == []
+
+
+@pytest.fixture
+def db(db):
+    db.execute(insert(City), [{"id": 1, "name": "Mysuru"}, {"id": 2, "name": "Pune"}])
+    db.execute(insert(Booking), [
+        {"cab_id": 1, "city_id": city_id, "pickup_time": NOW - timedelta(minutes=minutes_ago)}
+        for city_id, minutes_ago in [(1, 3), (1, 3), (1, 70), (2, 20), (2, 30), (2, 40), (1, 60 * 30)]
+    ])
+    db.commit()
+    return db
+
+
+def test_rebuild_from_recent_bookings(db):
+    """Test the counters rebuilt from one aggregate query match the bookings of each window."""
+    windows = DemandWindows(DEMAND_WINDOWS, bucket_seconds=60)
+    windows.load(BookingRepository.get_recent_demand(db, NOW - timedelta(days=1)), now=NOW)
+
+    assert windows.top("15m", 10, now=NOW) == [(1, 2)]
+    assert windows.top("1h", 10, now=NOW) == [(2, 3), (1, 2)]
+    assert windows.top("24h", 1, now=NOW) == [(1, 3)]
@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta
+from app.utils.dispatch_index import DispatchIndex
+
+
+def test_pop_returns_longest_idle_cab_first():
+    """Test cabs are popped in order of their last idle time."""
+    index = DispatchIndex()
+    now = datetime.utcnow()
+    index.load_city(1, [(10, now), (11, now - timedelta(minutes=5)), (12, None)])
+
+    assert index.pop(1) == 12
+    assert index.pop(1) == 11
+    assert index.pop(1) == 10
+    assert index.pop(1) is None
+
+
+def test_discard_and_relocate_cab():
+    """Test discarded cabs are skipped and relocated cabs move between cities."""
+    index = DispatchIndex()
+    now = datetime.utcnow()
+    index.load_city(1, [(10, now - timedelta(minutes=1)), (11, now)])
+    index.load_city(2, [])
+
+    index.discard(10)
+    index.mark_idle(11, 2, now)
+
+    assert index.pop(1) is None
+    assert index.pop(2) == 11
+
+
+def test_mark_idle_ignores_unloaded_city():
+    """Test cabs in cities that were never loaded are left to the database reload."""
+    index = DispatchIndex()
+    index.mark_idle(10, 3, datetime.utcnow())
+
+    assert index.needs_load(3)
+    assert index.pop(3) is None
+
+
+def test_ties_are_broken_randomly():
+    """Test cabs with identical idle times are not always picked in the same order."""
+    now = datetime.utcnow()
+    first_picks = set()
+    for _ in range(50):
+        index = DispatchIndex()
+        index.load_city(1, [(cab_id, now) for cab_id in range(5)])
+        first_picks.add(index.pop(1))
+
+    assert len(first_picks) > 1
@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+from unittest.mock import patch
+import numpy as np
+import pytest
+from sqlalchemy import insert
+from app.models import Booking, City
+from app.repositories.duration_sketches import DurationSketches
+from app.services.analytics_service import AnalyticsService
+from app.utils.quantile_sketch import QuantileSketch
+
+T0 = datetime(2025, 3, 1, 8)
+
+
+def test_sketch_quantiles_within_relative_error_and_merge_exactly():
+    """Test sketch quantiles stay within the relative accuracy and merged halves equal one sketch."""
+    values = np.random.default_rng(3).lognormal(mean=7, sigma=0.8, size=50000)
+    whole, first, second = QuantileSketch(0.01), QuantileSketch(0.01), QuantileSketch(0.01)
+    whole.add_many(values)
+    for value in values[:20000]:
+        first.add(float(value))
+    second.add_many(values[20000:])
+    first.merge(second)
+
+    assert first.bins == whole.bins and first.count == whole.count == 50000
+    for q in (0.5, 0.9, 0.95, 0.99):
+        exact = np.percentile(values, q * 100, method="lower")
+        assert abs(whole.quantile(q) - exact) <= 0.01 * exact
+
+
+@pytest.fixture
+def session_factory(session_factory):
+    with session_factory() as session:
+        session.execute(insert(City), [{"id": 1, "name": "Mysuru"}])
+        session.execute(insert(Booking), [
+            {"cab_id": 1, "city_id": 1, "pickup_time": T0, "drop_time": T0 + timedelta(minutes=minutes)}
+            for minutes in range(10, 60)
+        ])
+        session.commit()
+    return session_factory
+
+
+def test_flushed_sketches_answer_large_cities(session_factory):
+    """Test trips are persisted by flush, merged across flushes, and answered exactly or from the sketch."""
+    sketches = DurationSketches(session_factory, relative_accuracy=0.01)
+    with session_factory() as db:
+        assert DurationSketches.rebuild(db, 0.01) == 50
+
+    for minutes in (20, 30):
+        sketches.add(1, minutes * 60)
+    assert sketches.flush() == 2
+    sketches.add(1, 40 * 60)  # Pending, not flushed yet
+
+    with session_factory() as db, patch("app.services.analytics_service.duration_sketches", sketches):
+        assert sketches.get(db, 1).count == 53
+
+        exact = AnalyticsService.get_trip_duration_quantiles(db, 1)
+        assert exact.mode == "exact" and exact.trips == 50 and exact.quantiles["p50"] == 34 * 60
+
+        with patch("app.config.config.TRIP_DURATION_EXACT_MAX", 10):
+            approximate = AnalyticsService.get_trip_duration_quantiles(db, 1)
+        assert approximate.mode == "sketch" and approximate.trips == 53
+        assert abs(approximate.quantiles["p50"] - 34 * 60) <= 0.01 * 34 * 60
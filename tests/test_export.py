@@ -0,0 +1,76 @@
+import gzip
+import json
+from datetime import datetime, timedelta
+from unittest.mock import patch
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import insert
+from app.main import app
+from app.models import Booking, Cab, CabHistory, City
+from app.repositories.export_repository import ExportRepository
+from app.repositories.history_partitions import HistoryPartitions
+from app.services.export_service import ExportService
+from app.state_machine import CabState
+
+client = TestClient(app)
+
+T0 = datetime(2025, 3, 1, 8)
+
+
+@pytest.fixture
+def session_factory(session_factory):
+    with session_factory() as session:
+        session.execute(insert(City), [{"id": 1, "name": "Mysuru"}])
+        session.execute(insert(Cab), [{"id": 1, "plate_number": "KA-01"}])
+        session.execute(insert(Booking), [
+            {"cab_id": 1, "city_id": 1, "pickup_time": T0 + timedelta(hours=hour), "created_at": T0}
+            for hour in range(10)
+        ])
+        session.execute(insert(CabHistory), [
+            {"cab_id": 1, "state": CabState.IDLE, "timestamp": datetime(2025, month, 10)} for month in (1, 2, 6)
+        ])
+        session.commit()
+    return session_factory
+
+
+def test_export_streams_batches_and_resumes(session_factory):
+    """Test an export filters by time, is split into id-ordered batches and resumes after an id."""
+    with patch("app.services.export_service.SessionLocal", session_factory), \
+            patch("app.repositories.export_repository.config.EXPORT_BATCH_SIZE", 3):
+        with session_factory() as db:
+            batches = list(ExportRepository.iter_batches(db, "bookings", since=T0 + timedelta(hours=2)))
+        assert [[row.id for row in batch] for batch in batches] == [[3, 4, 5], [6, 7, 8], [9, 10]]
+
+        lines = b"".join(ExportService.export("bookings", "csv", until=T0 + timedelta(hours=4))).decode().splitlines()
+        assert lines[0] == "id,cab_id,city_id,pickup_time,drop_time,created_at"
+        assert lines[1] == "1,1,1,2025-03-01T08:00:00,,2025-03-01T08:00:00"
+        assert len(lines) == 6
+
+        resumed = b"".join(ExportService.export("bookings", "csv", after_id=8)).decode().splitlines()
+        assert [line.split(",")[0] for line in resumed] == ["9", "10"]  # No header when appending
+
+        records = gzip.decompress(b"".join(ExportService.export("cab_history", "ndjson", compress=True)))
+        assert [json.loads(line)["state"] for line in records.splitlines()] == ["IDLE"] * 3
+
+
+def test_export_reads_history_partitions_in_id_order(session_factory):
+    """Test partitioned history is exported across the monthly tables as one id-ordered stream."""
+    with session_factory() as db:
+        HistoryPartitions.compact(db, now=datetime(2025, 6, 15))
+        with patch("app.repositories.export_repository.config.EXPORT_BATCH_SIZE", 2):
+            batches = list(ExportRepository.iter_batches(db, "cab_history", after_id=1))
+
+    assert [[row.id for row in batch] for batch in batches] == [[2, 3]]
+
+
+def test_export_route(session_factory):
+    """Test the export endpoint streams a gzip attachment and rejects unknown tables."""
+    with patch("app.services.export_service.SessionLocal", session_factory):
+        response = client.get("/export/cab_history", params={"format": "csv", "gzip": True})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/gzip"
+    assert 'filename="cab_history.csv.gz"' in response.headers["content-disposition"]
+    assert gzip.decompress(response.content).decode().splitlines()[0] == "id,cab_id,state,timestamp"
+
+    assert client.get("/export/cabs").status_code == 404
@@ -0,0 +1,107 @@
+from datetime import datetime, timedelta
+from unittest.mock import patch
+import pytest
+from sqlalchemy import insert
+from app.models import Cab, CabHistory
+from app.repositories.cab_repository import CabRepository
+from app.repositories.history_partitions import HistoryPartitions
+from app.repositories.state_intervals import StateIntervals
+from app.state_machine import CabState
+
+NOW = datetime(2025, 6, 15)
+
+
+@pytest.fixture
+def db(db):
+    # Cab 1 goes IDLE in January and stays idle until May; cab 2 only adds noise
+    db.execute(insert(Cab), [{"id": 1, "plate_number": "KA-01"}, {"id": 2, "plate_number": "KA-02"}])
+    db.execute(insert(CabHistory), [
+        {"cab_id": 1, "state": CabState.IDLE, "timestamp": datetime(2025, 1, 10)},
+        {"cab_id": 2, "state": CabState.ON_TRIP, "timestamp": datetime(2025, 1, 11)},
+        {"cab_id": 1, "state": CabState.ON_TRIP, "timestamp": datetime(2025, 5, 1)},
+        {"cab_id": 1, "state": CabState.IDLE, "timestamp": datetime(2025, 6, 1)},
+    ])
+    db.commit()
+    return db
+
+
+def test_compact_moves_closed_months_to_monthly_tables(db):
+    """Test rows of closed months leave cab_history for one table per month."""
+    moved = HistoryPartitions.compact(db, now=NOW)
+
+    assert moved == {"cab_history_p202501": 2, "cab_history_p202505": 1}
+    assert list(HistoryPartitions.list_partitions(db).values()) == ["cab_history_p202501", "cab_history_p202505"]
+    assert db.query(CabHistory).count() == 1
+
+
+def test_archive_drops_cold_partitions_and_reads_stitch_them_back(db, tmp_path):
+    """Test archived months are gone from the database but still returned by history reads."""
+    HistoryPartitions.compact(db, now=NOW)
+    archived = HistoryPartitions.archive(db, archive_dir=str(tmp_path), hot_months=3, now=NOW)
+
+    assert archived == {"cab_history_p202501": 2}
+    assert list(HistoryPartitions.list_partitions(db).values()) == ["cab_history_p202505"]
+
+    with patch("app.config.config.HISTORY_PARTITIONING", True), \
+            patch("app.config.config.HISTORY_ARCHIVE_DIR", str(tmp_path)):
+        history = CabRepository.get_cab_history(db, 1)
+        StateIntervals.rebuild(db)
+        idle_time = CabRepository.get_idle_time(db, 1, datetime(2025, 4, 1), datetime(2025, 6, 2))
+
+    assert [entry.timestamp.month for entry in history] == [6, 5, 1]
+    # Idle since January (archived) until May 1st, then again from June 1st
+    assert idle_time == timedelta(days=30) + timedelta(days=1)
+
+
+def test_late_rows_are_merged_into_an_existing_archive(db, tmp_path):
+    """Test re-archiving a month appends late rows instead of overwriting the file."""
+    HistoryPartitions.compact(db, now=NOW)
+    HistoryPartitions.archive(db, archive_dir=str(tmp_path), hot_months=3, now=NOW)
+    db.execute(insert(CabHistory), [{"cab_id": 1, "state": CabState.MAINTENANCE, "timestamp": datetime(2025, 1, 20)}])
+    db.commit()
+
+    HistoryPartitions.compact(db, now=NOW)
+    archived = HistoryPartitions.archive(db, archive_dir=str(tmp_path), hot_months=3, now=NOW)
+
+    assert archived == {"cab_history_p202501": 3}
+    with patch("app.config.config.HISTORY_ARCHIVE_DIR", str(tmp_path)):
+        entries = HistoryPartitions.read(db, 1, until=datetime(2025, 2, 1))
+    assert [entry.state for entry in entries] == [CabState.IDLE, CabState.MAINTENANCE]
+
+
+def test_archive_index_points_reads_at_the_cab_member(db, tmp_path):
+    """Test an archive is split into indexed gzip members and a cab's reads start at its member."""
+    HistoryPartitions.compact(db, now=NOW)
+    with patch("app.config.config.HISTORY_ARCHIVE_INDEX_ROWS", 1):
+        HistoryPartitions.archive(db, archive_dir=str(tmp_path), hot_months=3, now=NOW)
+    path = str(tmp_path / "cab_history_p202501.ndjson.gz")
+
+    assert HistoryPartitions._archive_offset(path, 1) == 0
+    assert HistoryPartitions._archive_offset(path, 2) > 0
+    assert [record["cab_id"] for record in HistoryPartitions._read_records(path)] == [1, 2]
+    assert [entry.state for entry in HistoryPartitions._read_archive(path, 2, None, None)] == [CabState.ON_TRIP]
+
+    with patch("app.config.config.HISTORY_ARCHIVE_DIR", str(tmp_path)):
+        last = HistoryPartitions.read_last_before(db, 2, datetime(2025, 3, 1))
+    assert (last.cab_id, last.state) == (2, CabState.ON_TRIP)
+
+
+def test_history_pages_merge_partitions_lazily(db, tmp_path):
+    """Test partitioned history pages push the cursor into every month and only open older months when needed."""
+    HistoryPartitions.compact(db, now=NOW)
+    HistoryPartitions.archive(db, archive_dir=str(tmp_path), hot_months=3, now=NOW)
+
+    with patch("app.config.config.HISTORY_PARTITIONING", True), \
+            patch("app.config.config.HISTORY_ARCHIVE_DIR", str(tmp_path)), \
+            patch.object(HistoryPartitions, "_read_archive", wraps=HistoryPartitions._read_archive) as read_archive:
+        first = CabRepository.get_cab_history_page(db, 1, limit=2)
+        assert not read_archive.called
+
+        last = first[-1]
+        rest = CabRepository.get_cab_history_page(db, 1, after=(last.timestamp, last.id), limit=2)
+        streamed = list(CabRepository.stream_cab_history(db, 1, since=datetime(2025, 5, 1)))
+
+    assert [entry.timestamp.month for entry in first] == [6, 5]
+    assert [entry.timestamp.month for entry in rest] == [1]
+    assert read_archive.call_count == 1
+    assert [entry.timestamp.month for entry in streamed] == [6, 5]
@@ -0,0 +1,159 @@
+import json
+import threading
+import time
+from unittest.mock import MagicMock, patch
+from datetime import datetime
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError, OperationalError
+from app.main import app
+from app.repositories.history_writer import HistoryWriter
+from app.state_machine import CabState
+
+client = TestClient(app)
+
+
+def make_writer(db):
+    session_factory = MagicMock()
+    session_factory.return_value.__enter__.return_value = db
+    return HistoryWriter(session_factory=session_factory, max_size=100, flush_size=50, flush_interval_ms=10000)
+
+
+@patch("app.repositories.history_writer.StateIntervals.record")
+def test_flush_inserts_buffered_rows_in_one_statement(mock_record):
+    """Test buffered transitions are written with a single bulk insert, state intervals included."""
+    db = MagicMock()
+    writer = make_writer(db)
+    now = datetime.utcnow()
+    writer.enqueue(1, CabState.ON_TRIP, now)
+    writer.enqueue(2, CabState.IDLE, now)
+
+    assert writer.flush() == 2
+
+    db.execute.assert_called_once()
+    assert [row["cab_id"] for row in db.execute.call_args.args[1]] == [1, 2]
+    mock_record.assert_called_once_with(db, [(1, CabState.ON_TRIP, now), (2, CabState.IDLE, now)])
+    assert writer.metrics()["buffer_depth"] == 0
+    assert writer.metrics()["flushed_rows"] == 2
+    writer.close()
+
+
+def test_failed_flush_keeps_rows_for_retry():
+    """Test rows stay buffered, in order, when the bulk insert fails."""
+    db = MagicMock()
+    db.execute.side_effect = OperationalError("INSERT", params=None, orig=Exception("locked"))
+    writer = make_writer(db)
+    writer.enqueue(1, CabState.ON_TRIP, datetime.utcnow())
+
+    assert writer.flush() == 0
+
+    assert writer.metrics()["buffer_depth"] == 1
+    assert writer.metrics()["failed_flushes"] == 1
+    db.execute.side_effect = None
+    writer.close()
+
+
+@patch("app.repositories.history_writer.StateIntervals.record")
+def test_poison_rows_are_dead_lettered(mock_record, tmp_path):
+    """Test a permanent error is isolated row by row and only the failing row is dead-lettered."""
+    def execute(statement, rows):
+        if len(rows) == 1 and rows[0]["cab_id"] == 2:
+            raise IntegrityError("INSERT", params=None, orig=Exception("FOREIGN KEY constraint failed"))
+        if len(rows) > 1:
+            raise IntegrityError("INSERT", params=None, orig=Exception("FOREIGN KEY constraint failed"))
+
+    db = MagicMock()
+    db.execute.side_effect = execute
+    writer = make_writer(db)
+    writer.dead_letter_path = str(tmp_path / "dead.ndjson")
+    for cab_id in (1, 2, 3):
+        writer.enqueue(cab_id, CabState.IDLE, datetime(2025, 3, 1))
+
+    assert writer.flush() == 2
+
+    assert writer.metrics()["buffer_depth"] == 0
+    assert writer.metrics()["dead_lettered_rows"] == 1
+    dead = [json.loads(line) for line in open(writer.dead_letter_path)]
+    assert dead == [{"cab_id": 2, "state": "IDLE", "timestamp": "2025-03-01T00:00:00"}]
+    writer.close()
+
+
+def test_transient_failures_are_retried_a_bounded_number_of_times(tmp_path):
+    """Test rows failing on a transient error are retried max_retries times, then dead-lettered."""
+    db = MagicMock()
+    db.execute.side_effect = OperationalError("INSERT", params=None, orig=Exception("connection refused"))
+    writer = make_writer(db)
+    writer.max_retries = 1
+    writer.dead_letter_path = str(tmp_path / "dead.ndjson")
+    writer.enqueue(1, CabState.ON_TRIP, datetime.utcnow())
+
+    assert writer.flush() == 0
+    assert writer.metrics()["buffer_depth"] == 1
+    assert writer.flush() == 0
+
+    assert writer.metrics()["buffer_depth"] == 0
+    assert writer.metrics()["dead_lettered_rows"] == 1
+    writer.close()
+
+
+def test_rows_are_buffered_only_when_their_transaction_commits(db):
+    """Test rows of a rolled back savepoint or transaction never reach the buffer."""
+    writer = make_writer(MagicMock())
+    now = datetime.utcnow()
+
+    db.execute(text("SELECT 1"))
+    writer.enqueue_on_commit(db, [(1, CabState.ON_TRIP, now)])
+    with db.begin_nested():
+        writer.enqueue_on_commit(db, [(2, CabState.ON_TRIP, now)])
+    try:
+        with db.begin_nested():
+            writer.enqueue_on_commit(db, [(3, CabState.ON_TRIP, now)])
+            raise RuntimeError("city failed")
+    except RuntimeError:
+        pass
+    assert writer.metrics()["buffer_depth"] == 0
+    db.commit()
+    assert [row["cab_id"] for row in writer._buffer] == [1, 2]
+
+    db.execute(text("SELECT 1"))
+    writer.enqueue_on_commit(db, [(4, CabState.IDLE, now)])
+    db.rollback()
+    assert [row["cab_id"] for row in writer._buffer] == [1, 2]
+    writer._buffer.clear()
+    writer.close()
+
+
+@patch("app.repositories.history_writer.StateIntervals.record")
+def test_non_blocking_commit_hands_overflow_to_a_background_thread(mock_record, db):
+    """Test a commit with block=False returns while the buffer is full, and its rows are buffered in order later."""
+    flushed = MagicMock()
+    writer = make_writer(flushed)
+    writer.max_size = 2
+    now = datetime.utcnow()
+    writer.enqueue(1, CabState.ON_TRIP, now)
+    writer.enqueue(2, CabState.ON_TRIP, now)
+
+    db.execute(text("SELECT 1"))
+    writer.enqueue_on_commit(db, [(3, CabState.IDLE, now), (4, CabState.IDLE, now)], block=False)
+    committing = threading.Thread(target=db.commit)
+    committing.start()
+    committing.join(timeout=5)
+    assert not committing.is_alive()
+    writer.enqueue_nowait([(5, CabState.ON_TRIP, now)])
+    assert writer.metrics()["overflowing_handoffs"] == 2
+    assert [row["cab_id"] for row in writer._buffer] == [1, 2]
+
+    while writer.metrics()["overflowing_handoffs"] or writer._buffer:
+        writer.flush()
+        time.sleep(0.01)
+    written = [row["cab_id"] for call in flushed.execute.call_args_list for row in call.args[1]]
+    assert written == [1, 2, 3, 4, 5]
+    writer.close()
+
+
+def test_get_metrics():
+    """Test the metrics endpoint exposes the history writer counters."""
+    response = client.get("/metrics/")
+
+    assert response.status_code == 200
+    assert {"buffer_depth", "last_flush_ms", "max_flush_ms"} <= set(response.json()["history_writer"])
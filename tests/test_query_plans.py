@@ -0,0 +1,158 @@
+"""
+Query-plan regression tests for the hot repository queries.
+
+Every statement a hot repository method emits is captured and run through the database's
+EXPLAIN; the test fails when the plan falls back to a full table scan or an explicit sort,
+i.e. when a query no longer matches one of the indexes declared in `app.models`. Grouping
+(bounded by the number of groups) is allowed, and analytics queries may sort their computed
+results, but every table must still be reached through an index.
+
+SQLite (in-memory) always runs. Set ``TEST_POSTGRES_URL`` to also check PostgreSQL plans;
+that database is treated as scratch space (tables are created and dropped).
+"""
+import os
+import json
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+from app.database import Base
+from app.repositories.booking_repository import BookingRepository
+from app.repositories.cab_repository import CabRepository
+from app.repositories.city_repository import CityRepository
+from app.repositories.history_partitions import HistoryPartitions
+from app.repositories.state_intervals import StateIntervals
+from app.state_machine import CabState
+
+START = datetime(2025, 1, 1)
+END = START + timedelta(days=1)
+
+HOT_QUERIES = {
+    "get_available_cabs": lambda db: CabRepository.get_available_cabs(db, 1, limit=1),
+    "get_available_cabs_page": lambda db: CabRepository.get_available_cabs_page(db, 1, (START, 10), 100),
+    "stream_available_cabs": lambda db: list(CabRepository.stream_available_cabs(db, 1)),
+    "get_idle_cab_keys": lambda db: CabRepository.get_idle_cab_keys(db, 1),
+    "get_cab_snapshots": lambda db: CabRepository.get_cab_snapshots(db, [1, 2]),
+    "get_existing_plates": lambda db: CabRepository.get_existing_plates(db, ["KA-01", "KA-02"]),
+    "claim_cab": lambda db: CabRepository.claim_cab(db, 1, 1),
+    "claim_cabs": lambda db: CabRepository.claim_cabs(db, 1, [1, 2]),
+    "update_cab_state": lambda db: CabRepository.update_cab_state(db, 1, CabState.MAINTENANCE, expected_version=0),
+    "release_cabs": lambda db: CabRepository.release_cabs(db, [1, 2], START),
+    "update_cabs_at_version": lambda db: CabRepository.update_cabs_at_version(db, [
+        {"id": 1, "version": 0, "previous_state": CabState.IDLE, "state": CabState.MAINTENANCE,
+         "current_city_id": 2, "last_idle_time": None},
+    ]),
+    "get_cab_history": lambda db: CabRepository.get_cab_history(db, 1),
+    "get_cab_history_page": lambda db: CabRepository.get_cab_history_page(db, 1, START, END, (END, 10), 100),
+    "stream_cab_history": lambda db: list(CabRepository.stream_cab_history(db, 1, START, END)),
+    "read_latest_first": lambda db: list(HistoryPartitions.read_latest_first(db, 1, START, END, (END, 10), 100)),
+    "get_cities_page": lambda db: CityRepository.get_cities_page(db, 10, 100),
+    "get_idle_time": lambda db: CabRepository.get_idle_time(db, 1, START, END),
+    "record_state_intervals": lambda db: StateIntervals.record(db, [(1, CabState.IDLE, START), (2, CabState.ON_TRIP, END)]),
+    "get_booking_by_id": lambda db: BookingRepository.get_booking_by_id(db, 1),
+    "get_active_bookings": lambda db: BookingRepository.get_active_bookings(db, None, 10, 100),
+    "get_active_bookings_by_city": lambda db: BookingRepository.get_active_bookings(db, 1, 10, 100),
+    "complete_bookings": lambda db: BookingRepository.complete_bookings(db, [1, 2], END),
+    "analyze_peak_demand": lambda db: BookingRepository.analyze_peak_demand(db, 1),
+    "get_hourly_demand": lambda db: BookingRepository.get_hourly_demand(db, 1, START.date(), END.date()),
+    "get_hourly_demand_buckets": lambda db: BookingRepository.get_hourly_demand_buckets(db, 1, START.date(), END.date()),
+    "get_demand_slots": lambda db: BookingRepository.get_demand_slots(db, 1, START, END),
+    "get_weekly_demand": lambda db: BookingRepository.get_weekly_demand(db, START.date(), END.date()),
+}
+
+# Analytics queries: sorting derived rows (window partitions, computed totals) is expected
+ANALYTICS_QUERIES = {
+    "get_fleet_idle_times": lambda db: CabRepository.get_fleet_idle_times(db, 1, START, END, limit=10),
+    "get_recent_demand": lambda db: BookingRepository.get_recent_demand(db, START),
+    "states_at": lambda db: StateIntervals.states_at(db, 1, START),
+    "stream_changes": lambda db: list(StateIntervals.stream_changes(db, 1, START, END)),
+}
+
+
+def _engines():
+    engines = [pytest.param("sqlite://", id="sqlite")]
+    postgres_url = os.getenv("TEST_POSTGRES_URL")
+    engines.append(pytest.param(
+        postgres_url, id="postgresql",
+        marks=pytest.mark.skipif(not postgres_url, reason="TEST_POSTGRES_URL is not set"),
+    ))
+    return engines
+
+
+@pytest.fixture(scope="module", params=_engines())
+def engine(request):
+    engine = create_engine(request.param)
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    if engine.dialect.name == "postgresql":
+        Base.metadata.drop_all(bind=engine)
+    engine.dispose()
+
+
+def capture_statements(engine, run) -> list[tuple]:
+    """Runs ``run(db)`` in a rolled back session and returns the SELECT/UPDATE/DELETE (and WITH) statements it emitted."""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE", "WITH")):
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        with Session(engine) as db:
+            run(db)
+            db.rollback()
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    return statements
+
+
+def plan_problems(engine, statement: str, parameters, allow_sort: bool = False) -> list[str]:
+    """Returns the plan steps that scan a whole table or (unless allowed) sort rows outside an index."""
+    with engine.connect() as conn:
+        if engine.dialect.name == "sqlite":
+            rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+            problems = []
+            for *_, detail in rows:
+                words = detail.split()
+                if words[0] == "SCAN" and words[1] in Base.metadata.tables:
+                    problems.append(detail)
+                elif "USE TEMP B-TREE" in detail and "GROUP BY" not in detail and not allow_sort:
+                    problems.append(detail)
+            return problems
+
+        # Tables are tiny here, so make the planner prove an index path exists
+        conn.exec_driver_sql("SET enable_seqscan = off")
+        conn.exec_driver_sql("SET enable_sort = off")
+        plan = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        problems, nodes = [], [plan[0]["Plan"]]
+        while nodes:
+            node = nodes.pop()
+            if node["Node Type"] == "Seq Scan" or (node["Node Type"] == "Sort" and not allow_sort):
+                problems.append(f"{node['Node Type']} on {node.get('Relation Name', 'subquery')}")
+            nodes.extend(node.get("Plans", []))
+        return problems
+
+
+@pytest.mark.parametrize("name", HOT_QUERIES)
+def test_hot_query_uses_an_index(engine, name):
+    """Test every statement of a hot repository query is served by an index without extra sorting."""
+    statements = capture_statements(engine, HOT_QUERIES[name])
+    assert statements, f"{name} emitted no statements"
+
+    for statement, parameters in statements:
+        problems = plan_problems(engine, statement, parameters)
+        assert not problems, f"{name}: {problems}\n{statement}"
+
+
+@pytest.mark.parametrize("name", ANALYTICS_QUERIES)
+def test_analytics_query_reads_tables_through_indexes(engine, name):
+    """Test analytics queries never scan a whole table."""
+    statements = capture_statements(engine, ANALYTICS_QUERIES[name])
+    assert statements, f"{name} emitted no statements"
+
+    for statement, parameters in statements:
+        problems = plan_problems(engine, statement, parameters, allow_sort=True)
+        assert not problems, f"{name}: {problems}\n{statement}"
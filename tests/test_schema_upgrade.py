@@ -0,0 +1,30 @@
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+from app.models import Cab
+from app.repositories.schema_upgrade import SchemaUpgrade
+
+
+def test_upgrade_adds_missing_columns_and_indexes_once():
+    """Test a database created before cabs.version and the composite indexes is upgraded in place."""
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    with engine.begin() as conn:
+        # The cabs and bookings tables as the first release created them
+        conn.exec_driver_sql(
+            "CREATE TABLE cabs (id INTEGER PRIMARY KEY, plate_number VARCHAR NOT NULL UNIQUE, "
+            "current_city_id INTEGER, state VARCHAR(11), last_idle_time DATETIME)"
+        )
+        conn.exec_driver_sql(
+            "CREATE TABLE bookings (id INTEGER PRIMARY KEY, cab_id INTEGER NOT NULL, city_id INTEGER NOT NULL, "
+            "pickup_time DATETIME, drop_time DATETIME, created_at DATETIME)"
+        )
+        conn.exec_driver_sql("INSERT INTO cabs (id, plate_number, state) VALUES (1, 'KA-01', 'IDLE')")
+
+    applied = SchemaUpgrade.upgrade(engine)
+
+    assert "column cabs.version" in applied
+    assert {"index ix_cabs_dispatch", "index ix_bookings_active_id", "index ix_bookings_city_id_pickup_time"} <= set(applied)
+    assert "cab_history" not in inspect(engine).get_table_names()  # Missing tables are left to create_all
+    with Session(engine) as db:
+        assert db.get(Cab, 1).version == 0
+    assert SchemaUpgrade.upgrade(engine) == []
@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import insert, select
+from app.models import Cab, CabHistory, CabStateInterval
+from app.repositories.cab_repository import CabRepository
+from app.repositories.state_intervals import StateIntervals
+from app.services.analytics_service import AnalyticsService
+from app.state_machine import CabState
+
+T0 = datetime(2025, 3, 1, 8)
+
+
+@pytest.fixture
+def db(db):
+    db.execute(insert(Cab), [
+        {"id": 1, "plate_number": "KA-01", "current_city_id": 1},
+        {"id": 2, "plate_number": "KA-02", "current_city_id": 1},
+    ])
+    return db
+
+
+def log(db, transitions):
+    """Writes transitions the way the repositories do: history rows plus their intervals."""
+    CabRepository.create_cab_histories(db, transitions)
+    db.commit()
+
+
+def intervals(db):
+    return db.execute(
+        select(CabStateInterval.cab_id, CabStateInterval.start, CabStateInterval.end,
+               CabStateInterval.state, CabStateInterval.cumulative_idle_before)
+        .order_by(CabStateInterval.cab_id, CabStateInterval.start)
+    ).all()
+
+
+def test_transitions_close_the_open_interval_and_carry_idle_seconds(db):
+    """Test each transition closes the open interval and the next one starts with the idle total so far."""
+    log(db, [(1, CabState.IDLE, T0)])
+    log(db, [(1, CabState.ON_TRIP, T0 + timedelta(hours=1)), (1, CabState.IDLE, T0 + timedelta(hours=3))])
+    log(db, [(1, CabState.IDLE, T0 + timedelta(hours=4))])  # Repeated state: no new interval
+
+    assert intervals(db) == [
+        (1, T0, T0 + timedelta(hours=1), CabState.IDLE, 0.0),
+        (1, T0 + timedelta(hours=1), T0 + timedelta(hours=3), CabState.ON_TRIP, 3600.0),
+        (1, T0 + timedelta(hours=3), None, CabState.IDLE, 3600.0),
+    ]
+
+
+def test_idle_time_matches_history_and_rebuild(db):
+    """Test idle time from two interval lookups, per cab and fleet-wide, and that a rebuild is identical."""
+    log(db, [(1, CabState.IDLE, T0), (2, CabState.ON_TRIP, T0)])
+    log(db, [(1, CabState.ON_TRIP, T0 + timedelta(hours=2)), (2, CabState.IDLE, T0 + timedelta(hours=1))])
+    log(db, [(1, CabState.IDLE, T0 + timedelta(hours=5))])
+
+    start, end = T0 + timedelta(hours=1), T0 + timedelta(hours=6)
+    # Cab 1: idle 1h-2h and 5h-6h; cab 2: idle from 1h on
+    assert CabRepository.get_idle_time(db, 1, start, end) == timedelta(hours=2)
+    assert CabRepository.get_idle_time(db, 2, start, end) == timedelta(hours=5)
+    assert CabRepository.get_fleet_idle_times(db, 1, start, end) == [(2, 18000.0), (1, 7200.0)]
+    assert CabRepository.get_idle_time(db, 1, T0 - timedelta(days=1), T0) == timedelta()
+
+    written = intervals(db)
+    assert StateIntervals.rebuild(db) == len(written)
+    assert intervals(db) == written
+    assert db.query(CabHistory).count() == 5
+
+
+def test_utilization_sweep_counts_cabs_per_state_and_bucket(db):
+    """Test the sweep averages the cabs in each state over every bucket, including partial stretches."""
+    log(db, [(1, CabState.IDLE, T0), (2, CabState.ON_TRIP, T0)])
+    log(db, [(1, CabState.ON_TRIP, T0 + timedelta(minutes=90)), (2, CabState.IDLE, T0 + timedelta(hours=2))])
+    log(db, [(2, CabState.MAINTENANCE, T0 + timedelta(minutes=150))])
+
+    series = AnalyticsService.get_utilization(db, 1, T0 + timedelta(hours=1), T0 + timedelta(minutes=200), 3600)
+
+    assert series.states == [CabState.IDLE, CabState.ON_TRIP, CabState.MAINTENANCE]
+    assert series.counts == [
+        [0.5, 1.5, 0.0],  # 1h-2h: cab 1 idle for half of it, cab 2 on a trip
+        [0.5, 1.0, 0.5],  # 2h-3h: cab 1 on a trip, cab 2 idle until 2:30 then in maintenance
+        [0.0, 1.0, 1.0],  # 3h-3:20 (partial bucket)
+    ]
@@ -0,0 +1,16 @@
+from app.state_machine import ALLOWED_SOURCES, CabState, can_transition
+
+
+def test_allowed_sources_compiled_from_transitions():
+    """Test the compiled table lists every state a target can be reached from."""
+    assert set(ALLOWED_SOURCES[CabState.ON_TRIP]) == {CabState.IDLE}
+    assert set(ALLOWED_SOURCES[CabState.IDLE]) == {CabState.ON_TRIP, CabState.MAINTENANCE}
+    assert set(ALLOWED_SOURCES[CabState.MAINTENANCE]) == {CabState.IDLE}
+
+
+def test_can_transition():
+    """Test valid and invalid transitions, including plain string states."""
+    assert can_transition(CabState.IDLE, CabState.ON_TRIP)
+    assert can_transition("ON_TRIP", CabState.IDLE)
+    assert not can_transition(CabState.MAINTENANCE, CabState.ON_TRIP)
+    assert not can_transition(CabState.IDLE, CabState.IDLE)
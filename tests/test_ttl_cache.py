@@ -0,0 +1,41 @@
+from unittest.mock import patch
+from app.utils.ttl_cache import TTLCache
+
+
+def test_lru_eviction_and_ttl_expiry():
+    """Test the least recently used entry is evicted at capacity and entries expire after the TTL."""
+    cache = TTLCache(max_size=2, ttl_seconds=30)
+    with patch("app.utils.ttl_cache.time.monotonic", return_value=100.0) as clock:
+        cache.get_or_compute("a", [], lambda: 1)
+        cache.get_or_compute("b", [], lambda: 2)
+        assert cache.get_or_compute("a", [], lambda: None) == 1  # "a" is now the most recent
+        cache.get_or_compute("c", [], lambda: 3)  # Evicts "b"
+
+        assert cache.get_or_compute("b", [], lambda: "recomputed") == "recomputed"
+
+        clock.return_value = 131.0
+        assert cache.get_or_compute("c", [], lambda: "fresh") == "fresh"
+
+    assert cache.metrics() | {"size": 2} == {
+        "size": 2, "capacity": 2, "ttl_seconds": 30, "hits": 1, "misses": 5, "hit_ratio": 0.167,
+        "evictions": 2, "expirations": 1, "invalidations": 0,
+    }
+
+
+def test_invalidate_by_tag_and_during_compute():
+    """Test invalidation drops tagged entries and a value computed across an invalidation is not stored."""
+    cache = TTLCache()
+    cache.get_or_compute("city-1", [("city", 1)], lambda: 1)
+    cache.get_or_compute("fleet", [("city", 2)], lambda: [7, 8], result_tags=lambda cabs: [("cab", cab) for cab in cabs])
+
+    cache.invalidate(("cab", 8))
+    assert cache.get_or_compute("fleet", [("city", 2)], lambda: "recomputed") == "recomputed"
+    assert cache.get_or_compute("city-1", [("city", 1)], lambda: None) == 1
+
+    def racing_compute():
+        cache.invalidate(("city", 3))  # A write commits while the query runs
+        return "stale"
+
+    assert cache.get_or_compute("city-3", [("city", 3)], racing_compute) == "stale"
+    assert cache.get_or_compute("city-3", [("city", 3)], lambda: "fresh") == "fresh"
+    assert cache.metrics()["invalidations"] == 1